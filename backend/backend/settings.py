@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 
 
@@ -125,6 +127,45 @@ ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "*").split(",")
 # backend/backend/settings.py
 CORS_ALLOW_ALL_ORIGINS = True  # dev only; tighten later
 
+# Cache
+# Versioned analytics caching relies on every worker seeing the same version
+# counters, so more than one worker (gunicorn's WEB_CONCURRENCY) requires
+# REDIS_URL to point at a shared Redis instance. The local-memory fallback
+# is per process and is only allowed with a single worker.
+REDIS_URL = os.getenv("REDIS_URL")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+if not REDIS_URL and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        f"REDIS_URL must be set when running {WEB_CONCURRENCY} workers (WEB_CONCURRENCY): "
+        "cache version counters have to be shared between them"
+    )
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_TIMEOUT", str(60 * 60)))
+
+# Leaderboard snapshots older than this (seconds) are ignored in favour of live ranking.
+# Schedule refresh_leaderboards more often than this.
+LEADERBOARD_SNAPSHOT_MAX_AGE = int(os.getenv("LEADERBOARD_SNAPSHOT_MAX_AGE", str(60 * 60)))
+
+# Keep every leaderboard in process memory (see core.leaderboard_memory).
+# Costs memory per worker proportional to users x boards, so it is opt-in.
+LEADERBOARD_IN_MEMORY = os.getenv("LEADERBOARD_IN_MEMORY", "False") == "True"
+LEADERBOARD_MEMORY_MAX_AGE = int(os.getenv("LEADERBOARD_MEMORY_MAX_AGE", str(5 * 60)))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
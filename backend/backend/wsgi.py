@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Start loading the in-memory leaderboards (no-op unless LEADERBOARD_IN_MEMORY)
+from core.leaderboard_memory import leaderboard_memory  # noqa: E402
+
+leaderboard_memory.warm_in_background()
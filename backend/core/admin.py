@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
-from .models import Budget, Spending
+from .models import Budget, Spending, Transaction
 
 User = get_user_model()
 
@@ -20,6 +20,15 @@ class BudgetAdmin(admin.ModelAdmin):
 
 @admin.register(Spending)
 class SpendingAdmin(admin.ModelAdmin):
+    # Edits and deletes here go by id alone, which probes every date partition
+    # (see benchmark_spending_indexes); app code filters by id and date
     list_display = ("user", "category", "amount")
     list_filter = ("category",)
     search_fields = ("user__username",)
+
+
+@admin.register(Transaction)
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = ("user", "date", "merchant", "category", "amount", "source")
+    list_filter = ("category", "source")
+    search_fields = ("user__username", "merchant")
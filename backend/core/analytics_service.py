@@ -1,39 +1,631 @@
-from django.db.models import Avg
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import Mod, TruncMonth
+from django.utils import timezone
+from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal
-from .models import Spending, Budget, User, Category
+from .models import (
+    Spending, Budget, User, Category, PeerCategoryStats, CohortType, CohortCategoryStats, SpendingSketch,
+    CategoryInsight, MonthlySpending, DetachedSpendingMonth, normalize_cohort_value,
+)
+from .quantile_sketch import QuantileSketch
+from .cache_service import CacheService
 
 
 class AnalyticsService:
     """Service for computing analytics and peer comparisons."""
     
+    # (exclusive upper age, label) pairs; anyone older falls in "55+"
+    AGE_BANDS = [
+        (18, "under-18"),
+        (25, "18-24"),
+        (35, "25-34"),
+        (45, "35-44"),
+        (55, "45-54"),
+    ]
+    
+    # Rows each rollup (category, month or cohort) is split over, picked by user id
+    ROLLUP_SHARDS = 16
+    
+    # Windows for get_windowed_peer_averages
+    WINDOW_MONTH = "month"    # Current calendar month to date
+    WINDOW_MONTHS = "months"  # Last N calendar months, including the current one
+    WINDOW_30D = "30d"        # Rolling 30 days ending today
+    WINDOWS = [WINDOW_MONTH, WINDOW_MONTHS, WINDOW_30D]
+    
+    # Category insights compare this month's total with the mean monthly total
+    # of other users over this many calendar months (live and batch alike)
+    INSIGHT_PEER_MONTHS = 1
+    
     @staticmethod
     def get_peer_averages(exclude_user_id=None) -> dict:
         """
         Calculate average spending per category across all users.
         
+        Population sums and row counts are read from the all-time
+        PeerCategoryStats rollup (ROLLUP_SHARDS rows per category). The "everyone but me"
+        average is derived by subtracting the excluded user's own share, so the
+        cost does not grow with the number of users or Spending rows.
+        
+        Args:
+            exclude_user_id: Optional user ID to exclude (for comparing against others)
+            
+        Returns:
+            Dict like {'rent': 500.00, 'groceries': 150.00, ...}
+        """
+        own = AnalyticsService._user_category_totals(exclude_user_id) if exclude_user_id else {}
+        
+        return AnalyticsService._leave_one_out_averages(AnalyticsService.get_peer_category_totals(), own)
+    
+    @staticmethod
+    def get_peer_category_totals() -> dict:
+        """
+        All-time population sum and row count per category, summed over the
+        PeerCategoryStats shards.
+        
+        Returns:
+            Dict like {'rent': (Decimal('150000.00'), 300), ...}
+        """
+        return AnalyticsService._summed_shards(PeerCategoryStats.objects.filter(month__isnull=True))
+    
+    @staticmethod
+    def get_windowed_peer_averages(window=WINDOW_MONTH, months=3, exclude_user_id=None) -> dict:
+        """
+        Average per-user spending per category over a time window.
+        
+        Averages are taken over per-user monthly totals (MonthlySpending) or,
+        for the rolling window, over Spending rows summed per user, so the
+        result does not depend on how many daily rows a user's spending is
+        split into. Either way the range filter touches only the window.
+        
         Args:
+            window: One of WINDOWS
+            months: Number of calendar months for WINDOW_MONTHS
             exclude_user_id: Optional user ID to exclude (for comparing against others)
             
         Returns:
             Dict like {'rent': 500.00, 'groceries': 150.00, ...}
         """
-        queryset = Spending.objects.all()
+        today = timezone.now().date()
+        month_start = today.replace(day=1)
         
+        if window == AnalyticsService.WINDOW_MONTH:
+            start_date = month_start
+        elif window == AnalyticsService.WINDOW_MONTHS:
+            start_date = month_start
+            for _ in range(max(months, 1) - 1):
+                start_date = (start_date - timedelta(days=1)).replace(day=1)
+        elif window == AnalyticsService.WINDOW_30D:
+            start_date = today - timedelta(days=29)
+        else:
+            raise ValueError(f"Unknown window: {window}")
+        
+        if window == AnalyticsService.WINDOW_30D:
+            per_user = Spending.objects.filter(category__in=Category.values, date__gte=start_date, date__lte=today)
+            per_user = per_user.values('category', 'user_id').annotate(total=Sum('amount')).order_by()
+        else:
+            # A month the user has no Spending rows in does not count, as when summing rows
+            per_user = MonthlySpending.objects.filter(
+                category__in=Category.values, month__gte=start_date, row_count__gt=0,
+            ).annotate(total=F('amount'))
         if exclude_user_id:
-            queryset = queryset.exclude(user_id=exclude_user_id)
+            per_user = per_user.exclude(user_id=exclude_user_id)
         
-        averages = {}
+        # Averaging over the grouped rows runs as a single query with a subquery
+        averages = per_user.aggregate(**{
+            category_key: Avg('total', filter=Q(category=category_key))
+            for category_key in Category.values
+        })
         
-        for category_key, category_label in Category.choices:
-            avg = queryset.filter(category=category_key).aggregate(
-                avg_amount=Avg('amount')
-            )['avg_amount']
+        # Default to 0 if no data
+        return {category_key: float(avg or 0) for category_key, avg in averages.items()}
+    
+    @staticmethod
+    def get_insight_peer_averages(exclude_user_id=None) -> dict:
+        """
+        Peer averages for the default category insights: the mean monthly
+        total of other users over the last INSIGHT_PEER_MONTHS months, the
+        number the nightly batch (BatchAnalyticsService) stores too.
+        """
+        return AnalyticsService.get_windowed_peer_averages(
+            window=AnalyticsService.WINDOW_MONTHS,
+            months=AnalyticsService.INSIGHT_PEER_MONTHS,
+            exclude_user_id=exclude_user_id,
+        )
+    
+    @staticmethod
+    def get_month_spending(user, month=None) -> dict:
+        """
+        The user's total per category for a month (default: the current one),
+        from MonthlySpending.
+        
+        Returns:
+            Dict like {'groceries': 200.00, ...}; categories without rows are left out
+        """
+        month = month or timezone.now().date().replace(day=1)
+        return {
+            category: float(amount)
+            for category, amount in MonthlySpending.objects.filter(
+                user=user, month=month, row_count__gt=0,
+            ).values_list('category', 'amount')
+        }
+    
+    @staticmethod
+    def get_cohort_peer_averages(user, cohort_type):
+        """
+        Calculate average spending per category across the other members of
+        the user's cohort (same university, city or age band).
+        
+        The cohort aggregates are precomputed in CohortCategoryStats, so this is
+        one indexed lookup on (cohort_type, cohort_key) plus the user's own totals.
+        
+        Returns:
+            Dict like {'rent': 500.00, 'groceries': 150.00, ...}, or None if the
+            user has no value for that cohort (e.g. no university on the profile)
+        """
+        cohort_key = AnalyticsService.get_cohort_keys(user).get(cohort_type)
+        if cohort_key is None:
+            return None
+        
+        return AnalyticsService._leave_one_out_averages(
+            AnalyticsService._summed_shards(
+                CohortCategoryStats.objects.filter(cohort_type=cohort_type, cohort_key=cohort_key)
+            ),
+            AnalyticsService._user_category_totals(user.id),
+        )
+    
+    @staticmethod
+    def get_cohort_keys(user) -> dict:
+        """
+        Cohorts a user belongs to.
+        
+        Returns:
+            Dict like {'university': 'ntua', 'city': 'athens', 'age_band': '18-24'},
+            without the cohorts the profile has no value for
+        """
+        keys = {}
+        university = normalize_cohort_value(user.university)
+        if university:
+            keys[CohortType.UNIVERSITY] = university
+        city = normalize_cohort_value(user.city)
+        if city:
+            keys[CohortType.CITY] = city
+        age_band = AnalyticsService._age_band(user.age)
+        if age_band:
+            keys[CohortType.AGE_BAND] = age_band
+        return keys
+    
+    @staticmethod
+    def _age_band(age):
+        if age is None:
+            return None
+        for upper, label in AnalyticsService.AGE_BANDS:
+            if age < upper:
+                return label
+        return "55+"
+    
+    @staticmethod
+    def _summed_shards(stats_rows) -> dict:
+        """
+        Sum a PeerCategoryStats or CohortCategoryStats queryset over its shards.
+        
+        Returns:
+            Dict of category -> (total, row_count)
+        """
+        grouped = stats_rows.values('category').annotate(sum_total=Sum('total'), rows=Sum('row_count')).order_by()
+        return {row['category']: (row['sum_total'] or Decimal('0'), row['rows'] or 0) for row in grouped}
+    
+    @staticmethod
+    def _leave_one_out_averages(population, own) -> dict:
+        """
+        Turn population totals ((total, row_count) per category, see
+        _summed_shards) into averages that leave out the user whose
+        per-category totals are given in `own`.
+        """
+        # Default to 0 if no data
+        averages = {category_key: 0.0 for category_key, _ in Category.choices}
+        
+        for category, (population_total, population_rows) in population.items():
+            own_total, own_rows = own.get(category, (Decimal('0'), 0))
+            total = population_total - own_total
+            rows = population_rows - own_rows
             
-            # Default to 0 if no data
-            averages[category_key] = float(avg or 0)
+            if category in averages and rows > 0:
+                averages[category] = float(total / rows)
         
         return averages
     
+    @staticmethod
+    def _user_category_totals(user_id) -> dict:
+        """
+        Sum and row count of a single user's spending per category, all time.
+        
+        Returns:
+            Dict like {'rent': (Decimal('1500.00'), 3), ...}
+        """
+        return AnalyticsService._users_category_totals([user_id])[user_id]
+    
+    @staticmethod
+    def _users_category_totals(user_ids) -> dict:
+        """
+        All-time sum and row count of each user's spending per category, the
+        users' share of the all-time rollups: their MonthlySpending rows (which
+        keep detached months) plus their Spending rows without a date.
+        
+        Returns:
+            Dict of user id -> {'rent': (Decimal('1500.00'), 3), ...}
+        """
+        totals = {user_id: {} for user_id in user_ids}
+        monthly = (
+            MonthlySpending.objects
+            .filter(user_id__in=user_ids)
+            .values('user_id', 'category')
+            .annotate(total=Sum('amount'), rows=Sum('row_count'))
+            .order_by()
+        )
+        undated = (
+            Spending.objects
+            .filter(user_id__in=user_ids, date__isnull=True)
+            .values('user_id', 'category')
+            .annotate(total=Sum('amount'), rows=Count('id'))
+            .order_by()
+        )
+        for row in [*monthly, *undated]:
+            total, rows = totals[row['user_id']].get(row['category'], (Decimal('0'), 0))
+            totals[row['user_id']][row['category']] = (total + (row['total'] or 0), rows + (row['rows'] or 0))
+        return totals
+    
+    @staticmethod
+    def record_spending_change(user, category, date, old_amount=None, new_amount=None):
+        """
+        Apply a single Spending row change to the PeerCategoryStats,
+        CohortCategoryStats and MonthlySpending rollups and the month's sketch.
+        
+        Pass old_amount=None for a newly created row and new_amount=None for a
+        deleted one. Must run inside the transaction that wrote the row.
+        """
+        AnalyticsService.record_spending_changes(user, [(category, date, old_amount, new_amount)])
+    
+    @staticmethod
+    def record_spending_changes(user, changes):
+        """
+        Bulk form of record_spending_change for many of one user's rows: the
+        deltas are summed per rollup row first, so each rollup row (and each
+        month's sketch) is updated once however many rows changed.
+        
+        Args:
+            changes: (category, date, old_amount, new_amount) per Spending row,
+                with the same None conventions as record_spending_change
+        
+        Must run inside the transaction that wrote the rows.
+        """
+        shard = AnalyticsService.rollup_shard(user.id)
+        cohort_keys = AnalyticsService.get_cohort_keys(user).items()
+        deltas = defaultdict(lambda: [Decimal('0'), 0, Decimal('0')])  # rollup key -> total, rows, squares
+        monthly_deltas = defaultdict(lambda: [Decimal('0'), 0, Decimal('0')])  # (category, month) -> amount, rows, squares
+        for category, date, old_amount, new_amount in changes:
+            rows = (new_amount is not None) - (old_amount is not None)
+            old = Decimal(old_amount or 0)
+            new = Decimal(new_amount or 0)
+            keys = [('peer', category, None, shard)]
+            if date is not None:
+                keys.append(('peer', category, date.replace(day=1), shard))
+            keys += [('cohort', category, cohort_type, cohort_key, shard) for cohort_type, cohort_key in cohort_keys]
+            for key in keys:
+                delta = deltas[key]
+                delta[0] += new - old
+                delta[1] += rows
+                delta[2] += new * new - old * old
+            if date is not None:
+                delta = monthly_deltas[(category, date.replace(day=1))]
+                delta[0] += new - old
+                delta[1] += rows
+                delta[2] += new * new - old * old
+        
+        AnalyticsService._write_rollup_deltas(deltas)
+        
+        monthly_deltas = {key: delta for key, delta in monthly_deltas.items() if any(delta)}
+        month_totals = AnalyticsService._update_monthly_spending(
+            [(user.id, category, month, *delta) for (category, month), delta in monthly_deltas.items()]
+        )
+        for (category, month), (amount, _, _) in sorted(monthly_deltas.items()):
+            if amount:
+                month_total = month_totals[(user.id, category, month)]
+                AnalyticsService._update_spending_sketch(category, month, shard, month_total - amount, month_total)
+    
+    @staticmethod
+    def record_empty_rows_created(rows, month):
+        """
+        Bulk form of record_spending_change(user, category, month, None, 0)
+        for zero-amount Spending rows inserted on the 1st of `month`: only row
+        counts move, with one update per rollup row touched and one upsert
+        for all the MonthlySpending rows.
+        
+        Args:
+            rows: (user, category) pairs of the inserted rows
+        
+        Must run inside the transaction that inserted the rows.
+        """
+        deltas = defaultdict(lambda: [Decimal('0'), 0, Decimal('0')])
+        for user, category in rows:
+            shard = AnalyticsService.rollup_shard(user.id)
+            keys = [('peer', category, None, shard), ('peer', category, month, shard)]
+            keys += [
+                ('cohort', category, cohort_type, cohort_key, shard)
+                for cohort_type, cohort_key in AnalyticsService.get_cohort_keys(user).items()
+            ]
+            for key in keys:
+                deltas[key][1] += 1
+        
+        AnalyticsService._write_rollup_deltas(deltas)
+        AnalyticsService._update_monthly_spending(
+            [(user.id, category, month, Decimal('0'), 1, Decimal('0')) for user, category in rows]
+        )
+    
+    @staticmethod
+    def rollup_shard(user_id) -> int:
+        """Shard of the rollup rows a user's spending is counted in."""
+        return user_id % AnalyticsService.ROLLUP_SHARDS
+    
+    @staticmethod
+    def _rollup_lock_order(key):
+        """
+        Sort key for rollup rows: by category, then the all-time rows, the
+        month rows and the cohort rows, then shard. Every writer locks rollup
+        rows in this order, so concurrent writers never deadlock on them.
+        """
+        if key[0] == 'peer':
+            _, category, month, shard = key
+            return (category, 0, '', '', shard) if month is None else (category, 1, month.isoformat(), '', shard)
+        _, category, cohort_type, cohort_key, shard = key
+        return (category, 2, cohort_type, cohort_key, shard)
+    
+    @staticmethod
+    def _write_rollup_deltas(deltas):
+        """
+        Add (total, row count, sum of squares) deltas to PeerCategoryStats
+        rows (('peer', category, month or None, shard) keys) and
+        CohortCategoryStats rows (('cohort', category, cohort_type, cohort_key,
+        shard) keys), one update per row, in _rollup_lock_order. Cached peer
+        comparisons of the categories changed are invalidated on commit.
+        """
+        now = timezone.now()
+        categories = set()
+        for key in sorted(deltas, key=AnalyticsService._rollup_lock_order):
+            total, rows, squares = deltas[key]
+            if not (total or rows or squares):
+                continue
+            categories.add(key[1] if key[0] == 'peer' else key[2])
+            update = {
+                'total': F('total') + total,
+                'row_count': F('row_count') + rows,
+                'sum_squares': F('sum_squares') + squares,
+                'updated_at': now,
+            }
+            if key[0] == 'peer':
+                _, category, month, shard = key
+                stats, _ = PeerCategoryStats.objects.get_or_create(category=category, month=month, shard=shard)
+                PeerCategoryStats.objects.filter(pk=stats.pk).update(**update)
+            else:
+                _, category, cohort_type, cohort_key, shard = key
+                stats, _ = CohortCategoryStats.objects.get_or_create(
+                    cohort_type=cohort_type, cohort_key=cohort_key, category=category, shard=shard
+                )
+                CohortCategoryStats.objects.filter(pk=stats.pk).update(**update)
+        if categories:
+            CacheService.bump_peers(categories)
+    
+    @staticmethod
+    def _update_monthly_spending(changes) -> dict:
+        """
+        Add (user_id, category, month, amount delta, row delta, sum of squares
+        delta) changes to MonthlySpending with one INSERT ... ON CONFLICT DO
+        UPDATE. Each
+        (user_id, category, month) may appear once.
+        
+        Returns:
+            Dict of (user_id, category, month) -> amount after the write
+        """
+        if not changes:
+            return {}
+        table = MonthlySpending._meta.db_table
+        params = []
+        # Sorted so concurrent writers lock rows in one order
+        for change in sorted(changes):
+            params += change
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, category, month, amount, row_count, sum_squares) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(changes))} "
+                f"ON CONFLICT (user_id, category, month) DO UPDATE SET "
+                f"amount = {table}.amount + EXCLUDED.amount, row_count = {table}.row_count + EXCLUDED.row_count, "
+                f"sum_squares = {table}.sum_squares + EXCLUDED.sum_squares "
+                f"RETURNING user_id, category, month, amount",
+                params,
+            )
+            return {(user_id, category, month): amount for user_id, category, month, amount in cursor.fetchall()}
+    
+    @staticmethod
+    def _update_spending_sketch(category, month, shard, old_total, new_total):
+        """Move a user's monthly category total from old_total to new_total within their shard of the month's sketch."""
+        SpendingSketch.objects.get_or_create(category=category, month=month, shard=shard)
+        row = SpendingSketch.objects.select_for_update().get(category=category, month=month, shard=shard)
+        sketch = QuantileSketch.from_json(row.sketch)
+        sketch.remove(old_total)
+        sketch.add(new_total)
+        row.sketch = sketch.to_json()
+        row.save(update_fields=['sketch', 'updated_at'])
+    
+    @staticmethod
+    @transaction.atomic
+    def rebuild_peer_stats() -> int:
+        """
+        Recompute MonthlySpending (see rebuild_monthly_spending), then the
+        PeerCategoryStats, CohortCategoryStats and SpendingSketch rollups from
+        it and the Spending rows without a date. Months whose partition was
+        detached keep counting through their MonthlySpending rows.
+        
+        Run this after bulk writes that bypass record_spending_change, or after
+        users' university, city or age change.
+        
+        Returns:
+            Number of rows written
+        """
+        written = AnalyticsService.rebuild_monthly_spending()
+        
+        shard = Mod('user_id', AnalyticsService.ROLLUP_SHARDS)
+        monthly = MonthlySpending.objects.annotate(shard=shard)
+        undated = Spending.objects.filter(date__isnull=True).annotate(shard=shard)
+        monthly_aggregates = {
+            'sum_total': Sum('amount'),
+            'rows': Sum('row_count'),
+            'squares': Sum('sum_squares'),
+        }
+        undated_aggregates = {
+            'sum_total': Sum('amount'),
+            'rows': Count('id'),
+            'squares': Sum(F('amount') * F('amount')),
+        }
+        
+        def grouped(*fields):
+            # Both sources grouped by `fields`, as (values, total, rows, sum of squares)
+            for source, aggregates in ((monthly, monthly_aggregates), (undated, undated_aggregates)):
+                for row in source.values(*fields).annotate(**aggregates).order_by().iterator(chunk_size=5000):
+                    yield row, row['sum_total'] or 0, row['rows'] or 0, row['squares'] or 0
+        
+        peers = {}
+        for row, total, rows, squares in grouped('category', 'shard'):
+            stats = peers.setdefault(
+                (row['category'], None, row['shard']),
+                PeerCategoryStats(category=row['category'], month=None, shard=row['shard']),
+            )
+            stats.total += total
+            stats.row_count += rows
+            stats.sum_squares += squares
+        for row in monthly.values('category', 'month', 'shard').annotate(**monthly_aggregates).order_by():
+            peers[(row['category'], row['month'], row['shard'])] = PeerCategoryStats(
+                category=row['category'], month=row['month'], shard=row['shard'],
+                total=row['sum_total'] or 0, row_count=row['rows'] or 0, sum_squares=row['squares'] or 0,
+            )
+        
+        # One grouped pass over every profile combination, folded into cohorts here
+        cohorts = {}
+        for row, total, rows, squares in grouped('user__university', 'user__city', 'user__age', 'category', 'shard'):
+            profile = User(university=row['user__university'], city=row['user__city'], age=row['user__age'])
+            for cohort_type, cohort_key in AnalyticsService.get_cohort_keys(profile).items():
+                stats = cohorts.setdefault(
+                    (cohort_type, cohort_key, row['category'], row['shard']),
+                    CohortCategoryStats(
+                        cohort_type=cohort_type, cohort_key=cohort_key, category=row['category'], shard=row['shard']
+                    ),
+                )
+                stats.total += total
+                stats.row_count += rows
+                stats.sum_squares += squares
+        
+        PeerCategoryStats.objects.all().delete()
+        CohortCategoryStats.objects.all().delete()
+        written += len(PeerCategoryStats.objects.bulk_create(peers.values()))
+        written += len(CohortCategoryStats.objects.bulk_create(cohorts.values()))
+        CacheService.bump_peers()
+        return written + AnalyticsService.rebuild_spending_sketches()
+    
+    @staticmethod
+    @transaction.atomic
+    def rebuild_monthly_spending() -> int:
+        """
+        Recompute the MonthlySpending rows of every month still in Spending in
+        one grouped pass. Rows of detached months (DetachedSpendingMonth) are
+        kept: their Spending rows are gone.
+        
+        Returns:
+            Number of rows written
+        """
+        detached = DetachedSpendingMonth.objects.values('month')
+        monthly = (
+            Spending.objects
+            .filter(date__isnull=False)
+            .annotate(month=TruncMonth('date'))
+            .exclude(month__in=detached)
+            .values('user_id', 'category', 'month')
+            .annotate(total=Sum('amount'), rows=Count('id'), squares=Sum(F('amount') * F('amount')))
+            .order_by()
+        )
+        
+        MonthlySpending.objects.exclude(month__in=detached).delete()
+        written = 0
+        batch = []
+        for row in monthly.iterator(chunk_size=5000):
+            batch.append(MonthlySpending(
+                user_id=row['user_id'], category=row['category'], month=row['month'],
+                amount=row['total'] or 0, row_count=row['rows'], sum_squares=row['squares'] or 0,
+            ))
+            if len(batch) >= 5000:
+                written += len(MonthlySpending.objects.bulk_create(batch))
+                batch = []
+        written += len(MonthlySpending.objects.bulk_create(batch))
+        return written
+    
+    @staticmethod
+    @transaction.atomic
+    def rebuild_spending_sketches() -> int:
+        """
+        Rebuild every SpendingSketch in one pass over MonthlySpending.
+        
+        Returns:
+            Number of sketches written
+        """
+        sketches = {}
+        for user_id, category, month, amount in (
+            MonthlySpending.objects.values_list('user_id', 'category', 'month', 'amount').iterator(chunk_size=5000)
+        ):
+            key = (category, month, AnalyticsService.rollup_shard(user_id))
+            sketches.setdefault(key, QuantileSketch()).add(amount)
+        
+        SpendingSketch.objects.all().delete()
+        created = SpendingSketch.objects.bulk_create(
+            SpendingSketch(category=category, month=month, shard=shard, sketch=sketch.to_json())
+            for (category, month, shard), sketch in sketches.items()
+        )
+        return len(created)
+    
+    @staticmethod
+    def get_spending_percentiles(user, month=None) -> dict:
+        """
+        Where the user's monthly total in each category sits among other users,
+        read from the month's quantile sketches.
+        
+        Returns:
+            Dict like {'groceries': 80, ...}: the percentage of other users who
+            spent the same or less. Categories without spending are left out.
+        """
+        month = month or timezone.now().date().replace(day=1)
+        
+        user_totals = MonthlySpending.objects.filter(user=user, month=month).values('category', total=F('amount'))
+        sketches = {}
+        for row in SpendingSketch.objects.filter(month=month):
+            shard_sketch = QuantileSketch.from_json(row.sketch)
+            if row.category in sketches:
+                sketches[row.category].merge(shard_sketch)
+            else:
+                sketches[row.category] = shard_sketch
+        
+        percentiles = {}
+        for row in user_totals:
+            sketch = sketches.get(row['category'])
+            if not sketch or not row['total'] or row['total'] <= 0:
+                continue
+            # The user's own total is in the sketch; leave it out of both counts
+            others = sketch.count - 1
+            if others <= 0:
+                continue
+            at_or_below = max(sketch.rank(row['total']) - 1, 0)
+            percentiles[row['category']] = round(100 * at_or_below / others)
+        
+        return percentiles
+    
     @staticmethod
     def get_user_financial_data(user) -> dict:
         """
@@ -64,31 +656,38 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def get_category_insights(user) -> list:
+    def get_category_insights(user, peer_averages=None) -> list:
         """
         Generate insights for each spending category.
         
+        Args:
+            peer_averages: Optional precomputed averages to compare against
+                (e.g. a cohort's); defaults to get_insight_peer_averages
+        
         Returns:
             List of dicts like:
             [
                 {
                     'category': 'groceries',
-                    'spending': 200.00,
+                    'spending': 200.00,            # this month so far
                     'budget': 150.00,
                     'peer_average': 180.00,
                     'budget_percentage': 133.33,  # 33% over budget
                     'peer_percentage': 111.11,     # 11% more than peers
+                    'percentile': 80,              # this month, vs other users (None if unknown)
                     'insight': 'You are 33% over budget and spending 11% more than peers'
                 },
                 ...
             ]
         """
         # Get user's spending and budgets
-        user_spending = {s.category: float(s.amount) for s in Spending.objects.filter(user=user)}
+        user_spending = AnalyticsService.get_month_spending(user)
         user_budgets = {b.category: float(b.amount) for b in Budget.objects.filter(user=user)}
         
         # Get peer averages
-        peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=user.id)
+        if peer_averages is None:
+            peer_averages = AnalyticsService.get_insight_peer_averages(exclude_user_id=user.id)
+        percentiles = AnalyticsService.get_spending_percentiles(user)
         
         insights = []
         
@@ -96,6 +695,7 @@ class AnalyticsService:
             spending = user_spending.get(category_key, 0)
             budget = user_budgets.get(category_key, 0)
             peer_avg = peer_averages.get(category_key, 0)
+            percentile = percentiles.get(category_key)
             
             # Skip if no spending in this category
             if spending == 0:
@@ -112,7 +712,8 @@ class AnalyticsService:
                 budget,
                 peer_avg,
                 budget_percentage,
-                peer_percentage
+                peer_percentage,
+                percentile
             )
             
             insights.append({
@@ -123,14 +724,51 @@ class AnalyticsService:
                 'peer_average': peer_avg,
                 'budget_percentage': budget_percentage,
                 'peer_percentage': peer_percentage,
+                'percentile': percentile,
                 'insight': insight_text
             })
         
         return insights
     
+    @staticmethod
+    def get_precomputed_category_insights(user):
+        """
+        Category insights written by the batch engine for the current month.
+        
+        Returns:
+            Same shape as get_category_insights, or None if the user has no
+            up-to-date precomputed rows (not covered yet, or data changed since)
+        """
+        month = timezone.now().date().replace(day=1)
+        rows = list(CategoryInsight.objects.filter(user=user, month=month))
+        if not rows:
+            return None
+        # Rows computed from data a concurrent write has since changed
+        version = CacheService.user_version(user.id)
+        if any(row.data_version != version for row in rows):
+            return None
+        
+        order = {category_key: i for i, category_key in enumerate(Category.values)}
+        rows.sort(key=lambda row: order.get(row.category, len(order)))
+        
+        return [
+            {
+                'category': row.category,
+                'category_label': row.get_category_display(),
+                'spending': float(row.spending),
+                'budget': float(row.budget),
+                'peer_average': float(row.peer_average),
+                'budget_percentage': row.budget_percentage,
+                'peer_percentage': row.peer_percentage,
+                'percentile': row.percentile,
+                'insight': row.insight,
+            }
+            for row in rows
+        ]
+    
     @staticmethod
     def _generate_category_insight_text(category, spending, budget, peer_avg, 
-                                       budget_pct, peer_pct) -> str:
+                                       budget_pct, peer_pct, percentile=None) -> str:
         """
         Generate human-readable insight text for a category.
         """
@@ -156,8 +794,20 @@ class AnalyticsService:
                 under_pct = int(100 - peer_pct)
                 insights.append(f"🎉 {under_pct}% less than peers")
         
+        # Position among other users this month
+        if percentile is not None:
+            insights.append(f"📈 {AnalyticsService._ordinal(percentile)} percentile this month")
+        
         # Combine insights
         if insights:
             return " • ".join(insights)
         else:
             return "💰 Spending looks balanced"
+    
+    @staticmethod
+    def _ordinal(n: int) -> str:
+        if 10 <= n % 100 <= 20:
+            suffix = "th"
+        else:
+            suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+        return f"{n}{suffix}"
@@ -0,0 +1,242 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection
+
+from .models import (
+    BadgeRuleComparison, BadgeRulePeriod, BadgeRuleWindow, Budget, Category, MonthlySpending, PeerCategoryStats,
+    Spending, User,
+)
+
+
+class BadgeRule:
+    """
+    A declarative badge rule (the rule_* fields of a Badge).
+
+    Spending in the badge's category (all categories if none) is summed per
+    period (day, or calendar month from MonthlySpending) over the window. A period passes when its
+    total is within budget (per day: budget / 30) or below the leave-one-out
+    peer average, scaled by the tolerance; periods without spending pass.
+    Progress is the number of passing periods in the window, or with
+    rule_consecutive the streak of passing periods ending today. A rule needs
+    a positive budget or peer average, otherwise progress is 0.
+
+    The same rule is evaluated in memory for one user (against BadgeData, so
+    it costs no queries of its own) or compiled to one set-based SQL query for
+    many users.
+    """
+
+    DAYS_PER_BUDGET = 30  # Monthly budgets are spread over 30 days for daily periods
+
+    def __init__(self, badge):
+        self.badge = badge
+        self.category = badge.category or None
+        self.period = badge.rule_period
+        self.window = badge.rule_window
+        self.length = badge.rule_window_length
+        self.comparison = badge.rule_comparison
+        self.tolerance = Decimal(badge.rule_tolerance)
+        self.consecutive = badge.rule_consecutive
+        self.target = badge.target_value
+
+    @staticmethod
+    def is_declarative(badge) -> bool:
+        return bool(badge.rule_period)
+
+    # ── Window ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def month_starts(today, count) -> list:
+        """First day of this month and the previous count-1 calendar months, newest first."""
+        starts = [today.replace(day=1)]
+        for _ in range(count - 1):
+            starts.append((starts[-1] - timedelta(days=1)).replace(day=1))
+        return starts
+
+    def months(self, today) -> list:
+        """The calendar months a monthly rule counts, newest first."""
+        return self.month_starts(today, self.periods_elapsed(today))
+
+    def start(self, today) -> date:
+        """First date the rule reads."""
+        if self.period == BadgeRulePeriod.MONTH:
+            return self.months(today)[-1]
+        if self.window == BadgeRuleWindow.DAYS:
+            return today - timedelta(days=self.length)
+        if self.window == BadgeRuleWindow.MONTHS:
+            return self.month_starts(today, self.length)[-1]
+        return today.replace(day=1)
+
+    def periods_elapsed(self, today) -> int:
+        if self.period == BadgeRulePeriod.MONTH:
+            return len(self.month_starts(today, self.length or 1)) if self.window == BadgeRuleWindow.MONTHS else 1
+        elapsed = (today - self.start(today)).days + 1
+        return min(self.length, elapsed) if self.window == BadgeRuleWindow.DAYS else elapsed
+
+    def _progress(self, today, failing, newest_failing):
+        """Turn the failing-period count and the newest failing period into (progress, earned)."""
+        elapsed = self.periods_elapsed(today)
+        if not self.consecutive:
+            progress = elapsed - failing
+        elif newest_failing is None:
+            progress = elapsed
+        elif self.period == BadgeRulePeriod.MONTH:
+            progress = (today.year - newest_failing.year) * 12 + today.month - newest_failing.month
+        else:
+            progress = min((today - newest_failing).days, elapsed)
+        progress = min(progress, self.target)
+        return progress, progress >= self.target
+
+    # ── In memory, for one user ──────────────────────────────────────────────
+
+    def evaluate(self, data):
+        """
+        Evaluate against a user's BadgeData.
+
+        Returns:
+            (current_progress, is_earned)
+        """
+        today = data.today
+        if self.comparison == BadgeRuleComparison.BUDGET:
+            base = data.budgets.get(self.category) if self.category else sum(data.budgets.values())
+            base = Decimal(base or 0)
+        else:
+            averages = data.peer_averages
+            base = Decimal(str(averages.get(self.category, 0) if self.category else sum(averages.values())))
+        if base <= 0:
+            return 0, False
+
+        threshold = base * self.tolerance
+        if self.period == BadgeRulePeriod.DAY:
+            threshold /= self.DAYS_PER_BUDGET
+            totals = data.days(self.start(today), self.category)
+        else:
+            totals = {}
+            for month_start in self.months(today):
+                total = data.month_total(month_start, self.category)
+                if total is not None:
+                    totals[month_start] = total
+
+        failing = [period for period, total in totals.items() if not self._passes(total, threshold)]
+        past_failing = [period for period in failing if period <= today]
+        return self._progress(today, len(failing), max(past_failing) if past_failing else None)
+
+    def _passes(self, total, threshold) -> bool:
+        if self.comparison == BadgeRuleComparison.BUDGET:
+            return total <= threshold
+        return total < threshold
+
+    # ── Compiled to SQL, for many users ─────────────────────────────────────
+
+    def compile(self, user_ids, today):
+        """
+        One query returning (user_id, failing periods, newest failing period)
+        for every user in `user_ids` with a positive budget / peer average.
+
+        Returns:
+            (sql, params)
+        """
+        ids = ", ".join(["%s"] * len(user_ids))
+
+        # Months come from the monthly rollup, days from the daily rows
+        if self.period == BadgeRulePeriod.MONTH:
+            table, period_column = MonthlySpending._meta.db_table, "month"
+            period_filters = ["s.month >= %s", "s.month <= %s", "s.row_count > 0"]
+            period_params = [self.start(today), today]
+        else:
+            table, period_column = Spending._meta.db_table, "date"
+            period_filters = ["s.date >= %s"]
+            period_params = [self.start(today)]
+        period_filters.insert(0, f"s.user_id IN ({ids})")
+        period_params = [*user_ids, *period_params]
+        if self.category:
+            period_filters.append("s.category = %s")
+            period_params.append(self.category)
+
+        periods_sql = (
+            f"SELECT s.user_id, s.{period_column} AS period, SUM(s.amount) AS total "
+            f"FROM {table} s WHERE {' AND '.join(period_filters)} GROUP BY 1, 2"
+        )
+
+        if self.comparison == BadgeRuleComparison.BUDGET:
+            base_sql, base_params = self._budget_base_sql(ids, user_ids)
+            fails = "p.total > base.amount * %s"
+        else:
+            base_sql, base_params = self._peer_base_sql(ids, user_ids)
+            fails = "p.total >= base.amount * %s"
+        if self.period == BadgeRulePeriod.DAY:
+            fails += f" / {self.DAYS_PER_BUDGET}"
+
+        sql = (
+            f"WITH periods AS ({periods_sql}), base AS ({base_sql}) "
+            f"SELECT base.user_id, "
+            f"SUM(CASE WHEN {fails} THEN 1 ELSE 0 END) AS failing, "
+            f"MAX(CASE WHEN {fails} AND p.period <= %s THEN p.period END) AS newest_failing "
+            f"FROM base LEFT JOIN periods p ON p.user_id = base.user_id "
+            f"WHERE base.amount > 0 "
+            f"GROUP BY base.user_id"
+        )
+        params = [*period_params, *base_params, self.tolerance, self.tolerance, today]
+        return sql, params
+
+    def _budget_base_sql(self, ids, user_ids):
+        budget = Budget._meta.db_table
+        category_filter, params = "", list(user_ids)
+        if self.category:
+            category_filter = " AND b.category = %s"
+            params.append(self.category)
+        return (
+            f"SELECT b.user_id, SUM(b.amount) AS amount FROM {budget} b "
+            f"WHERE b.user_id IN ({ids}){category_filter} GROUP BY b.user_id"
+        ), params
+
+    def _peer_base_sql(self, ids, user_ids):
+        # Sum over categories of (population total - own total) / (population rows - own rows),
+        # the same leave-one-out average as AnalyticsService.get_peer_averages; own totals
+        # are MonthlySpending plus undated Spending rows, like AnalyticsService._users_category_totals
+        spending = Spending._meta.db_table
+        monthly = MonthlySpending._meta.db_table
+        stats = PeerCategoryStats._meta.db_table
+        users = User._meta.db_table
+
+        categories = [self.category] if self.category else Category.values
+        category_ids = ", ".join(["%s"] * len(categories))
+        params = [*categories, *user_ids, *user_ids, *user_ids]
+        return (
+            f"SELECT u.id AS user_id, SUM(CASE WHEN ps.row_count - COALESCE(o.n, 0) > 0 "
+            f"THEN (ps.total - COALESCE(o.total, 0)) / (ps.row_count - COALESCE(o.n, 0)) ELSE 0 END) AS amount "
+            f"FROM {users} u "
+            f"CROSS JOIN (SELECT category, SUM(total) AS total, SUM(row_count) AS row_count FROM {stats} "
+            f"WHERE month IS NULL AND category IN ({category_ids}) GROUP BY category) ps "
+            f"LEFT JOIN (SELECT user_id, category, SUM(amount) AS total, SUM(n) AS n FROM ("
+            f"SELECT user_id, category, amount, row_count AS n FROM {monthly} WHERE user_id IN ({ids}) "
+            f"UNION ALL SELECT user_id, category, amount, 1 FROM {spending} WHERE user_id IN ({ids}) AND date IS NULL"
+            f") own GROUP BY user_id, category) o "
+            f"ON o.user_id = u.id AND o.category = ps.category "
+            f"WHERE u.id IN ({ids}) GROUP BY u.id"
+        ), params
+
+    def evaluate_many(self, user_ids, today) -> dict:
+        """
+        Evaluate for many users with the compiled query.
+
+        Returns:
+            Dict of user id -> (current_progress, is_earned), for every user in user_ids
+        """
+        results = {user_id: (0, False) for user_id in user_ids}
+        if not user_ids:
+            return results
+
+        sql, params = self.compile(list(user_ids), today)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for user_id, failing, newest_failing in cursor.fetchall():
+                results[user_id] = self._progress(today, int(failing or 0), _as_date(newest_failing))
+        return results
+
+
+def _as_date(value):
+    # Raw aggregates over a date column come back as strings on SQLite
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
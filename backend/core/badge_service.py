@@ -0,0 +1,419 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics_service import AnalyticsService
+from .badge_rules import BadgeRule
+from .models import (
+    Badge, BadgeRuleComparison, BadgeRulePeriod, BadgeType, Budget, MonthlySpending, Spending,
+    UserBadge,
+)
+
+
+class BadgeData:
+    """
+    Everything the badge rules read for one user, fetched once: budgets per
+    category, daily totals for the rules that count days and monthly totals
+    (from MonthlySpending) for the rest.
+    """
+
+    def __init__(self, user_id, today, budgets, daily, monthly, peer_averages=None):
+        self.user_id = user_id
+        self.today = today
+        self.budgets = budgets  # category -> Decimal amount
+        self.daily = daily  # (category, date) -> Decimal total
+        self.monthly = monthly  # (category, first day of month) -> Decimal total, only months with rows
+        self._peer_averages = peer_averages
+
+    @property
+    def peer_averages(self) -> dict:
+        if self._peer_averages is None:
+            self._peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=self.user_id)
+        return self._peer_averages
+
+    def days(self, start, category=None) -> dict:
+        """Daily totals from `start` on (any later date included), for one category or all."""
+        days = defaultdict(Decimal)
+        for (row_category, date), total in self.daily.items():
+            if date >= start and (category is None or row_category == category):
+                days[date] += total
+        return days
+
+    def month_total(self, month, category=None):
+        """Spending in the month starting `month`, for one category or all, or None if there are no rows."""
+        totals = [
+            total
+            for (row_category, row_month), total in self.monthly.items()
+            if row_month == month and (category is None or row_category == category)
+        ]
+        return sum(totals) if totals else None
+
+
+class BadgeService:
+    """
+    Badge progress computed from a single fetch of the user's data.
+
+    BadgeService.load runs a fixed number of queries (budgets, daily spending
+    totals and, when a rule needs them, peer averages); every badge rule then
+    works on that in-memory BadgeData. Badges with a declarative rule
+    (Badge.rule_*) are evaluated by BadgeRule, the others by the hand-written
+    rule for their badge_type.
+    """
+
+    YEAR_DAYS = 365
+    PEER_MONTHS = 12  # Monthly lookback loaded when the badges are not known up front
+
+    # Badge type -> hand-written rule method, each taking (BadgeData, target) and returning (progress, earned)
+    RULES = {
+        BadgeType.GOAL_CRUSHER: "_goal_crusher",
+        BadgeType.SPENDING_SLAYER: "_spending_slayer",
+        BadgeType.SOCIAL_SAVER: "_social_saver",
+    }
+
+    # Badge type -> (spending categories read, budget categories read, lookback) of the hand-written rules.
+    # None means every category; lookback is how far back spending still matters.
+    DEPENDENCIES = {
+        BadgeType.GOAL_CRUSHER: (None, None, "month"),
+        BadgeType.SPENDING_SLAYER: (None, [], 2),
+        BadgeType.SOCIAL_SAVER: (["entertainment"], ["entertainment"], "month"),
+    }
+
+    @staticmethod
+    def _data_starts(today, badges=None):
+        """
+        First day of daily totals (None if no badge counts days) and first
+        month of monthly totals to load for `badges`; without badges, enough
+        for YEAR_DAYS of days and PEER_MONTHS months.
+        """
+        if badges is None:
+            return today - timedelta(days=BadgeService.YEAR_DAYS), BadgeRule.month_starts(today, BadgeService.PEER_MONTHS)[-1]
+
+        daily_start, monthly_start = None, today.replace(day=1)
+        for badge in badges:
+            start = BadgeService.dependencies(badge, today)[2]
+            if BadgeRule.is_declarative(badge) and badge.rule_period == BadgeRulePeriod.DAY:
+                daily_start = start if daily_start is None else min(daily_start, start)
+            else:
+                monthly_start = min(monthly_start, start.replace(day=1))
+        return daily_start, monthly_start
+
+    @staticmethod
+    def load(user, today=None, badges=None) -> BadgeData:
+        """Fetch the data `badges` (every rule, if not given) need for `user`."""
+        today = today or timezone.now().date()
+        daily_start, monthly_start = BadgeService._data_starts(today, badges)
+
+        budgets = dict(Budget.objects.filter(user=user).values_list("category", "amount"))
+        daily = {}
+        if daily_start is not None:
+            daily = {
+                (category, date): amount
+                for category, date, amount in Spending.objects.filter(user=user, date__gte=daily_start)
+                .values_list("category", "date", "amount")
+            }
+        monthly = {
+            (category, month): amount
+            for category, month, amount in MonthlySpending.objects.filter(
+                user=user, month__gte=monthly_start, row_count__gt=0
+            ).values_list("category", "month", "amount")
+        }
+        return BadgeData(user.id, today, budgets, daily, monthly)
+
+    @staticmethod
+    def load_many(user_ids, today=None, peer_stats=None, badges=None) -> dict:
+        """
+        BadgeData for many users in a fixed number of queries.
+
+        Args:
+            user_ids: Users to load
+            today: Evaluation date (defaults to today)
+            peer_stats: AnalyticsService.get_peer_category_totals(), shared across calls; when
+                given, each user's leave-one-out peer averages are derived from
+                them and the user's own totals (one extra query for all users)
+            badges: Badges to be evaluated, so only the data they read is loaded
+
+        Returns:
+            Dict of user id -> BadgeData
+        """
+        today = today or timezone.now().date()
+        daily_start, monthly_start = BadgeService._data_starts(today, badges)
+
+        budgets = defaultdict(dict)
+        for user_id, category, amount in Budget.objects.filter(user_id__in=user_ids).values_list("user_id", "category", "amount"):
+            budgets[user_id][category] = amount
+
+        daily = defaultdict(dict)
+        if daily_start is not None:
+            for user_id, category, date, amount in (
+                Spending.objects.filter(user_id__in=user_ids, date__gte=daily_start)
+                .values_list("user_id", "category", "date", "amount")
+            ):
+                daily[user_id][(category, date)] = amount
+
+        monthly = defaultdict(dict)
+        for user_id, category, month, amount in (
+            MonthlySpending.objects.filter(user_id__in=user_ids, month__gte=monthly_start, row_count__gt=0)
+            .values_list("user_id", "category", "month", "amount")
+        ):
+            monthly[user_id][(category, month)] = amount
+
+        peer_averages = {}
+        if peer_stats is not None:
+            own = AnalyticsService._users_category_totals(user_ids)
+            peer_averages = {
+                user_id: AnalyticsService._leave_one_out_averages(peer_stats, own[user_id])
+                for user_id in user_ids
+            }
+
+        return {
+            user_id: BadgeData(
+                user_id, today, budgets[user_id], daily[user_id], monthly[user_id], peer_averages.get(user_id)
+            )
+            for user_id in user_ids
+        }
+
+    @staticmethod
+    def evaluate(badge, data: BadgeData):
+        """
+        Progress of one badge against preloaded data.
+
+        Returns:
+            (current_progress, is_earned)
+        """
+        if BadgeRule.is_declarative(badge):
+            return BadgeRule(badge).evaluate(data)
+        rule = BadgeService.RULES.get(badge.badge_type)
+        if rule is None:
+            return 0, False
+        return getattr(BadgeService, rule)(data, badge.target_value)
+
+    @staticmethod
+    def evaluate_all(user, badges) -> dict:
+        """
+        Returns:
+            Dict of badge id -> (current_progress, is_earned)
+        """
+        data = BadgeService.load(user, badges=badges)
+        return {badge.id: BadgeService.evaluate(badge, data) for badge in badges}
+
+    @staticmethod
+    def _lookback_start(today, lookback):
+        if lookback == "month":
+            return today.replace(day=1)
+        return BadgeRule.month_starts(today, lookback)[-1]
+
+    @staticmethod
+    def dependencies(badge, today):
+        """
+        What a badge reads.
+
+        Returns:
+            (spending categories, budget categories, first date read); None means every category
+        """
+        if BadgeRule.is_declarative(badge):
+            rule = BadgeRule(badge)
+            categories = [rule.category] if rule.category else None
+            budget_categories = categories if rule.comparison == BadgeRuleComparison.BUDGET else []
+            return categories, budget_categories, rule.start(today)
+        categories, budget_categories, lookback = BadgeService.DEPENDENCIES.get(badge.badge_type, ([], [], "month"))
+        return categories, budget_categories, BadgeService._lookback_start(today, lookback)
+
+    @staticmethod
+    def affected_badges(badges, spending=(), budgets=(), today=None) -> list:
+        """
+        The badges whose progress can change after spending writes to the
+        given (category, date) pairs or budget writes to the given categories.
+        """
+        today = today or timezone.now().date()
+        affected = []
+        for badge in badges:
+            categories, budget_categories, start = BadgeService.dependencies(badge, today)
+            if any((categories is None or category in categories) and date >= start for category, date in spending) or any(
+                budget_categories is None or category in budget_categories for category in budgets
+            ):
+                affected.append(badge)
+        return affected
+
+    @staticmethod
+    def refresh_user_badges(user, badges, data=None, existing=None) -> list:
+        """
+        Re-evaluate `badges` for `user` and store the result on UserBadge,
+        creating missing rows. Earned badges stay earned.
+
+        Args:
+            existing: The user's UserBadge rows by badge id, if the caller has
+                already read them (saves the read in _store)
+
+        Returns:
+            The user's UserBadge rows for `badges`
+        """
+        data = data or BadgeService.load(user, badges=badges)
+        evaluated = [(user.id, badge, *BadgeService.evaluate(badge, data)) for badge in badges]
+        if existing is not None:
+            existing = {(user.id, badge_id): user_badge for badge_id, user_badge in existing.items()}
+        return BadgeService._store(evaluated, data.today, existing)
+
+    @staticmethod
+    def recompute_users(user_ids, badges, peer_stats=None, today=None) -> int:
+        """
+        Re-evaluate `badges` for a chunk of users with a fixed number of queries:
+        one per declarative badge, plus load_many for the hand-written ones.
+
+        Args:
+            peer_stats: AnalyticsService.get_peer_category_totals() (see load_many); read here if omitted
+
+        Returns:
+            Number of UserBadge rows written
+        """
+        today = today or timezone.now().date()
+        evaluated = []
+
+        # Declarative rules: one set-based query per badge for the whole chunk
+        for badge in badges:
+            if BadgeRule.is_declarative(badge):
+                results = BadgeRule(badge).evaluate_many(user_ids, today)
+                evaluated.extend((user_id, badge, *results[user_id]) for user_id in user_ids)
+
+        custom = [badge for badge in badges if not BadgeRule.is_declarative(badge)]
+        if custom:
+            if peer_stats is None:
+                peer_stats = AnalyticsService.get_peer_category_totals()
+            data = BadgeService.load_many(user_ids, today, peer_stats, custom)
+            evaluated.extend(
+                (user_id, badge, *BadgeService.evaluate(badge, data[user_id]))
+                for user_id in user_ids
+                for badge in custom
+            )
+        return len(BadgeService._store(evaluated, today))
+
+    @staticmethod
+    def _store(evaluated, today, existing=None) -> list:
+        """
+        Write (user_id, badge, progress, is_earned) results to UserBadge with
+        at most two statements: one bulk insert of missing rows and one bulk
+        update of rows that changed. Unless `existing` ({(user_id, badge_id):
+        UserBadge}) is given, the current rows are read first.
+        """
+        now = timezone.now()
+        if existing is None:
+            existing = {
+                (user_badge.user_id, user_badge.badge_id): user_badge
+                for user_badge in UserBadge.objects.filter(
+                    user_id__in={user_id for user_id, _, _, _ in evaluated},
+                    badge__in={badge.id for _, badge, _, _ in evaluated},
+                )
+            }
+
+        to_create, to_update, user_badges = [], [], []
+        for user_id, badge, progress, is_earned in evaluated:
+            user_badge = existing.get((user_id, badge.id))
+            if user_badge is None:
+                user_badge = UserBadge(user_id=user_id, badge=badge, progress=progress, evaluated_on=today)
+                if is_earned:
+                    user_badge.earned, user_badge.earned_at = True, now
+                to_create.append(user_badge)
+            elif (
+                user_badge.progress != progress
+                or user_badge.evaluated_on != today
+                or (is_earned and not user_badge.earned)
+            ):
+                user_badge.progress = progress
+                user_badge.evaluated_on = today
+                if is_earned and not user_badge.earned:
+                    user_badge.earned = True
+                    user_badge.earned_at = now
+                to_update.append(user_badge)
+            user_badges.append(user_badge)
+
+        # ignore_conflicts: a concurrent request may have provisioned the same rows
+        if to_create:
+            UserBadge.objects.bulk_create(to_create, ignore_conflicts=True)
+        if to_update:
+            UserBadge.objects.bulk_update(to_update, ["progress", "earned", "earned_at", "evaluated_on"])
+        return user_badges
+
+    @staticmethod
+    def record_change(user, spending=(), budgets=()):
+        """
+        Re-evaluate the user's progress on the badges that spending writes to
+        (category, date) pairs or budget writes to categories can affect,
+        once the writer's transaction commits (see record_changes).
+        """
+        BadgeService.record_changes([user.id], spending, budgets)
+
+    @staticmethod
+    def record_changes(user_ids, spending=(), budgets=()):
+        """
+        record_change for many users at once: the badges any of the changes
+        can affect are re-evaluated for all of `user_ids` with recompute_users
+        (one query per declarative badge) after the transaction commits, so a
+        rolled-back write changes nothing and the writer holds no extra locks.
+        """
+        user_ids = list(user_ids)
+        badges = BadgeService.affected_badges(Badge.objects.all(), spending, budgets)
+        if user_ids and badges:
+            transaction.on_commit(lambda: BadgeService.recompute_users(user_ids, badges))
+
+    # ── Rules ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _goal_crusher(data, target):
+        # Met monthly savings goal (based on savings category)
+        savings_goal = data.budgets.get("savings")
+        if not savings_goal:
+            return 0, False
+
+        total_spending = data.month_total(data.today.replace(day=1)) or 0
+        total_budget = sum(data.budgets.values())
+
+        # Savings = budget - spending
+        actual_savings = float(total_budget) - float(total_spending)
+        savings_goal = float(savings_goal)
+
+        progress = int((actual_savings / savings_goal) * target) if savings_goal > 0 else 0
+        progress = max(0, min(progress, target))
+        return progress, actual_savings >= savings_goal
+
+    @staticmethod
+    def _spending_slayer(data, target):
+        # Reduced spending by 20% compared to last month
+        start_of_month = data.today.replace(day=1)
+        last_month_end = start_of_month - timedelta(days=1)
+        last_month_start = last_month_end.replace(day=1)
+
+        this_month_spending = data.month_total(start_of_month) or 0
+        last_month_spending = data.month_total(last_month_start)
+        if last_month_spending is None:
+            last_month_spending = 1  # Avoid division by zero
+
+        if float(last_month_spending) == 0:
+            return 0, False
+
+        reduction_pct = (1 - float(this_month_spending) / float(last_month_spending)) * 100
+        progress = int(reduction_pct / 20 * target)  # Scale to target
+        progress = max(0, min(progress, target))
+        return progress, reduction_pct >= 20
+
+    @staticmethod
+    def _social_saver(data, target):
+        # Stayed within entertainment budget for a month
+        budget = data.budgets.get("entertainment")
+        if not budget:
+            return 0, False
+
+        start_of_month = data.today.replace(day=1)
+        total_entertainment = data.month_total(start_of_month, category="entertainment") or 0
+        days_elapsed = (data.today - start_of_month).days + 1
+
+        if float(total_entertainment) <= float(budget):
+            progress = days_elapsed
+        else:
+            # Calculate what percentage of budget used
+            pct_used = float(total_entertainment) / float(budget)
+            progress = int(days_elapsed / pct_used)
+
+        progress = min(progress, target)
+        return progress, progress >= target and float(total_entertainment) <= float(budget)
@@ -0,0 +1,175 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics_service import AnalyticsService
+from .cache_service import CacheService
+from .models import Budget, Category, CategoryInsight, MonthlySpending, User
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(round(float(value), 2)))
+
+
+class BatchAnalyticsService:
+    """
+    Whole-population analytics computed with NumPy.
+
+    Spending and budgets are loaded chunk by chunk into dense
+    (user x category x month) arrays, every user's insight numbers are derived
+    with array operations in one pass, and the results are written to
+    CategoryInsight for insights/categories/ to read.
+    """
+
+    CHUNK_SIZE = 2000
+
+    @staticmethod
+    def compute_category_insights(chunk_size=CHUNK_SIZE, log=None) -> dict:
+        """
+        Recompute CategoryInsight for every user.
+
+        The numbers are the ones AnalyticsService.get_category_insights
+        computes live: the user's spending is their month-to-date total; the
+        peer average is the mean monthly total of all other users over the last
+        AnalyticsService.INSIGHT_PEER_MONTHS calendar months
+        (get_insight_peer_averages); the percentile is the share of other users
+        with positive spending this month who spent the same or less.
+
+        Args:
+            chunk_size: Users loaded and written per batch
+            log: Optional callable for progress messages
+
+        Returns:
+            Dict with 'users', 'rows' and 'seconds'
+        """
+        log = log or (lambda msg: None)
+        started = time.monotonic()
+
+        today = timezone.now().date()
+        month_starts = [today.replace(day=1)]
+        for _ in range(AnalyticsService.INSIGHT_PEER_MONTHS - 1):
+            month_starts.insert(0, (month_starts[0] - timedelta(days=1)).replace(day=1))
+        month_pos = {month: i for i, month in enumerate(month_starts)}
+
+        categories = Category.values
+        category_pos = {category: i for i, category in enumerate(categories)}
+
+        user_ids = np.fromiter(User.objects.order_by("id").values_list("id", flat=True), dtype=np.int64)
+        n_users = len(user_ids)
+
+        totals = np.zeros((n_users, len(categories), len(month_starts)))
+        present = np.zeros((n_users, len(categories), len(month_starts)), dtype=bool)
+        budgets = np.zeros((n_users, len(categories)))
+        data_versions = {}
+
+        # 1. Load the dense arrays, one contiguous user-id range at a time
+        for offset in range(0, n_users, chunk_size):
+            chunk = user_ids[offset:offset + chunk_size]
+            first_id, last_id = int(chunk[0]), int(chunk[-1])
+            # Read before the data: a write committed after this bumps the version past the
+            # one stored, so a row computed from data older than the write is never served
+            data_versions.update(CacheService.user_versions(chunk.tolist()))
+
+            # A month the user has no Spending rows in does not count, as in the live averages
+            monthly = MonthlySpending.objects.filter(
+                user_id__gte=first_id, user_id__lte=last_id, month__gte=month_starts[0], row_count__gt=0,
+            ).values_list("user_id", "category", "month", "amount")
+            rows = [
+                (user_id, category_pos[category], month_pos[month], float(amount))
+                for user_id, category, month, amount in monthly
+                if category in category_pos and month in month_pos
+            ]
+            if rows:
+                uid, cat, mon, amount = (np.array(col) for col in zip(*rows))
+                upos = np.searchsorted(user_ids, uid)
+                totals[upos, cat, mon] = amount
+                present[upos, cat, mon] = True
+
+            budget_rows = [
+                (user_id, category_pos[category], float(amount))
+                for user_id, category, amount in Budget.objects
+                .filter(user_id__gte=first_id, user_id__lte=last_id)
+                .values_list("user_id", "category", "amount")
+                if category in category_pos
+            ]
+            if budget_rows:
+                uid, cat, amount = (np.array(col) for col in zip(*budget_rows))
+                budgets[np.searchsorted(user_ids, uid), cat] = amount
+
+            log(f"  loaded {min(offset + chunk_size, n_users)}/{n_users} users")
+
+        # 2. Vectorized metrics
+        spending = totals[:, :, -1]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            budget_pct = np.where(budgets > 0, spending / budgets * 100, 0.0)
+
+            # Leave-one-out mean over (user, month) cells that have rows
+            cell_sum = totals.sum(axis=(0, 2))
+            cell_count = present.sum(axis=(0, 2))
+            peer_sum = cell_sum - totals.sum(axis=2)
+            peer_count = cell_count - present.sum(axis=2)
+            peer_avg = np.where(peer_count > 0, peer_sum / np.maximum(peer_count, 1), 0.0)
+
+            peer_pct = np.where(peer_avg > 0, spending / peer_avg * 100, 0.0)
+
+        percentiles = np.full(spending.shape, -1, dtype=np.int64)
+        for c in range(len(categories)):
+            column = spending[:, c]
+            positive = column > 0
+            ranked = np.sort(column[positive])
+            others = len(ranked) - 1
+            if others <= 0:
+                continue
+            # Values at or below the user's own, minus the user
+            at_or_below = np.searchsorted(ranked, column[positive], side="right") - 1
+            percentiles[positive, c] = np.rint(100 * at_or_below / others)
+
+        # 3. Insight text and write-out
+        computed_at = timezone.now()
+        user_idx, cat_idx = np.nonzero(spending)
+        written = 0
+
+        with transaction.atomic():
+            CategoryInsight.objects.all().delete()
+
+            for offset in range(0, len(user_idx), chunk_size):
+                batch = []
+                for u, c in zip(user_idx[offset:offset + chunk_size], cat_idx[offset:offset + chunk_size]):
+                    category = categories[c]
+                    percentile = int(percentiles[u, c]) if percentiles[u, c] >= 0 else None
+                    batch.append(CategoryInsight(
+                        user_id=int(user_ids[u]),
+                        category=category,
+                        month=month_starts[-1],
+                        spending=_money(spending[u, c]),
+                        budget=_money(budgets[u, c]),
+                        peer_average=_money(peer_avg[u, c]),
+                        budget_percentage=float(budget_pct[u, c]),
+                        peer_percentage=float(peer_pct[u, c]),
+                        percentile=percentile,
+                        insight=AnalyticsService._generate_category_insight_text(
+                            Category(category).label,
+                            spending[u, c],
+                            budgets[u, c],
+                            peer_avg[u, c],
+                            budget_pct[u, c],
+                            peer_pct[u, c],
+                            percentile,
+                        ),
+                        computed_at=computed_at,
+                        data_version=data_versions[int(user_ids[u])],
+                    ))
+                CategoryInsight.objects.bulk_create(batch)
+                written += len(batch)
+                log(f"  wrote {written}/{len(user_idx)} insight rows")
+
+        return {
+            "users": n_users,
+            "rows": written,
+            "seconds": time.monotonic() - started,
+        }
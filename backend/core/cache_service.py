@@ -0,0 +1,117 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category
+
+
+class CacheService:
+    """
+    Versioned cache for per-user analytics.
+
+    Entries are keyed by the user's data version, so a user's own writes are
+    reflected immediately and entries never have to be deleted. Entries that
+    compare with other users are also keyed by a peer version per category,
+    bumped whenever that category's peer rollups change, so a hit is never
+    stale and a write only invalidates comparisons involving its categories.
+    """
+
+    USER_VERSION_KEY = "analytics:user-version:{user_id}"
+    PEER_VERSION_KEY = "analytics:peer-version:{category}"
+
+    @staticmethod
+    def _get_version(key) -> int:
+        version = cache.get(key)
+        if version is None:
+            # Start from a clock value so an evicted counter never reuses an old version
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def _bump_version(key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    @staticmethod
+    def user_version(user_id) -> int:
+        return CacheService._get_version(CacheService.USER_VERSION_KEY.format(user_id=user_id))
+
+    @staticmethod
+    def user_versions(user_ids) -> dict:
+        """user_version for many users, with one cache read when all are present."""
+        keys = {user_id: CacheService.USER_VERSION_KEY.format(user_id=user_id) for user_id in user_ids}
+        versions = cache.get_many(list(keys.values()))
+        return {
+            user_id: versions[key] if key in versions else CacheService._get_version(key)
+            for user_id, key in keys.items()
+        }
+
+    @staticmethod
+    def peer_versions(categories) -> list:
+        """Peer versions of `categories`, in order, with one cache read when all are present."""
+        keys = [CacheService.PEER_VERSION_KEY.format(category=category) for category in categories]
+        versions = cache.get_many(keys)
+        return [versions[key] if key in versions else CacheService._get_version(key) for key in keys]
+
+    @staticmethod
+    def bump_user(user_id):
+        """Invalidate a user's cached analytics once the current transaction commits."""
+        key = CacheService.USER_VERSION_KEY.format(user_id=user_id)
+        transaction.on_commit(lambda: CacheService._bump_version(key))
+
+    @staticmethod
+    def bump_peers(categories=None):
+        """
+        Invalidate cached peer comparisons involving `categories` (default:
+        all) once the current transaction commits. Called for every rollup
+        change (see AnalyticsService._write_rollup_deltas) and by rebuilds.
+        """
+        keys = [
+            CacheService.PEER_VERSION_KEY.format(category=category)
+            for category in (Category.values if categories is None else sorted(set(categories)))
+        ]
+
+        def bump():
+            for key in keys:
+                CacheService._bump_version(key)
+
+        transaction.on_commit(bump)
+
+    @staticmethod
+    def get_or_compute(name, user, compute, *parts, peers=True):
+        """
+        Return the cached value for (name, user, parts) at the current versions,
+        computing and storing it on a miss.
+
+        Args:
+            name: Kind of entry, e.g. 'insights'
+            user: User the entry belongs to
+            compute: Zero-argument callable producing the value
+            parts: Extra key parts (query params, dates, ...)
+            peers: Whether the value depends on other users' data: True for
+                every category, or the categories it compares
+        """
+        key_parts = [
+            "analytics",
+            name,
+            str(user.id),
+            f"u{CacheService.user_version(user.id)}",
+        ]
+        if peers:
+            categories = Category.values if peers is True else peers
+            key_parts.append("p" + ".".join(str(version) for version in CacheService.peer_versions(categories)))
+        else:
+            key_parts.append("p-")
+        key_parts.extend(str(part) for part in parts)
+        key = ":".join(key_parts)
+
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, timeout=settings.ANALYTICS_CACHE_TIMEOUT)
+        return value
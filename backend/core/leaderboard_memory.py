@@ -0,0 +1,285 @@
+import threading
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .leaderboard_service import LeaderboardService
+from .models import MonthlySpending, User
+from .order_statistics import OrderStatisticList
+
+
+class _Board:
+    """One leaderboard: user totals plus the same totals ordered by (total, user_id)."""
+
+    def __init__(self, totals: dict):
+        self.totals = totals
+        self.order = OrderStatisticList((total, user_id) for user_id, total in totals.items())
+
+    def set(self, user_id, total):
+        """Move a user to a new total; None removes them from the board."""
+        old = self.totals.pop(user_id, None)
+        if old is not None:
+            self.order.remove((old, user_id))
+        if total is not None:
+            self.totals[user_id] = total
+            self.order.insert((total, user_id))
+
+
+class _MemoryBoard:
+    """Keyset access to one in-memory leaderboard (same interface as SnapshotBoard)."""
+
+    def __init__(self, memory, board, computed_at):
+        self.memory = memory
+        self.board = board
+        self.computed_at = computed_at
+
+    def _rows(self, keys) -> list:
+        rows = []
+        for total, user_id in keys:
+            username, full_name = self.memory._names.get(user_id, ("", ""))
+            rows.append({"user_id": user_id, "username": username, "full_name": full_name, "amount": total})
+        return rows
+
+    def total_users(self) -> int:
+        with self.memory._lock:
+            return len(self.board.order)
+
+    def user_row(self, user_id):
+        with self.memory._lock:
+            total = self.board.totals.get(user_id)
+            return self._rows([(total, user_id)])[0] if total is not None else None
+
+    def rows_after(self, key, limit) -> list:
+        with self.memory._lock:
+            start = self.board.order.count_less((key[0], key[1] + 1)) if key else 0
+            return self._rows(self.board.order.slice(start, start + limit))
+
+    def rows_before(self, key, limit) -> list:
+        with self.memory._lock:
+            stop = self.board.order.count_less(key) if key else len(self.board.order)
+            return self._rows(self.board.order.slice(stop - limit, stop))
+
+    def count_less(self, key) -> int:
+        with self.memory._lock:
+            return self.board.order.count_less(key)
+
+
+class LeaderboardMemory:
+    """
+    Every leaderboard (total and per category, month and year) held in process
+    memory, answering top-k and rank-of-user in O(log n) without touching the
+    database.
+
+    Loaded from the database in a background thread at startup (or on first use)
+    and reloaded after LEADERBOARD_MEMORY_MAX_AGE seconds or when a period rolls
+    over. Spending writes made by this process are applied as soon as they
+    commit; writes from other processes show up at the next reload. While cold,
+    get_leaderboard returns None and callers fall back to SQL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}  # (board, period) -> _Board
+        self._names = {}  # user_id -> (username, full_name)
+        self._starts = {}  # period -> first date counted
+        self._loaded_at = None
+        self._loading = False
+        self._dirty = set()  # users written while a load is running
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.LEADERBOARD_IN_MEMORY
+
+    def _is_current(self) -> bool:
+        return self._loaded_at is not None and all(
+            start == LeaderboardService.get_start_date(period) for period, start in self._starts.items()
+        )
+
+    def get_leaderboard(self, user, category=None, period="month", limit=LeaderboardService.TOP_N):
+        """
+        Same as LeaderboardService.get_leaderboard, answered from memory.
+
+        Returns:
+            The get_leaderboard dict plus 'computed_at' (load time) and
+            'snapshot_age_seconds', or None while the structure is cold
+        """
+        view = self.get_board(category, period)
+        if view is None:
+            return None
+
+        board, loaded_at = view.board, view.computed_at
+        with self._lock:
+            top_keys = board.order.first(limit)
+            own = board.totals.get(user.id)
+            own_rank = board.order.count_less((own, 0)) + 1 if own is not None else None
+            total_users = len(board.order)
+            names = [self._names.get(user_id, ("", "")) for _, user_id in top_keys]
+
+        top = []
+        for position, ((total, user_id), (username, full_name)) in enumerate(zip(top_keys, names)):
+            # RANK(): ties share the rank of the first user with that total
+            rank = top[-1]["rank"] if top and total == top_keys[position - 1][0] else position + 1
+            top.append({
+                "rank": rank,
+                "user_id": user_id,
+                "username": username,
+                "full_name": full_name or username,
+                "amount": float(total),
+            })
+
+        if own is None:
+            # If user has no spending yet
+            current = {"rank": total_users + 1, "amount": 0}
+        else:
+            current = {"rank": own_rank, "amount": float(own)}
+
+        return {
+            "top": top,
+            "current_user": current,
+            "total_users": total_users,
+            "computed_at": loaded_at,
+            "snapshot_age_seconds": int((timezone.now() - loaded_at).total_seconds()),
+        }
+
+    def get_board(self, category=None, period="month"):
+        """
+        One leaderboard for keyset paging (see LeaderboardService.get_page),
+        or None while cold. Starts a reload when cold or stale.
+        """
+        if not self.enabled():
+            return None
+
+        key = (LeaderboardService._board_name(category), period)
+        if key[0] not in LeaderboardService.BOARDS or period not in LeaderboardService.PERIODS:
+            # Not a board the structure holds; don't start loads it can never satisfy
+            return None
+        with self._lock:
+            board = self._boards.get(key) if self._is_current() else None
+            loaded_at = self._loaded_at
+
+        if board is None or (timezone.now() - loaded_at).total_seconds() > settings.LEADERBOARD_MEMORY_MAX_AGE:
+            self.warm_in_background()
+        if board is None:
+            return None
+        return _MemoryBoard(self, board, loaded_at)
+
+    def warm_in_background(self):
+        """Start a (re)load unless one is already running."""
+        if not self.enabled():
+            return
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+            self._dirty = set()
+        threading.Thread(target=self._load_and_close, name="leaderboard-memory", daemon=True).start()
+
+    def warm(self):
+        """Load synchronously."""
+        with self._lock:
+            self._loading = True
+            self._dirty = set()
+        self._load()
+
+    def _load_and_close(self):
+        try:
+            self._load()
+        finally:
+            connection.close()
+
+    def _load(self):
+        try:
+            starts = {period: LeaderboardService.get_start_date(period) for period in LeaderboardService.PERIODS}
+            loaded_at = timezone.now()
+            boards = {key: _Board(totals) for key, totals in self._query_totals(starts).items()}
+            names = {
+                user_id: (username, full_name)
+                for user_id, username, full_name in User.objects.values_list("id", "username", "full_name").iterator()
+            }
+
+            # Users written during the load may be missing from it: re-read them until none are left
+            while True:
+                with self._lock:
+                    dirty, self._dirty = self._dirty, set()
+                    if not dirty:
+                        self._boards, self._names, self._starts = boards, names, starts
+                        self._loaded_at = loaded_at
+                        return
+                fresh = self._query_totals(starts, user_ids=dirty)
+                for key, board in boards.items():
+                    for user_id in dirty:
+                        board.set(user_id, fresh[key].get(user_id))
+                names.update(
+                    (user_id, (username, full_name))
+                    for user_id, username, full_name in User.objects.filter(id__in=dirty).values_list("id", "username", "full_name")
+                )
+        finally:
+            with self._lock:
+                self._loading = False
+
+    @staticmethod
+    def _query_totals(starts: dict, user_ids=None) -> dict:
+        """
+        Per-board totals in one pass over the longest period of MonthlySpending.
+
+        Returns:
+            {(board, period): {user_id: Decimal total}}; users without rows in
+            a board's period are absent from it
+        """
+        totals = {
+            (board, period): {}
+            for board in LeaderboardService.BOARDS
+            for period in LeaderboardService.PERIODS
+        }
+        aggregates = {}
+        for period, start in starts.items():
+            aggregates[f"{period}_total"] = Sum("amount", filter=Q(month__gte=start))
+            aggregates[f"{period}_rows"] = Count("id", filter=Q(month__gte=start))
+
+        queryset = MonthlySpending.objects.filter(month__gte=min(starts.values()), row_count__gt=0)
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        rows = queryset.values("user_id", "category").annotate(**aggregates).order_by()
+
+        for row in rows.iterator():
+            for period in starts:
+                if not row[f"{period}_rows"]:
+                    continue
+                amount = row[f"{period}_total"] or Decimal("0")
+                by_category = totals.get((row["category"], period))
+                if by_category is not None:
+                    by_category[row["user_id"]] = amount
+                overall = totals[("total", period)]
+                overall[row["user_id"]] = overall.get(row["user_id"], Decimal("0")) + amount
+        return totals
+
+    def refresh_user(self, user):
+        """Re-read one user's totals and move them on every board."""
+        if not self.enabled():
+            return
+        with self._lock:
+            if self._loaded_at is None and not self._loading:
+                return
+            starts = dict(self._starts) or None
+
+        if starts is not None:
+            fresh = self._query_totals(starts, user_ids=[user.id])
+
+        with self._lock:
+            if self._loading:
+                self._dirty.add(user.id)
+            if starts is None or starts != self._starts:
+                return
+            self._names[user.id] = (user.username, user.full_name)
+            for key, board in self._boards.items():
+                board.set(user.id, fresh[key].get(user.id))
+
+    def refresh_user_on_commit(self, user):
+        if self.enabled():
+            transaction.on_commit(lambda: self.refresh_user(user))
+
+
+leaderboard_memory = LeaderboardMemory()
@@ -0,0 +1,450 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Window
+from django.db.models.functions import Rank
+from django.utils import timezone
+
+from .models import Category, LeaderboardEntry, LeaderboardSnapshot, MonthlySpending, normalize_cohort_value
+
+
+class LeaderboardService:
+    """Service for ranking users by spending (lowest total = best)."""
+
+    TOP_N = 10
+    BOARDS = ["total"] + Category.values
+    PERIODS = ["month", "year"]
+    COHORTS = ["university", "city", "country"]  # User fields a leaderboard can be scoped to
+    WRITE_BATCH_SIZE = 5000
+    PAGE_SIZE = 25
+    MAX_PAGE_SIZE = 100
+
+    @staticmethod
+    def get_start_date(period) -> "date":
+        """First date included in a leaderboard period ('month' or 'year')."""
+        start = timezone.now().date().replace(day=1)
+        if period == "year":
+            # Last 12 calendar months, including this one (whole months, so boards read MonthlySpending)
+            for _ in range(11):
+                start = (start - timedelta(days=1)).replace(day=1)
+        return start
+
+    @staticmethod
+    def _cohort_expression(cohort_type):
+        # The normalized key stored on the user (see User.save)
+        return F(f"user__{cohort_type}_key")
+
+    @staticmethod
+    def get_cohort_key(user, cohort_type) -> str:
+        """The user's cohort value as stored in snapshots (normalize_cohort_value); '' if unset."""
+        return normalize_cohort_value(getattr(user, cohort_type))
+
+    @staticmethod
+    def _base(category=None, period="month", cohort=None):
+        """
+        MonthlySpending rows counted by a leaderboard (at most 12 per user and
+        category), optionally limited to a (cohort_type, key) cohort.
+        """
+        base_qs = MonthlySpending.objects.filter(
+            month__gte=LeaderboardService.get_start_date(period), row_count__gt=0
+        )
+        if category and category != "total":
+            base_qs = base_qs.filter(category=category)
+        if cohort:
+            cohort_type, key = cohort
+            base_qs = base_qs.alias(cohort_key=LeaderboardService._cohort_expression(cohort_type)).filter(cohort_key=key)
+        return base_qs
+
+    @staticmethod
+    def get_leaderboard(user, category=None, period="month", limit=TOP_N, cohort=None) -> dict:
+        """
+        Top users and the given user's position, ranked in the database.
+
+        Runs a fixed number of queries regardless of user count: one windowed
+        query for the top rows (with user details joined in and the population
+        size as a window count), one for the user's total and one counting the
+        users ahead of them.
+
+        Returns:
+            Dict with 'top', 'current_user' ({'rank', 'amount'}) and 'total_users'
+        """
+        base_qs = LeaderboardService._base(category, period, cohort)
+        totals = base_qs.values("user_id").annotate(total=Sum("amount")).order_by()
+
+        top_rows = list(
+            base_qs
+            .values("user_id", "user__username", "user__full_name")
+            .annotate(
+                total=Sum("amount"),
+                rank=Window(Rank(), order_by=F("total").asc()),
+                total_users=Window(Count("*")),
+            )
+            .order_by("rank", "user_id")[:limit]
+        )
+        total_users = top_rows[0]["total_users"] if top_rows else 0
+
+        top = [
+            {
+                "rank": row["rank"],
+                "user_id": row["user_id"],
+                "username": row["user__username"],
+                "full_name": row["user__full_name"] or row["user__username"],
+                "amount": float(row["total"] or 0),
+            }
+            for row in top_rows
+        ]
+
+        # RANK() of the user = 1 + number of users with a strictly lower total
+        own = base_qs.filter(user_id=user.id).aggregate(total=Sum("amount"), rows=Count("id"))
+        if not own["rows"]:
+            # If user has no spending yet
+            current = {"rank": total_users + 1, "amount": 0}
+        else:
+            ahead = totals.filter(total__lt=own["total"]).count()
+            current = {"rank": ahead + 1, "amount": float(own["total"] or 0)}
+
+        return {
+            "top": top,
+            "current_user": current,
+            "total_users": total_users,
+        }
+
+    @staticmethod
+    def _board_name(category):
+        return category if category and category != "total" else "total"
+
+    @staticmethod
+    def get_snapshot_leaderboard(user, category=None, period="month", limit=TOP_N, cohort=None):
+        """
+        Same as get_leaderboard, answered from the materialized snapshot with
+        indexed lookups (top rows by (snapshot, [cohort,] amount, user), the user
+        by (snapshot, user)).
+        For a (cohort_type, key) cohort the per-cohort ranks stored on the entries are used.
+
+        Returns:
+            The get_leaderboard dict plus 'computed_at' and 'snapshot_age_seconds',
+            or None if there is no snapshot, it is older than
+            LEADERBOARD_SNAPSHOT_MAX_AGE, or it predates the current period.
+        """
+        snapshot = LeaderboardService._usable_snapshot(category, period)
+        if snapshot is None:
+            return None
+
+        board = SnapshotBoard(snapshot, cohort)
+        top = [
+            {
+                "rank": getattr(entry, board.rank_field),
+                "user_id": entry.user_id,
+                "username": entry.user.username,
+                "full_name": entry.user.full_name or entry.user.username,
+                "amount": float(entry.amount),
+            }
+            for entry in board.entries.order_by("amount", "user_id")[:limit]
+        ]
+
+        total_users = board.total_users()
+        own = board.entries.filter(user_id=user.id).first()
+        if own is None:
+            # If user has no spending yet
+            current = {"rank": total_users + 1, "amount": 0}
+        else:
+            current = {"rank": getattr(own, board.rank_field), "amount": float(own.amount)}
+
+        return {
+            "top": top,
+            "current_user": current,
+            "total_users": total_users,
+            "computed_at": snapshot.computed_at,
+            "snapshot_age_seconds": int((timezone.now() - snapshot.computed_at).total_seconds()),
+        }
+
+    @staticmethod
+    def _usable_snapshot(category=None, period="month"):
+        """The snapshot for a leaderboard, or None if missing, too old or from a previous month."""
+        snapshot = LeaderboardSnapshot.objects.filter(
+            board=LeaderboardService._board_name(category),
+            period="year" if period == "year" else "month",
+        ).first()
+        if snapshot is None:
+            return None
+
+        age = (timezone.now() - snapshot.computed_at).total_seconds()
+        if age > settings.LEADERBOARD_SNAPSHOT_MAX_AGE:
+            return None
+        if timezone.localdate(snapshot.computed_at) < LeaderboardService.get_start_date(period):
+            # Computed before the period rolled over
+            return None
+        return snapshot
+
+    @staticmethod
+    def get_board(category=None, period="month", cohort=None):
+        """Ranked source for paging: the snapshot when usable, otherwise live SQL."""
+        snapshot = LeaderboardService._usable_snapshot(category, period)
+        if snapshot is not None:
+            return SnapshotBoard(snapshot, cohort)
+        return LiveBoard(category, period, cohort)
+
+    @staticmethod
+    def get_page(board, after=None, before=None, limit=PAGE_SIZE) -> dict:
+        """
+        One page of a ranking, by keyset on (total, user_id).
+
+        Args:
+            board: SnapshotBoard, LiveBoard or an in-memory board
+            after: Key (total, user_id) the page starts after
+            before: Key (total, user_id) the page ends before
+            limit: Rows per page
+
+        Returns:
+            Dict with 'results' and the 'next' / 'previous' keys to continue
+            from (None at either end)
+        """
+        if before is not None:
+            rows = board.rows_before(before, limit + 1)
+            has_previous, has_next = len(rows) > limit, True
+            rows = rows[-limit:]
+        else:
+            rows = board.rows_after(after, limit + 1)
+            has_previous, has_next = after is not None, len(rows) > limit
+            rows = rows[:limit]
+
+        return {
+            "results": LeaderboardService._ranked(board, rows),
+            "next": LeaderboardService._key(rows[-1]) if rows and has_next else None,
+            "previous": LeaderboardService._key(rows[0]) if rows and has_previous else None,
+        }
+
+    @staticmethod
+    def get_around(board, user, window=5) -> dict:
+        """
+        The user's row with up to `window` rows above and below it.
+        A user without spending is ranked last, so they get the bottom rows.
+
+        Returns:
+            Same as get_page, plus 'current_user' ({'rank', 'amount'})
+        """
+        own = board.user_row(user.id)
+        if own is None:
+            above = board.rows_before(None, window + 1)
+            rows = above[-window:]
+            below = []
+        else:
+            above = board.rows_before(LeaderboardService._key(own), window + 1)
+            below = board.rows_after(LeaderboardService._key(own), window + 1)
+            rows = above[-window:] + [own] + below[:window]
+
+        results = LeaderboardService._ranked(board, rows)
+        if own is None:
+            current = {"rank": board.total_users() + 1, "amount": 0}
+        else:
+            mine = next(row for row in results if row["user_id"] == user.id)
+            current = {"rank": mine["rank"], "amount": mine["amount"]}
+
+        return {
+            "results": results,
+            "next": LeaderboardService._key(rows[-1]) if rows and len(below) > window else None,
+            "previous": LeaderboardService._key(rows[0]) if rows and len(above) > window else None,
+            "current_user": current,
+        }
+
+    @staticmethod
+    def _key(row):
+        return (row["amount"], row["user_id"])
+
+    @staticmethod
+    def _ranked(board, rows) -> list:
+        """
+        Attach RANK() to consecutive rows using two positional lookups:
+        the rank of the first row and its position in the ordering.
+        """
+        if not rows:
+            return []
+        first = rows[0]
+        rank = board.count_less((first["amount"], 0)) + 1
+        position = board.count_less(LeaderboardService._key(first))
+
+        ranked = []
+        for offset, row in enumerate(rows):
+            if offset and row["amount"] != rows[offset - 1]["amount"]:
+                rank = position + offset + 1
+            ranked.append({
+                "rank": rank,
+                "user_id": row["user_id"],
+                "username": row["username"],
+                "full_name": row["full_name"] or row["username"],
+                "amount": float(row["amount"]),
+            })
+        return ranked
+
+    @staticmethod
+    def refresh_snapshots(boards=None, periods=None) -> int:
+        """
+        Recompute the materialized leaderboards, one transaction per board and period.
+
+        Returns:
+            Number of entries written
+        """
+        written = 0
+        for period in periods or LeaderboardService.PERIODS:
+            for board in boards or LeaderboardService.BOARDS:
+                written += LeaderboardService._refresh_snapshot(board, period)
+        return written
+
+    @staticmethod
+    @transaction.atomic
+    def _refresh_snapshot(board, period) -> int:
+        computed_at = timezone.now()
+
+        # Global and per-cohort ranks in one pass: RANK() OVER (PARTITION BY <cohort>)
+        # (the cohort key is constant per user; wrapping it in Max keeps it out of GROUP BY)
+        cohorts = {}
+        for cohort_type in LeaderboardService.COHORTS:
+            key = Max(LeaderboardService._cohort_expression(cohort_type))
+            cohorts[cohort_type] = key
+            cohorts[f"{cohort_type}_rank"] = Window(Rank(), partition_by=[key], order_by=F("total").asc())
+        ranked = (
+            LeaderboardService._base(board, period)
+            .values("user_id")
+            .annotate(
+                total=Sum("amount"),
+                rank=Window(Rank(), order_by=F("total").asc()),
+                **cohorts,
+            )
+            .order_by()
+        )
+
+        snapshot, _ = LeaderboardSnapshot.objects.select_for_update().get_or_create(
+            board=board, period=period, defaults={"computed_at": computed_at}
+        )
+        snapshot.entries.all().delete()
+
+        batch = []
+        written = 0
+        for row in ranked.iterator(chunk_size=LeaderboardService.WRITE_BATCH_SIZE):
+            entry = LeaderboardEntry(
+                snapshot=snapshot, user_id=row["user_id"], rank=row["rank"], amount=row["total"] or 0
+            )
+            for cohort_type in LeaderboardService.COHORTS:
+                if row[cohort_type]:
+                    setattr(entry, cohort_type, row[cohort_type])
+                    setattr(entry, f"{cohort_type}_rank", row[f"{cohort_type}_rank"])
+            batch.append(entry)
+            if len(batch) >= LeaderboardService.WRITE_BATCH_SIZE:
+                LeaderboardEntry.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        LeaderboardEntry.objects.bulk_create(batch)
+        written += len(batch)
+
+        snapshot.total_users = written
+        snapshot.computed_at = computed_at
+        snapshot.save(update_fields=["total_users", "computed_at"])
+        return written
+
+
+def _after(key, total_field="amount"):
+    total, user_id = key
+    return Q(**{f"{total_field}__gt": total}) | Q(**{total_field: total, "user_id__gt": user_id})
+
+
+def _before(key, total_field="amount"):
+    total, user_id = key
+    return Q(**{f"{total_field}__lt": total}) | Q(**{total_field: total, "user_id__lt": user_id})
+
+
+class SnapshotBoard:
+    """
+    Keyset access to a LeaderboardSnapshot, or to one cohort of it. Every
+    lookup is a range scan on the (snapshot, [cohort,] amount, user) index,
+    so deep pages cost the same as the first.
+    """
+
+    def __init__(self, snapshot, cohort=None):
+        self.snapshot = snapshot
+        self.computed_at = snapshot.computed_at
+        self.cohort = cohort
+        self.entries = snapshot.entries.select_related("user")
+        self.rank_field = "rank"
+        if cohort:
+            cohort_type, key = cohort
+            self.entries = self.entries.filter(**{cohort_type: key})
+            self.rank_field = f"{cohort_type}_rank"
+
+    @staticmethod
+    def _row(entry) -> dict:
+        return {
+            "user_id": entry.user_id,
+            "username": entry.user.username,
+            "full_name": entry.user.full_name,
+            "amount": entry.amount,
+        }
+
+    def total_users(self) -> int:
+        if self.cohort:
+            return self.entries.count()
+        return self.snapshot.total_users
+
+    def user_row(self, user_id):
+        entry = self.entries.filter(user_id=user_id).first()
+        return self._row(entry) if entry else None
+
+    def rows_after(self, key, limit) -> list:
+        entries = self.entries.filter(_after(key)) if key else self.entries
+        return [self._row(entry) for entry in entries.order_by("amount", "user_id")[:limit]]
+
+    def rows_before(self, key, limit) -> list:
+        entries = self.entries.filter(_before(key)) if key else self.entries
+        return [self._row(entry) for entry in entries.order_by("-amount", "-user_id")[:limit]][::-1]
+
+    def count_less(self, key) -> int:
+        # Position of the first entry at or after the key: its stored rank plus the ties before it
+        following = self.entries.exclude(_before(key)).order_by("amount", "user_id").first()
+        if following is None:
+            return self.total_users()
+        ties = self.entries.filter(amount=following.amount, user_id__lt=following.user_id).count()
+        return getattr(following, self.rank_field) - 1 + ties
+
+
+class LiveBoard:
+    """
+    Keyset access to a ranking aggregated on the fly. Pages still aggregate
+    the whole period, so this is only the fallback while no snapshot is fresh.
+    """
+
+    computed_at = None
+
+    def __init__(self, category=None, period="month", cohort=None):
+        self.totals = (
+            LeaderboardService._base(category, period, cohort)
+            .values("user_id", "user__username", "user__full_name")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+
+    @staticmethod
+    def _row(row) -> dict:
+        return {
+            "user_id": row["user_id"],
+            "username": row["user__username"],
+            "full_name": row["user__full_name"],
+            "amount": row["total"],
+        }
+
+    def total_users(self) -> int:
+        return self.totals.count()
+
+    def user_row(self, user_id):
+        row = self.totals.filter(user_id=user_id).order_by("user_id").first()
+        return self._row(row) if row else None
+
+    def rows_after(self, key, limit) -> list:
+        totals = self.totals.filter(_after(key, "total")) if key else self.totals
+        return [self._row(row) for row in totals.order_by("total", "user_id")[:limit]]
+
+    def rows_before(self, key, limit) -> list:
+        totals = self.totals.filter(_before(key, "total")) if key else self.totals
+        return [self._row(row) for row in totals.order_by("-total", "-user_id")[:limit]][::-1]
+
+    def count_less(self, key) -> int:
+        return self.totals.filter(_before(key, "total")).count()
@@ -0,0 +1,154 @@
+import json
+import statistics
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.models import Category, Spending
+
+# The Spending indexes before the covering suite, recreated for --baseline
+BASELINE_SQL = [
+    'DROP INDEX spending_user_date_cover_idx',
+    'DROP INDEX spending_cat_date_cover_idx',
+    'DROP INDEX uniq_spending_user_cat_date',
+    'CREATE UNIQUE INDEX uniq_spending_user_cat_date ON core_spending (user_id, category, date)',
+    'CREATE INDEX core_spending_user_id_dc159e48 ON core_spending (user_id)',
+    'CREATE INDEX core_spendi_user_id_2e5ac8_idx ON core_spending (user_id, date)',
+    'CREATE INDEX core_spendi_categor_c24cd7_idx ON core_spending (category, date)',
+    'ANALYZE core_spending',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot Spending queries and show which indexes their plans use. '
+        'Seed a large dataset first, e.g. seed_users --n 20000 then seed_spending_existing_users --months 12'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Timed runs per query (default: 20)',
+        )
+        parser.add_argument(
+            '--baseline', action='store_true',
+            help='Also run against the previous indexes, rebuilt in a rolled-back transaction '
+                 '(locks Spending while it runs; use a copy of production, not production)',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The benchmark reads PostgreSQL plans')
+
+        user_id = (
+            Spending.objects.values('user_id').annotate(rows=Count('id')).order_by('-rows')
+            .values_list('user_id', flat=True).first()
+        )
+        if user_id is None:
+            raise CommandError('No spending rows; seed some first')
+
+        row = Spending.objects.filter(user_id=user_id, date__isnull=False).values_list('id', 'date').first()
+        queries = self._queries(user_id, row, timezone.now().date())
+        self.stdout.write(f'Spending rows: {Spending.objects.count()}, sample user {user_id}')
+
+        results = {'covering': self._run(queries, options['repeat'])}
+        if options['baseline']:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for sql in BASELINE_SQL:
+                        cursor.execute(sql)
+                results['baseline'] = self._run(queries, options['repeat'])
+                transaction.set_rollback(True)
+
+        for label in queries:
+            self.stdout.write(f'\n{label}')
+            for suite, by_label in results.items():
+                result = by_label[label]
+                self.stdout.write(
+                    f'  {suite:<9} median {result["median"]:8.2f} ms  p95 {result["p95"]:8.2f} ms  '
+                    f'heap fetches {result["heap_fetches"]:>7}  '
+                    + ', '.join(f'{scan} x{count}' for scan, count in result['scans'].items())
+                )
+            if 'baseline' in results:
+                speedup = results['baseline'][label]['median'] / max(results['covering'][label]['median'], 1e-6)
+                self.stdout.write(f'  {speedup:.1f}x')
+
+        self.stdout.write(self.style.SUCCESS('\nDone'))
+
+    @staticmethod
+    def _queries(user_id, row, today) -> dict:
+        """The query shapes the app runs against Spending, by label."""
+        month_start = today.replace(day=1)
+        row_id, row_date = row
+        return {
+            # Spending is partitioned by date with a (id, date) key, so a lookup by id alone
+            # probes every partition: the WHERE of admin edits and deletes (Model.save/delete)
+            'one row by id (admin edits)': Spending.objects.filter(id=row_id).values_list('amount'),
+            'one row by id and date (set_spending)': (
+                Spending.objects.filter(id=row_id, date=row_date).values_list('amount')
+            ),
+            'own totals per category (peer averages, leave-one-out)': (
+                Spending.objects.filter(user_id=user_id)
+                .values('category').annotate(total=Sum('amount'), rows=Count('id')).order_by()
+            ),
+            'one user since a date (daily badge rules)': (
+                Spending.objects.filter(user_id=user_id, date__gte=today - timedelta(days=365))
+                .values_list('category', 'date', 'amount')
+            ),
+            'one user, category and month (category insights)': (
+                Spending.objects.filter(user_id=user_id, category=Category.GROCERIES, date__gte=month_start)
+                .values('category').annotate(total=Sum('amount')).order_by()
+            ),
+            'everyone in a category, last 30 days (peer averages)': (
+                Spending.objects.filter(category=Category.GROCERIES, date__gte=today - timedelta(days=29), date__lte=today)
+                .values('user_id').annotate(total=Sum('amount')).order_by()
+            ),
+            'everyone, totals per day over 90 days': (
+                Spending.objects.filter(date__gte=today - timedelta(days=89))
+                .values('date').annotate(total=Sum('amount')).order_by()
+            ),
+        }
+
+    @staticmethod
+    def _run(queries, repeat) -> dict:
+        results = {}
+        with connection.cursor() as cursor:
+            for label, query in queries.items():
+                sql, params = query.query.sql_with_params()
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans, heap_fetches = Command._scans(plan[0]['Plan'])
+
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                results[label] = {
+                    'median': statistics.median(timings),
+                    'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                    'heap_fetches': heap_fetches,
+                    'scans': scans,
+                }
+        return results
+
+    @staticmethod
+    def _scans(node):
+        """Scan node types in a plan (one per partition scanned) with their counts, and its total heap fetches."""
+        scans, heap_fetches = Counter(), node.get('Heap Fetches', 0)
+        if node['Node Type'].endswith('Scan'):
+            scans[node['Node Type']] += 1
+        for child in node.get('Plans', []):
+            child_scans, child_fetches = Command._scans(child)
+            scans += child_scans
+            heap_fetches += child_fetches
+        return dict(scans.most_common()), heap_fetches
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from core.batch_analytics_service import BatchAnalyticsService
+
+
+class Command(BaseCommand):
+    help = 'Precompute category insights for every user (nightly batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=BatchAnalyticsService.CHUNK_SIZE,
+            help=f'Users loaded and written per batch (default: {BatchAnalyticsService.CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        result = BatchAnalyticsService.compute_category_insights(
+            chunk_size=options['chunk_size'],
+            log=self.stdout.write,
+        )
+
+        users_per_sec = result['users'] / result['seconds'] if result['seconds'] else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Computed {result['rows']} insights for {result['users']} users "
+                f"in {result['seconds']:.1f}s ({users_per_sec:.0f} users/s)"
+            )
+        )
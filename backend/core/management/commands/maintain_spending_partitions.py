@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.badge_rules import BadgeRule
+from core.partition_service import SpendingPartitionService
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly Spending partitions and optionally detach old ones (run daily or monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Months after the current one to create partitions for (default: 3)',
+        )
+        parser.add_argument(
+            '--retain-months', type=int,
+            help='Detach partitions older than this many months, including the current one (default: keep all)',
+        )
+
+    def handle(self, *args, **options):
+        if not SpendingPartitionService.is_partitioned():
+            raise CommandError('Spending is not partitioned (PostgreSQL only, see migration 0018)')
+
+        retain = options['retain_months']
+        if retain is not None and retain < SpendingPartitionService.MIN_RETAINED_MONTHS:
+            raise CommandError(
+                f'--retain-months must be at least {SpendingPartitionService.MIN_RETAINED_MONTHS}, '
+                f'the longest window read from individual Spending rows'
+            )
+
+        today = timezone.now().date()
+        created = SpendingPartitionService.ensure_partitions(today, options['months_ahead'])
+        for month_start in created:
+            self.stdout.write(f'  created {SpendingPartitionService.partition_name(month_start)}')
+
+        detached = []
+        if retain is not None:
+            detached = SpendingPartitionService.detach_before(BadgeRule.month_starts(today, retain)[-1])
+            for name in detached:
+                self.stdout.write(f'  detached {name} (table kept)')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{len(SpendingPartitionService.list_partitions())} monthly partitions: '
+                f'{len(created)} created, {len(detached)} detached'
+            )
+        )
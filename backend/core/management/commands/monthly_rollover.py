@@ -0,0 +1,62 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import User
+from core.partition_service import SpendingPartitionService
+from core.services import create_month_rows
+
+
+class Command(BaseCommand):
+    help = "Create every user's Spending rows for the month and any missing Budget rows (run on the 1st)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            help='Month to create, as YYYY-MM (default: the current month)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Users inserted per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        if options['month']:
+            try:
+                month_start = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must look like 2025-01')
+        else:
+            month_start = timezone.now().date().replace(day=1)
+
+        started = time.monotonic()
+        if SpendingPartitionService.is_partitioned():
+            # The month's rows go straight into their own partition rather than the default one
+            for created_month in SpendingPartitionService.ensure_partitions(month_start):
+                self.stdout.write(f'  created partition {SpendingPartitionService.partition_name(created_month)}')
+
+        users = User.objects.only('id', 'university', 'city', 'age').order_by('id')
+        last_id = done_users = created = 0
+
+        # Keyset batches, each its own transaction, so a rerun (or a concurrent run) just skips what exists
+        while True:
+            chunk = list(users.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            created += create_month_rows(chunk, month_start)
+            done_users += len(chunk)
+            last_id = chunk[-1].id
+            self.stdout.write(f'  {done_users} users')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rolled over {month_start:%Y-%m}: {created} rows created for {done_users} users '
+                f'in {time.monotonic() - started:.1f}s'
+            )
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.analytics_service import AnalyticsService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user monthly spending rollup from the Spending table'
+
+    def handle(self, *args, **options):
+        written = AnalyticsService.rebuild_monthly_spending()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt monthly spending: {written} rows written')
+        )
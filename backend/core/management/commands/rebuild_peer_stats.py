@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.analytics_service import AnalyticsService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the peer spending rollups from the Spending table'
+
+    def handle(self, *args, **options):
+        written = AnalyticsService.rebuild_peer_stats()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt peer stats: {written} rollup rows written')
+        )
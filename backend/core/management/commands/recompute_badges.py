@@ -0,0 +1,125 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from core.analytics_service import AnalyticsService
+from core.badge_service import BadgeService
+from core.models import Badge, User
+
+
+def _init_worker():
+    # Needed when workers are spawned rather than forked; each worker opens its own connection
+    django.setup()
+
+
+def _recompute_chunk(user_ids, badges, peer_stats, today):
+    return BadgeService.recompute_users(user_ids, badges, peer_stats, today)
+
+
+class Command(BaseCommand):
+    help = 'Re-evaluate every badge for every user (nightly, and after a rules change or data repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Users loaded and written per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes; 1 runs in this process (default: CPU count)',
+        )
+        parser.add_argument(
+            '--checkpoint', default='recompute_badges.checkpoint',
+            help='File recording the last user id completed, to resume an interrupted run',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore an existing checkpoint and start from the first user',
+        )
+
+    def handle(self, *args, **options):
+        for option in ('chunk_size', 'workers'):
+            if options[option] < 1:
+                raise CommandError(f'--{option.replace("_", "-")} must be at least 1')
+
+        checkpoint_path = options['checkpoint']
+        checkpoint = {} if options['restart'] else self._read_checkpoint(checkpoint_path)
+        last_user_id = checkpoint.get('last_user_id', 0)
+        if last_user_id:
+            self.stdout.write(f'Resuming after user {last_user_id}')
+
+        today = timezone.now().date()
+        badges = list(Badge.objects.all())
+        # Shared by every chunk: per-user peer averages are derived from these and the user's own totals
+        peer_stats = AnalyticsService.get_peer_category_totals()
+
+        user_ids = list(User.objects.filter(id__gt=last_user_id).order_by('id').values_list('id', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+        started = time.monotonic()
+        done_users = rows = 0
+        completed = set()
+        next_chunk = 0  # Chunks before this index are all done
+
+        def finish(index, written):
+            nonlocal done_users, rows, next_chunk
+            done_users += len(chunks[index])
+            rows += written
+            completed.add(index)
+            while next_chunk in completed:
+                next_chunk += 1
+            # Only advance past chunks that finished in order, so a resume never skips users
+            if next_chunk:
+                self._write_checkpoint(checkpoint_path, chunks[next_chunk - 1][-1])
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'  {done_users}/{len(user_ids)} users ({done_users / elapsed if elapsed else 0:.0f} users/s)'
+            )
+
+        if options['workers'] == 1:
+            for index, chunk in enumerate(chunks):
+                finish(index, _recompute_chunk(chunk, badges, peer_stats, today))
+        else:
+            # Forked workers must not share the parent's database connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                futures = {
+                    pool.submit(_recompute_chunk, chunk, badges, peer_stats, today): index
+                    for index, chunk in enumerate(chunks)
+                }
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Recomputed {rows} badge rows for {done_users} users in {elapsed:.1f}s '
+                f'({done_users / elapsed if elapsed else 0:.0f} users/s)'
+            )
+        )
+
+    @staticmethod
+    def _read_checkpoint(path) -> dict:
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_checkpoint(path, last_user_id):
+        # Write then rename so an interrupted run never leaves a partial file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_user_id': last_user_id}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,44 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core.models import User
+from core.services import ledger_mismatches, rebuild_spending_from_ledger
+
+
+class Command(BaseCommand):
+    help = 'Compare Spending with the sums of its ledger transactions, and optionally rebuild it from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Set mismatched Spending rows to their ledger sums (default: only report)',
+        )
+        parser.add_argument(
+            '--show', type=int, default=20,
+            help='Mismatches to list (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = ledger_mismatches()
+        for user_id, category, date, amount, total in mismatches[:options['show']]:
+            self.stdout.write(f'  user {user_id} {category} {date}: spending {amount}, ledger {total}')
+        if len(mismatches) > options['show']:
+            self.stdout.write(f'  ... and {len(mismatches) - options["show"]} more')
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Spending matches the ledger'))
+            return
+        if not options['rebuild']:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} Spending rows differ from the ledger (use --rebuild)'))
+            return
+
+        keys_by_user = defaultdict(list)
+        for user_id, category, date, _, _ in mismatches:
+            keys_by_user[user_id].append((category, date))
+
+        changed = 0
+        for user in User.objects.filter(id__in=keys_by_user).order_by('id'):
+            changed += len(rebuild_spending_from_ledger(user, keys_by_user[user.id]))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {changed} Spending rows from the ledger'))
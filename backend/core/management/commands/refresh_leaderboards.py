@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.leaderboard_service import LeaderboardService
+
+
+class Command(BaseCommand):
+    help = 'Refresh the materialized leaderboard snapshots (run on a schedule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--board', action='append', choices=LeaderboardService.BOARDS,
+            help='Only refresh this board (category or "total"); repeatable',
+        )
+        parser.add_argument(
+            '--period', action='append', choices=LeaderboardService.PERIODS,
+            help='Only refresh this period; repeatable',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = LeaderboardService.refresh_snapshots(boards=options['board'], periods=options['period'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Refreshed leaderboards: {written} entries in {time.monotonic() - started:.1f}s'
+            )
+        )
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.core.management.base import BaseCommand
 from core.models import Badge
 
@@ -16,6 +18,10 @@ class Command(BaseCommand):
                 'gradient_end': '#10B981',
                 'target_value': 30,
                 'category': 'groceries',
+                'rule_period': 'day',
+                'rule_window': 'month',
+                'rule_comparison': 'budget',
+                'rule_tolerance': Decimal('1.10'),
             },
             {
                 'badge_type': 'savings_champion',
@@ -26,6 +32,10 @@ class Command(BaseCommand):
                 'gradient_end': '#F97316',
                 'target_value': 12,
                 'category': None,
+                'rule_period': 'month',
+                'rule_window': 'months',
+                'rule_window_length': 12,
+                'rule_comparison': 'peer_average',
             },
             {
                 'badge_type': 'thrifty_shopper',
@@ -36,6 +46,10 @@ class Command(BaseCommand):
                 'gradient_end': '#EC4899',
                 'target_value': 30,
                 'category': 'entertainment',
+                'rule_period': 'day',
+                'rule_window': 'month',
+                'rule_comparison': 'budget',
+                'rule_tolerance': Decimal('1.10'),
             },
             {
                 'badge_type': 'goal_crusher',
@@ -66,6 +80,11 @@ class Command(BaseCommand):
                 'gradient_end': '#A855F7',
                 'target_value': 6,
                 'category': None,
+                'rule_period': 'month',
+                'rule_window': 'months',
+                'rule_window_length': 6,
+                'rule_comparison': 'peer_average',
+                'rule_consecutive': True,
             },
             {
                 'badge_type': 'social_saver',
@@ -86,6 +105,11 @@ class Command(BaseCommand):
                 'gradient_end': '#EF4444',
                 'target_value': 365,
                 'category': None,
+                'rule_period': 'day',
+                'rule_window': 'days',
+                'rule_window_length': 365,
+                'rule_comparison': 'budget',
+                'rule_tolerance': Decimal('1.20'),
             },
         ]
 
@@ -4,7 +4,9 @@ from django.db import transaction
 from django.utils import timezone
 from django.db import models
 
-from core.models import Budget, Spending, Category  # adjust if needed
+from core.models import Budget, Spending, Category, TransactionSource  # adjust if needed
+from core.cache_service import CacheService
+from core.services import add_spending_bulk, delete_spending
 
 from decimal import Decimal, ROUND_HALF_UP
 import random
@@ -315,13 +317,9 @@ class Command(BaseCommand):
         total_spending_skipped = 0
         total_spending_deleted = 0
 
-        # If overwrite spending, we delete in-range per user
+        # If overwrite spending, we delete in-range per user (with the matching ledger transactions)
         if overwrite_spending and not dry_run:
-            user_ids = [u.id for u in users]
-            deleted, _ = Spending.objects.filter(
-                user_id__in=user_ids,
-                date__in=anchors,
-            ).delete()
+            deleted = sum(delete_spending(u, date__in=anchors) for u in users)
             total_spending_deleted += deleted
             self.stdout.write(self.style.WARNING(f"Overwrite enabled: deleted {deleted} Spending rows in target range."))
 
@@ -364,7 +362,7 @@ class Command(BaseCommand):
                 existing = Spending.objects.filter(user=u, date__in=anchors).values_list("category", "date")
                 existing_spend_keys = set(existing)
 
-            spending_to_create = []
+            spending_to_create = []  # (category, date, amount, merchant) for add_spending_bulk
             for month_date in anchors:
                 # per-month slight variation
                 spendings = generate_spending_for_month(budgets, persona)
@@ -373,17 +371,18 @@ class Command(BaseCommand):
                     if key in existing_spend_keys:
                         total_spending_skipped += 1
                         continue
-                    spending_to_create.append(
-                        Spending(user=u, category=cat, amount=spendings[cat], date=month_date)
-                    )
+                    spending_to_create.append((cat, month_date, spendings[cat], ""))
 
             if not dry_run and spending_to_create:
-                # ignore_conflicts protects against uniqueness collisions if concurrent runs happen
-                Spending.objects.bulk_create(spending_to_create, ignore_conflicts=True)
+                # Through the ledger, keeping the rollups in sync; a row created concurrently is added to
+                add_spending_bulk(u, spending_to_create, source=TransactionSource.SEED)
                 total_spending_created += len(spending_to_create)
             else:
                 total_spending_created += len(spending_to_create) if dry_run else 0
 
+            if not dry_run:
+                CacheService.bump_user(u.id)
+
             if idx % 50 == 0 or idx == len(users):
                 self.stdout.write(f"  processed {idx}/{len(users)} users...")
 
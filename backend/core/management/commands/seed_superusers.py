@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from core.models import User, Spending, Budget
+from core.models import User, Budget, TransactionSource
+from core.services import add_spending_bulk, delete_spending
 from datetime import date, timedelta
 from decimal import Decimal
 import random
@@ -22,11 +23,12 @@ class Command(BaseCommand):
         today = date.today()
         
         for user in superusers:
-            # Clear existing spending for this user
-            deleted_count = Spending.objects.filter(user=user).delete()[0]
+            # Clear existing spending (and its ledger transactions) for this user
+            deleted_count = delete_spending(user)
             self.stdout.write(f'\n{user.username}: Deleted {deleted_count} old records')
             
-            created_count = 0
+            # (category, date, amount, merchant) items, written to the ledger at once below
+            items = []
             
             # Create spending records for the last 30 days
             for i in range(30):
@@ -34,60 +36,24 @@ class Command(BaseCommand):
                 
                 # Groceries - daily small purchases (70% of days)
                 if random.random() > 0.3:
-                    Spending.objects.create(
-                        user=user,
-                        category='groceries',
-                        amount=Decimal(str(round(random.uniform(5, 25), 2))),
-                        date=day
-                    )
-                    created_count += 1
+                    items.append(('groceries', day, Decimal(str(round(random.uniform(5, 25), 2))), ''))
                 
                 # Entertainment - occasional (30% of days)
                 if random.random() > 0.7:
-                    Spending.objects.create(
-                        user=user,
-                        category='entertainment',
-                        amount=Decimal(str(round(random.uniform(10, 50), 2))),
-                        date=day
-                    )
-                    created_count += 1
+                    items.append(('entertainment', day, Decimal(str(round(random.uniform(10, 50), 2))), ''))
                 
                 # Transportation - most days (60% of days)
                 if random.random() > 0.4:
-                    Spending.objects.create(
-                        user=user,
-                        category='transportation',
-                        amount=Decimal(str(round(random.uniform(3, 15), 2))),
-                        date=day
-                    )
-                    created_count += 1
+                    items.append(('transportation', day, Decimal(str(round(random.uniform(3, 15), 2))), ''))
                 
                 # Healthcare - rare (10% of days)
                 if random.random() > 0.9:
-                    Spending.objects.create(
-                        user=user,
-                        category='healthcare',
-                        amount=Decimal(str(round(random.uniform(15, 80), 2))),
-                        date=day
-                    )
-                    created_count += 1
+                    items.append(('healthcare', day, Decimal(str(round(random.uniform(15, 80), 2))), ''))
 
             # Monthly bills (at start of month)
-            Spending.objects.create(
-                user=user, 
-                category='rent', 
-                amount=Decimal('450.00'), 
-                date=today.replace(day=1)
-            )
-            created_count += 1
+            items.append(('rent', today.replace(day=1), Decimal('450.00'), ''))
             
-            Spending.objects.create(
-                user=user, 
-                category='utilities', 
-                amount=Decimal('65.00'), 
-                date=today.replace(day=1)
-            )
-            created_count += 1
+            items.append(('utilities', today.replace(day=1), Decimal('65.00'), ''))
 
             # Set budgets for the user
             budgets = {
@@ -108,8 +74,11 @@ class Command(BaseCommand):
                     defaults={'amount': Decimal(str(amount))}
                 )
 
+            # After the budgets, so the cache bump of the write covers them too
+            add_spending_bulk(user, items, source=TransactionSource.SEED)
+
             self.stdout.write(
-                self.style.SUCCESS(f'{user.username}: Created {created_count} spending records + 8 budgets')
+                self.style.SUCCESS(f'{user.username}: Created {len(items)} spending records + 8 budgets')
             )
         
         self.stdout.write(self.style.SUCCESS('\nDone seeding superusers!'))
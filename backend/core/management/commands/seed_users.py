@@ -4,7 +4,9 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.db import transaction
 
-from core.models import Budget, Spending, Category  # adjust if your app label differs
+from core.models import Budget, Spending, Category, Transaction, TransactionSource  # adjust if your app label differs
+from core.analytics_service import AnalyticsService
+from core.services import add_spending_bulk
 from decimal import Decimal, ROUND_HALF_UP
 import random
 import string
@@ -261,6 +263,7 @@ class Command(BaseCommand):
             User.objects.filter(is_superuser=False).delete()
             Budget.objects.all().delete()
             Spending.objects.all().delete()
+            Transaction.objects.all().delete()
 
         created = 0
         skipped = 0
@@ -325,7 +328,7 @@ class Command(BaseCommand):
             budgets = generate_budgets(income, persona)
 
             budget_objs = []
-            spending_objs = []
+            spending_items = []  # (category, date, amount, merchant) for add_spending_bulk
 
             # Create budgets (one per category)
             for cat in CATS:
@@ -352,17 +355,20 @@ class Command(BaseCommand):
                 spendings = generate_spending(budgets, persona)
                 
                 for cat in CATS:
-                    spending_objs.append(
-                        Spending(user=user, category=cat, amount=spendings[cat], date=month_date)
-                    )
+                    spending_items.append((cat, month_date, spendings[cat], ""))
 
-            Spending.objects.bulk_create(spending_objs)
+            # Through the ledger, keeping the rollups in sync
+            add_spending_bulk(user, spending_items, source=TransactionSource.SEED)
 
             created += 1
 
             if created % 50 == 0:
                 self.stdout.write(f"  created {created}/{n}...")
 
+        # The reset deletes bypass the incremental rollup updates
+        if reset:
+            AnalyticsService.rebuild_peer_stats()
+
         self.stdout.write(self.style.SUCCESS(f"Done. Created={created}, skipped={skipped}."))
         self.stdout.write(self.style.SUCCESS(f"All seeded users share password: {password}"))
         self.stdout.write("Example login: seed.alex.smith.0001@example.com (or username) depending on your frontend login field.")
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:38
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_peer_stats(apps, schema_editor):
+    Spending = apps.get_model('core', 'Spending')
+    PeerCategoryStats = apps.get_model('core', 'PeerCategoryStats')
+
+    aggregates = {
+        'total': Sum('amount'),
+        'row_count': Count('id'),
+        'sum_squares': Sum(F('amount') * F('amount')),
+    }
+    monthly = (
+        Spending.objects.filter(date__isnull=False)
+        .annotate(month=TruncMonth('date'))
+        .values('category', 'month')
+        .annotate(**aggregates)
+        .order_by()
+    )
+    all_time = Spending.objects.values('category').annotate(**aggregates).order_by()
+
+    PeerCategoryStats.objects.bulk_create(
+        [PeerCategoryStats(**row) for row in monthly]
+        + [PeerCategoryStats(month=None, **row) for row in all_time]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_spending_uniq_spending_user_cat_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeerCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('groceries', 'Groceries'), ('transportation', 'Transportation'), ('healthcare', 'Healthcare'), ('savings', 'Savings'), ('other', 'Other')], max_length=32)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('sum_squares', models.DecimalField(decimal_places=4, default=0, max_digits=30)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='peercategorystats',
+            constraint=models.UniqueConstraint(fields=('category', 'month'), name='uniq_peerstats_cat_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='peercategorystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('month__isnull', True)), fields=('category',), name='uniq_peerstats_cat_alltime'),
+        ),
+        migrations.RunPython(populate_peer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:39
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+AGE_BANDS = [(18, 'under-18'), (25, '18-24'), (35, '25-34'), (45, '35-44'), (55, '45-54')]
+
+
+def _normalize(value):
+    return ' '.join((value or '').split()).lower()
+
+
+def _age_band(age):
+    if age is None:
+        return None
+    for upper, label in AGE_BANDS:
+        if age < upper:
+            return label
+    return '55+'
+
+
+def populate_cohort_stats(apps, schema_editor):
+    Spending = apps.get_model('core', 'Spending')
+    CohortCategoryStats = apps.get_model('core', 'CohortCategoryStats')
+
+    by_profile = (
+        Spending.objects
+        .values('user__university', 'user__city', 'user__age', 'category')
+        .annotate(total=Sum('amount'), row_count=Count('id'), sum_squares=Sum(F('amount') * F('amount')))
+        .order_by()
+    )
+    cohorts = {}
+    for row in by_profile:
+        keys = {
+            'university': _normalize(row['user__university']),
+            'city': _normalize(row['user__city']),
+            'age_band': _age_band(row['user__age']),
+        }
+        for cohort_type, cohort_key in keys.items():
+            if not cohort_key:
+                continue
+            stats = cohorts.setdefault(
+                (cohort_type, cohort_key, row['category']),
+                CohortCategoryStats(cohort_type=cohort_type, cohort_key=cohort_key, category=row['category']),
+            )
+            stats.total += row['total'] or 0
+            stats.row_count += row['row_count']
+            stats.sum_squares += row['sum_squares'] or 0
+
+    CohortCategoryStats.objects.bulk_create(cohorts.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_peercategorystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort_type', models.CharField(choices=[('university', 'University'), ('city', 'City'), ('age_band', 'Age Band')], max_length=16)),
+                ('cohort_key', models.CharField(max_length=180)),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('groceries', 'Groceries'), ('transportation', 'Transportation'), ('healthcare', 'Healthcare'), ('savings', 'Savings'), ('other', 'Other')], max_length=32)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('sum_squares', models.DecimalField(decimal_places=4, default=0, max_digits=30)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cohortcategorystats',
+            constraint=models.UniqueConstraint(fields=('cohort_type', 'cohort_key', 'category'), name='uniq_cohortstats_cohort_cat'),
+        ),
+        migrations.RunPython(populate_cohort_stats, migrations.RunPython.noop),
+    ]
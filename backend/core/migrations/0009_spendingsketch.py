@@ -0,0 +1,64 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:41
+
+import math
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+RELATIVE_ACCURACY = 0.01
+
+
+def _sketch_json(totals):
+    # Frozen copy of QuantileSketch(RELATIVE_ACCURACY): add() for each total, then to_json().
+    # Migrations must not import app code, which can change after they are written.
+    log_gamma = math.log((1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY))
+    bins = Counter(math.ceil(math.log(float(total)) / log_gamma) for total in totals if total and total > 0)
+    return {'alpha': RELATIVE_ACCURACY, 'bins': {str(index): count for index, count in bins.items()}}
+
+
+def populate_sketches(apps, schema_editor):
+    Spending = apps.get_model('core', 'Spending')
+    SpendingSketch = apps.get_model('core', 'SpendingSketch')
+
+    user_months = (
+        Spending.objects.filter(date__isnull=False)
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'category', 'month')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    totals = {}
+    for row in user_months.iterator(chunk_size=5000):
+        totals.setdefault((row['category'], row['month']), []).append(row['total'])
+
+    SpendingSketch.objects.bulk_create(
+        SpendingSketch(category=category, month=month, sketch=_sketch_json(month_totals))
+        for (category, month), month_totals in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_cohortcategorystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('groceries', 'Groceries'), ('transportation', 'Transportation'), ('healthcare', 'Healthcare'), ('savings', 'Savings'), ('other', 'Other')], max_length=32)),
+                ('month', models.DateField()),
+                ('sketch', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='spendingsketch',
+            constraint=models.UniqueConstraint(fields=('category', 'month'), name='uniq_sketch_cat_month'),
+        ),
+        migrations.RunPython(populate_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_spendingsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryInsight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('groceries', 'Groceries'), ('transportation', 'Transportation'), ('healthcare', 'Healthcare'), ('savings', 'Savings'), ('other', 'Other')], max_length=32)),
+                ('month', models.DateField()),
+                ('spending', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('budget', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('peer_average', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('budget_percentage', models.FloatField(default=0)),
+                ('peer_percentage', models.FloatField(default=0)),
+                ('percentile', models.IntegerField(blank=True, null=True)),
+                ('insight', models.CharField(max_length=255)),
+                ('computed_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_insights', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='categoryinsight',
+            constraint=models.UniqueConstraint(fields=('user', 'category'), name='uniq_insight_user_cat'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_leaderboard_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['snapshot', 'amount', 'user'], name='core_leader_snapsho_910076_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_leaderboardentry_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='leaderboardentry',
+            name='core_leader_snapsho_2e2a63_idx',
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='city',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='city_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='country',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='country_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='university',
+            field=models.CharField(blank=True, default='', max_length=180),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='university_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['snapshot', 'university', 'amount', 'user'], name='core_leader_snapsho_6679a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['snapshot', 'city', 'amount', 'user'], name='core_leader_snapsho_9272db_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['snapshot', 'country', 'amount', 'user'], name='core_leader_snapsho_5ec7d7_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_leaderboard_cohorts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbadge',
+            name='evaluated_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+# The hand-written count rules, expressed declaratively
+RULES = {
+    'budget_master': dict(rule_period='day', rule_window='month', rule_comparison='budget', rule_tolerance=Decimal('1.10')),
+    'thrifty_shopper': dict(rule_period='day', rule_window='month', rule_comparison='budget', rule_tolerance=Decimal('1.10')),
+    'year_legend': dict(rule_period='day', rule_window='days', rule_window_length=365, rule_comparison='budget', rule_tolerance=Decimal('1.20')),
+    'savings_champion': dict(rule_period='month', rule_window='months', rule_window_length=12, rule_comparison='peer_average'),
+    'elite_saver': dict(rule_period='month', rule_window='months', rule_window_length=6, rule_comparison='peer_average', rule_consecutive=True),
+}
+
+
+def populate_badge_rules(apps, schema_editor):
+    Badge = apps.get_model('core', 'Badge')
+    for badge_type, rule in RULES.items():
+        Badge.objects.filter(badge_type=badge_type).update(**rule)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_userbadge_evaluated_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='badge',
+            name='rule_comparison',
+            field=models.CharField(blank=True, choices=[('budget', 'Within budget'), ('peer_average', 'Below peers')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='rule_consecutive',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='rule_period',
+            field=models.CharField(blank=True, choices=[('day', 'Day'), ('month', 'Month')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='rule_tolerance',
+            field=models.DecimalField(decimal_places=2, default=1, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='rule_window',
+            field=models.CharField(blank=True, choices=[('month', 'Current month'), ('days', 'Rolling days'), ('months', 'Calendar months')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='rule_window_length',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_badge_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def import_spending(apps, schema_editor):
+    # One ledger row per existing Spending total, so every Spending row is the sum of its transactions
+    Spending = apps.get_model('core', 'Spending')
+    Transaction = apps.get_model('core', 'Transaction')
+    batch = []
+    rows = Spending.objects.exclude(amount=0).filter(date__isnull=False).order_by('id')
+    for user_id, category, date, amount in rows.values_list('user_id', 'category', 'date', 'amount').iterator(chunk_size=5000):
+        batch.append(Transaction(user_id=user_id, category=category, date=date, amount=amount, source='import'))
+        if len(batch) >= 5000:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_badge_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('groceries', 'Groceries'), ('transportation', 'Transportation'), ('healthcare', 'Healthcare'), ('savings', 'Savings'), ('other', 'Other')], max_length=32)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateField()),
+                ('merchant', models.CharField(blank=True, max_length=255)),
+                ('source', models.CharField(choices=[('receipt', 'Receipt'), ('backfill', 'Backfill'), ('bulk', 'Bulk import'), ('adjustment', 'Manual adjustment'), ('import', 'Pre-ledger total')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'date'], name='core_transa_user_id_190a3b_idx')],
+            },
+        ),
+        migrations.RunPython(import_spending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def populate_monthly_spending(apps, schema_editor):
+    Spending = apps.get_model('core', 'Spending')
+    MonthlySpending = apps.get_model('core', 'MonthlySpending')
+    monthly = (
+        Spending.objects
+        .filter(date__isnull=False)
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'category', 'month')
+        .annotate(total=Sum('amount'), rows=Count('id'))
+        .order_by()
+    )
+    batch = []
+    for row in monthly.iterator(chunk_size=5000):
+        batch.append(MonthlySpending(
+            user_id=row['user_id'], category=row['category'], month=row['month'],
+            amount=row['total'] or 0, row_count=row['rows'],
+        ))
+        if len(batch) >= 5000:
+            MonthlySpending.objects.bulk_create(batch)
+            batch = []
+    MonthlySpending.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_transaction_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySpending',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('groceries', 'Groceries'), ('transportation', 'Transportation'), ('healthcare', 'Healthcare'), ('savings', 'Savings'), ('other', 'Other')], max_length=32)),
+                ('month', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('row_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spending', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'category'], name='core_monthl_month_58fd1a_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyspending',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'month'), name='uniq_monthly_user_cat_month'),
+        ),
+        migrations.RunPython(populate_monthly_spending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+TABLE = 'core_spending'
+MONTHS_AHEAD = 3
+MONTHS_BACK = 120  # Older rows (outliers such as year 1 typos) stay in the default partition
+
+
+def _next_month(month_start):
+    return (month_start + timedelta(days=32)).replace(day=1)
+
+
+def _table_definition(cursor, table):
+    # Unique and foreign key constraints, and the indexes that do not back a constraint,
+    # as SQL that recreates them on a new table of the same name
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = %s::regclass AND NOT EXISTS ("
+        "SELECT 1 FROM pg_constraint WHERE conrelid = i.indrelid AND conindid = i.indexrelid)",
+        [table],
+    )
+    indexes = cursor.fetchall()
+    return constraints, indexes
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Recreate core_spending as a table partitioned by month on `date`, or back
+    as a plain table, keeping its columns, identity sequence position,
+    constraint and index names and rows. Rewrites the whole table.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    old = f'{TABLE}_old'
+    with schema_editor.connection.cursor() as cursor:
+        constraints, indexes = _table_definition(cursor, TABLE)
+
+        # Move the current table aside, freeing its names
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+        cursor.execute(f"ALTER SEQUENCE {TABLE}_id_seq RENAME TO {old}_id_seq")
+        for name, contype, _ in constraints:
+            if contype != 'p':
+                cursor.execute(f'ALTER TABLE {old} DROP CONSTRAINT {name}')
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+
+        partition_by = ' PARTITION BY RANGE (date)' if partitioned else ''
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY){partition_by}'
+        )
+        # A partitioned table's unique keys must include `date`, which can be null,
+        # so it has no primary key; ids still come from the identity sequence
+        if partitioned:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_id_date_uniq UNIQUE (id, date)')
+        else:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        for name, contype, definition in constraints:
+            if contype != 'p' and name != f'{TABLE}_id_date_uniq':
+                cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+        for _, definition in indexes:
+            cursor.execute(definition.replace(' ON ONLY ', ' ON '))
+
+        if partitioned:
+            cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+            month_start = timezone.now().date().replace(day=1)
+            last = month_start
+            for _ in range(MONTHS_AHEAD):
+                last = _next_month(last)
+            floor = month_start
+            for _ in range(MONTHS_BACK):
+                floor = (floor - timedelta(days=1)).replace(day=1)
+            cursor.execute(f'SELECT MIN(date) FROM {old} WHERE date >= %s', [floor])
+            first = cursor.fetchone()[0]
+            month_start = min(first, month_start).replace(day=1) if first else month_start
+            while month_start <= last:
+                cursor.execute(
+                    f'CREATE TABLE {TABLE}_p{month_start:%Y_%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                    [month_start, _next_month(month_start)],
+                )
+                month_start = _next_month(month_start)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+            f"(SELECT last_value FROM {old}_id_seq), (SELECT is_called FROM {old}_id_seq))"
+        )
+        cursor.execute(f'DROP TABLE {old} CASCADE')
+
+
+def partition_spending(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_spending(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_monthly_spending'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_spending, unpartition_spending),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_partition_spending'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='spending',
+            name='uniq_spending_user_cat_date',
+        ),
+        migrations.RemoveIndex(
+            model_name='spending',
+            name='core_spendi_user_id_2e5ac8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='spending',
+            name='core_spendi_categor_c24cd7_idx',
+        ),
+        migrations.AlterField(
+            model_name='spending',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='spending', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='spending',
+            index=models.Index(fields=['user', 'date'], include=('category', 'amount'), name='spending_user_date_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spending',
+            index=models.Index(fields=['category', 'date'], include=('user', 'amount'), name='spending_cat_date_cover_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='spending',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'date'), include=('amount',), name='uniq_spending_user_cat_date'),
+        ),
+    ]
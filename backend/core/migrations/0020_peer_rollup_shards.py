@@ -0,0 +1,67 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:38
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def merge_shards(apps, schema_editor):
+    # Back to one row per rollup key, so the unsharded unique constraints can be restored
+    aggregates = {'sum_total': Sum('total'), 'rows': Sum('row_count'), 'squares': Sum('sum_squares')}
+    for model_name, key in (
+        ('PeerCategoryStats', ('category', 'month')),
+        ('CohortCategoryStats', ('cohort_type', 'cohort_key', 'category')),
+    ):
+        model = apps.get_model('core', model_name)
+        merged = [
+            model(
+                shard=0, total=row.pop('sum_total'), row_count=row.pop('rows'), sum_squares=row.pop('squares'), **row
+            )
+            for row in model.objects.values(*key).annotate(**aggregates).order_by()
+        ]
+        model.objects.all().delete()
+        model.objects.bulk_create(merged)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_spending_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='cohortcategorystats',
+            name='uniq_cohortstats_cohort_cat',
+        ),
+        migrations.RemoveConstraint(
+            model_name='peercategorystats',
+            name='uniq_peerstats_cat_month',
+        ),
+        migrations.RemoveConstraint(
+            model_name='peercategorystats',
+            name='uniq_peerstats_cat_alltime',
+        ),
+        migrations.AddField(
+            model_name='cohortcategorystats',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='peercategorystats',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, merge_shards),
+        migrations.AddConstraint(
+            model_name='cohortcategorystats',
+            constraint=models.UniqueConstraint(fields=('cohort_type', 'cohort_key', 'category', 'shard'), name='uniq_cohortstats_cohort_cat'),
+        ),
+        migrations.AddConstraint(
+            model_name='peercategorystats',
+            constraint=models.UniqueConstraint(fields=('category', 'month', 'shard'), name='uniq_peerstats_cat_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='peercategorystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('month__isnull', True)), fields=('category', 'shard'), name='uniq_peerstats_cat_alltime'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:39
+
+import math
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+RELATIVE_ACCURACY = 0.01
+SHARDS = 16  # AnalyticsService.ROLLUP_SHARDS when this was written
+
+
+def _sketch_json(totals):
+    # Frozen copy of QuantileSketch(RELATIVE_ACCURACY): add() for each total, then to_json()
+    log_gamma = math.log((1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY))
+    bins = Counter(math.ceil(math.log(float(total)) / log_gamma) for total in totals if total and total > 0)
+    return {'alpha': RELATIVE_ACCURACY, 'bins': {str(index): count for index, count in bins.items()}}
+
+
+def shard_sketches(apps, schema_editor):
+    # A sketch cannot be split, so every month's sketches are rebuilt per shard
+    Spending = apps.get_model('core', 'Spending')
+    SpendingSketch = apps.get_model('core', 'SpendingSketch')
+
+    user_months = (
+        Spending.objects.filter(date__isnull=False)
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'category', 'month')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    totals = {}
+    for row in user_months.iterator(chunk_size=5000):
+        totals.setdefault((row['category'], row['month'], row['user_id'] % SHARDS), []).append(row['total'])
+
+    SpendingSketch.objects.all().delete()
+    SpendingSketch.objects.bulk_create(
+        SpendingSketch(category=category, month=month, shard=shard, sketch=_sketch_json(shard_totals))
+        for (category, month, shard), shard_totals in totals.items()
+    )
+
+
+def unshard_sketches(apps, schema_editor):
+    Spending = apps.get_model('core', 'Spending')
+    SpendingSketch = apps.get_model('core', 'SpendingSketch')
+
+    user_months = (
+        Spending.objects.filter(date__isnull=False)
+        .annotate(month=TruncMonth('date'))
+        .values('user_id', 'category', 'month')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    totals = {}
+    for row in user_months.iterator(chunk_size=5000):
+        totals.setdefault((row['category'], row['month']), []).append(row['total'])
+
+    SpendingSketch.objects.all().delete()
+    SpendingSketch.objects.bulk_create(
+        SpendingSketch(category=category, month=month, sketch=_sketch_json(month_totals))
+        for (category, month), month_totals in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_peer_rollup_shards'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='spendingsketch',
+            name='uniq_sketch_cat_month',
+        ),
+        migrations.AddField(
+            model_name='spendingsketch',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(shard_sketches, unshard_sketches),
+        migrations.AddConstraint(
+            model_name='spendingsketch',
+            constraint=models.UniqueConstraint(fields=('category', 'month', 'shard'), name='uniq_sketch_cat_month'),
+        ),
+    ]
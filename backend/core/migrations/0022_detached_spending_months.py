@@ -0,0 +1,77 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:41
+
+from datetime import date
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_sum_squares(apps, schema_editor):
+    Spending = apps.get_model('core', 'Spending')
+    MonthlySpending = apps.get_model('core', 'MonthlySpending')
+    squares = {
+        (row['user_id'], row['category'], row['month']): row['squares']
+        for row in (
+            Spending.objects
+            .filter(date__isnull=False)
+            .annotate(month=TruncMonth('date'))
+            .values('user_id', 'category', 'month')
+            .annotate(squares=Sum(F('amount') * F('amount')))
+            .order_by()
+            .iterator(chunk_size=5000)
+        )
+    }
+    batch = []
+    for row in MonthlySpending.objects.only('user_id', 'category', 'month').iterator(chunk_size=5000):
+        row.sum_squares = squares.get((row.user_id, row.category, row.month)) or 0
+        batch.append(row)
+        if len(batch) >= 5000:
+            MonthlySpending.objects.bulk_update(batch, ['sum_squares'])
+            batch = []
+    MonthlySpending.objects.bulk_update(batch, ['sum_squares'])
+
+
+def record_detached_months(apps, schema_editor):
+    # Monthly partitions detached before this migration: core_spending_pYYYY_MM tables
+    # that are no longer attached to core_spending
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    DetachedSpendingMonth = apps.get_model('core', 'DetachedSpendingMonth')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_class c "
+            "WHERE c.relkind = 'r' AND c.relname ~ '^core_spending_p[0-9]{4}_[0-9]{2}$' "
+            "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+        )
+        names = [name for name, in cursor.fetchall()]
+    DetachedSpendingMonth.objects.bulk_create(
+        DetachedSpendingMonth(month=date(int(name[-7:-3]), int(name[-2:]), 1), table_name=name)
+        for name in names
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_spending_sketch_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetachedSpendingMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('table_name', models.CharField(max_length=63)),
+                ('detached_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='monthlyspending',
+            name='sum_squares',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=30),
+        ),
+        migrations.RunPython(populate_sum_squares, migrations.RunPython.noop),
+        migrations.RunPython(record_detached_months, migrations.RunPython.noop),
+    ]
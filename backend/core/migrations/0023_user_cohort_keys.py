@@ -0,0 +1,48 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:47
+
+from django.db import migrations, models
+
+
+def _normalize(value):
+    # Frozen copy of core.models.normalize_cohort_value
+    return ' '.join((value or '').split()).lower()
+
+
+def populate_cohort_keys(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    batch = []
+    for user in User.objects.only('id', 'university', 'city', 'country').iterator(chunk_size=5000):
+        user.university_key = _normalize(user.university)
+        user.city_key = _normalize(user.city)
+        user.country_key = _normalize(user.country)
+        batch.append(user)
+        if len(batch) >= 5000:
+            User.objects.bulk_update(batch, ['university_key', 'city_key', 'country_key'])
+            batch = []
+    User.objects.bulk_update(batch, ['university_key', 'city_key', 'country_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_detached_spending_months'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='city_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='country_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='university_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=180),
+        ),
+        migrations.RunPython(populate_cohort_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_user_cohort_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='source',
+            field=models.CharField(choices=[('receipt', 'Receipt'), ('backfill', 'Backfill'), ('bulk', 'Bulk import'), ('adjustment', 'Manual adjustment'), ('import', 'Pre-ledger total'), ('seed', 'Seed data')], max_length=20),
+        ),
+    ]
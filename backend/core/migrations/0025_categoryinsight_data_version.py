@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_transaction_seed_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryinsight',
+            name='data_version',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -3,6 +3,14 @@ from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
 
+def normalize_cohort_value(value) -> str:
+    """
+    Cohort key of a university, city or country name: lowercased, with
+    whitespace trimmed and runs of it collapsed to one space. '' if unset.
+    """
+    return " ".join((value or "").split()).lower()
+
+
 
 class User(AbstractUser):
     # Existing
@@ -15,6 +23,23 @@ class User(AbstractUser):
     country = models.CharField(max_length=120, blank=True)
     university = models.CharField(max_length=180, blank=True)
 
+    # normalize_cohort_value of the fields above, kept in step by save(), for cohort filters
+    city_key = models.CharField(max_length=120, blank=True, db_index=True, editable=False)
+    country_key = models.CharField(max_length=120, blank=True, db_index=True, editable=False)
+    university_key = models.CharField(max_length=180, blank=True, db_index=True, editable=False)
+
+    COHORT_FIELDS = ("university", "city", "country")
+
+    def save(self, *args, **kwargs):
+        for field in self.COHORT_FIELDS:
+            setattr(self, f"{field}_key", normalize_cohort_value(getattr(self, field)))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, *(
+                f"{field}_key" for field in self.COHORT_FIELDS if field in update_fields
+            )}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.username
 
@@ -58,24 +83,107 @@ class Meta:
 
 
 class Spending(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="spending")
+    # The (user, ...) indexes below already serve user lookups
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="spending", db_index=False)
     category = models.CharField(max_length=32, choices=Category.choices)
     amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     date = models.DateField(default=None, null=True, blank=True)
 
     class Meta:
+        # The B-tree indexes carry the columns the hot queries read (see the
+        # benchmark_spending_indexes command), so those are index-only scans
         constraints = [
-            models.UniqueConstraint(fields=["user", "category", "date"], name="uniq_spending_user_cat_date"),
+            # One user's rows per category: own totals, single-row reads and the upsert's conflict target
+            models.UniqueConstraint(
+                fields=["user", "category", "date"], include=["amount"], name="uniq_spending_user_cat_date"
+            ),
         ]
         indexes = [
-            models.Index(fields=["user", "date"]),
-            models.Index(fields=["category", "date"]),
+            # One or many users' rows since a date (daily badge rules, batch insights)
+            models.Index(fields=["user", "date"], include=["category", "amount"], name="spending_user_date_cover_idx"),
+            # Everyone's rows in a category over a date range (peer averages)
+            models.Index(fields=["category", "date"], include=["user", "amount"], name="spending_cat_date_cover_idx"),
         ]
 
     def __str__(self):
         return f"{self.user.username} - {self.category}: {self.amount} ({self.date})"
 
 
+class MonthlySpending(models.Model):
+    """
+    Per-(user, category, month) sums of Spending, kept in sync with every
+    Spending write (see AnalyticsService.record_spending_change). Reads that
+    only need month granularity use this instead of summing daily rows.
+
+    Rows outlive the Spending partitions they summarize: once a month is
+    detached (see DetachedSpendingMonth) they are its only record, and the
+    all-time figures and rollup rebuilds are derived from them.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="monthly_spending")
+    category = models.CharField(max_length=32, choices=Category.choices)
+    month = models.DateField()  # First day of the month
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    row_count = models.IntegerField(default=0)  # Spending rows in the month; 0 = as if the row did not exist
+    sum_squares = models.DecimalField(max_digits=30, decimal_places=4, default=0)  # Of the rows' amounts
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category", "month"], name="uniq_monthly_user_cat_month"),
+        ]
+        indexes = [
+            models.Index(fields=["month", "category"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category}: {self.amount} ({self.month:%Y-%m})"
+
+
+class DetachedSpendingMonth(models.Model):
+    """
+    A month whose Spending partition was detached (see
+    SpendingPartitionService.detach_before). Its rows are no longer in
+    Spending; MonthlySpending keeps its totals and rebuilds leave them alone.
+    """
+    month = models.DateField(unique=True)  # First day of the month
+    table_name = models.CharField(max_length=63)  # The detached table, kept for archiving
+    detached_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} ({self.table_name})"
+
+
+class TransactionSource(models.TextChoices):
+    RECEIPT = "receipt", "Receipt"
+    BACKFILL = "backfill", "Backfill"
+    BULK = "bulk", "Bulk import"
+    ADJUSTMENT = "adjustment", "Manual adjustment"  # Difference written by setting a total directly
+    IMPORT = "import", "Pre-ledger total"            # Spending that existed before the ledger
+    SEED = "seed", "Seed data"                       # Written by the seed_* management commands
+
+
+class Transaction(models.Model):
+    """
+    Append-only ledger of individual spending items. Spending holds the
+    per-(user, category, date) sums of these rows and is updated in the same
+    transaction as each insert (see services.add_spending).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions")
+    category = models.CharField(max_length=32, choices=Category.choices)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateField()
+    merchant = models.CharField(max_length=255, blank=True)
+    source = models.CharField(max_length=20, choices=TransactionSource.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.merchant or self.category}: {self.amount} ({self.date})"
+
+
 class BadgeType(models.TextChoices):
     BUDGET_MASTER = "budget_master", "Budget Master"
     SAVINGS_CHAMPION = "savings_champion", "Savings Champion"
@@ -87,9 +195,30 @@ class BadgeType(models.TextChoices):
     YEAR_LEGEND = "year_legend", "Year Legend"
 
 
+class BadgeRulePeriod(models.TextChoices):
+    DAY = "day", "Day"
+    MONTH = "month", "Month"
+
+
+class BadgeRuleWindow(models.TextChoices):
+    MONTH = "month", "Current month"        # From the 1st of this month
+    DAYS = "days", "Rolling days"           # Last rule_window_length days
+    MONTHS = "months", "Calendar months"    # Last rule_window_length months, including this one
+
+
+class BadgeRuleComparison(models.TextChoices):
+    BUDGET = "budget", "Within budget"               # Period total <= budget (per day: budget / 30) x tolerance
+    PEER_AVERAGE = "peer_average", "Below peers"     # Period total < peer average x tolerance
+
+
 class Badge(models.Model):
     """
     Badge definitions - each badge type with its metadata.
+
+    Badges with a rule_period are declarative: progress is the number of
+    periods in the window (or the current streak, if rule_consecutive) whose
+    spending in `category` (all categories if empty) passes rule_comparison.
+    Badges without one use the hand-written rule for their badge_type.
     """
     badge_type = models.CharField(max_length=32, choices=BadgeType.choices, unique=True)
     title = models.CharField(max_length=100)
@@ -100,6 +229,14 @@ class Badge(models.Model):
     target_value = models.IntegerField(default=30)  # Target to earn (e.g., 30 days)
     category = models.CharField(max_length=32, choices=Category.choices, null=True, blank=True)  # Related category if applicable
 
+    # Declarative rule (see BadgeRule)
+    rule_period = models.CharField(max_length=10, choices=BadgeRulePeriod.choices, blank=True)
+    rule_window = models.CharField(max_length=10, choices=BadgeRuleWindow.choices, blank=True)
+    rule_window_length = models.PositiveIntegerField(null=True, blank=True)  # Days or months, per rule_window
+    rule_comparison = models.CharField(max_length=20, choices=BadgeRuleComparison.choices, blank=True)
+    rule_tolerance = models.DecimalField(max_digits=5, decimal_places=2, default=1)
+    rule_consecutive = models.BooleanField(default=False)  # Count the current streak instead of all periods
+
     def __str__(self):
         return self.title
 
@@ -113,10 +250,173 @@ class UserBadge(models.Model):
     progress = models.IntegerField(default=0)  # Current progress value
     earned = models.BooleanField(default=False)
     earned_at = models.DateTimeField(null=True, blank=True)
+    evaluated_on = models.DateField(null=True, blank=True)  # Day progress was last computed
 
     class Meta:
         unique_together = ("user", "badge")
 
     def __str__(self):
         status = "✓" if self.earned else f"{self.progress}/{self.badge.target_value}"
-        return f"{self.user.username} - {self.badge.title}: {status}"
\ No newline at end of file
+        return f"{self.user.username} - {self.badge.title}: {status}"
+
+class PeerCategoryStats(models.Model):
+    """
+    Running spending totals per category across all users.
+    Rows with a month hold that month's figures, the rows with month=None hold all time.
+    Each is split over shards by user id, so concurrent writers rarely update the
+    same row; readers sum the shards.
+    """
+    category = models.CharField(max_length=32, choices=Category.choices)
+    month = models.DateField(null=True, blank=True)  # First day of the month, None = all time
+    shard = models.PositiveSmallIntegerField(default=0)  # user_id % AnalyticsService.ROLLUP_SHARDS
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    row_count = models.BigIntegerField(default=0)  # Number of Spending rows
+    sum_squares = models.DecimalField(max_digits=30, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "month", "shard"], name="uniq_peerstats_cat_month"),
+            models.UniqueConstraint(
+                fields=["category", "shard"],
+                condition=models.Q(month__isnull=True),
+                name="uniq_peerstats_cat_alltime",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.category} ({self.month or 'all time'}, shard {self.shard}): {self.total} / {self.row_count}"
+
+
+class CohortType(models.TextChoices):
+    UNIVERSITY = "university", "University"
+    CITY = "city", "City"
+    AGE_BAND = "age_band", "Age Band"
+
+
+class CohortCategoryStats(models.Model):
+    """
+    Running all-time spending totals per category for a cohort of users
+    (same university, same city or same age band), sharded like PeerCategoryStats.
+    """
+    cohort_type = models.CharField(max_length=16, choices=CohortType.choices)
+    cohort_key = models.CharField(max_length=180)  # Normalized university/city name or age band label
+    category = models.CharField(max_length=32, choices=Category.choices)
+    shard = models.PositiveSmallIntegerField(default=0)  # user_id % AnalyticsService.ROLLUP_SHARDS
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    row_count = models.BigIntegerField(default=0)  # Number of Spending rows
+    sum_squares = models.DecimalField(max_digits=30, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cohort_type", "cohort_key", "category", "shard"],
+                name="uniq_cohortstats_cohort_cat",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.cohort_type}={self.cohort_key} {self.category}: {self.total} / {self.row_count}"
+
+
+class SpendingSketch(models.Model):
+    """
+    Quantile sketch of users' monthly spending totals for one category and month,
+    sharded like PeerCategoryStats; readers merge the shards.
+    See core.quantile_sketch.QuantileSketch for the stored format.
+    """
+    category = models.CharField(max_length=32, choices=Category.choices)
+    month = models.DateField()  # First day of the month
+    shard = models.PositiveSmallIntegerField(default=0)  # user_id % AnalyticsService.ROLLUP_SHARDS
+    sketch = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "month", "shard"], name="uniq_sketch_cat_month"),
+        ]
+
+    def __str__(self):
+        return f"{self.category} ({self.month}, shard {self.shard})"
+
+
+class CategoryInsight(models.Model):
+    """
+    Precomputed category insight for one user, written by the batch engine
+    (see core.batch_analytics_service) and read by insights/categories/.
+    Rows are dropped when the user's data changes, and ignored if their
+    data_version is not the user's current CacheService.user_version.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="category_insights")
+    category = models.CharField(max_length=32, choices=Category.choices)
+    month = models.DateField()  # First day of the month the insight describes
+    spending = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    budget = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    peer_average = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    budget_percentage = models.FloatField(default=0)
+    peer_percentage = models.FloatField(default=0)
+    percentile = models.IntegerField(null=True, blank=True)
+    insight = models.CharField(max_length=255)
+    computed_at = models.DateTimeField()
+    data_version = models.BigIntegerField(null=True, blank=True)  # User's data version the row was computed from
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category"], name="uniq_insight_user_cat"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category} ({self.month}): {self.insight}"
+
+
+class LeaderboardSnapshot(models.Model):
+    """
+    Materialized leaderboard for one board (a category or "total") and period,
+    refreshed by the refresh_leaderboards command.
+    """
+    board = models.CharField(max_length=32)  # Category value or "total"
+    period = models.CharField(max_length=10)  # "month" or "year"
+    total_users = models.IntegerField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["board", "period"], name="uniq_snapshot_board_period"),
+        ]
+
+    def __str__(self):
+        return f"{self.board}/{self.period} ({self.computed_at})"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    One user's rank and amount in a LeaderboardSnapshot, plus their rank
+    within each cohort (users sharing a university, city or country).
+    Cohort keys are lowercased and trimmed; empty when the profile has no value.
+    """
+    snapshot = models.ForeignKey(LeaderboardSnapshot, on_delete=models.CASCADE, related_name="entries")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="leaderboard_entries")
+    rank = models.IntegerField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    university = models.CharField(max_length=180, blank=True, default="")
+    university_rank = models.IntegerField(null=True, blank=True)
+    city = models.CharField(max_length=120, blank=True, default="")
+    city_rank = models.IntegerField(null=True, blank=True)
+    country = models.CharField(max_length=120, blank=True, default="")
+    country_rank = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["snapshot", "user"], name="uniq_entry_snapshot_user"),
+        ]
+        indexes = [
+            models.Index(fields=["snapshot", "amount", "user"]),  # keyset paging
+            models.Index(fields=["snapshot", "university", "amount", "user"]),
+            models.Index(fields=["snapshot", "city", "amount", "user"]),
+            models.Index(fields=["snapshot", "country", "amount", "user"]),
+        ]
+
+    def __str__(self):
+        return f"{self.snapshot} #{self.rank}: {self.user.username} ({self.amount})"
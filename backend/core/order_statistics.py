@@ -0,0 +1,124 @@
+import random
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # elements skipped by each forward link
+
+
+class OrderStatisticList:
+    """
+    Sorted collection of unique, comparable keys with positional queries
+    (an indexable skip list).
+
+    Insert, remove and count_less take O(log n) expected time; iterating
+    the first k keys takes O(log n + k). Not thread-safe: callers hold a lock.
+    """
+
+    MAX_LEVEL = 32
+
+    def __init__(self, keys=()):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._rng = random.Random()
+        for key in sorted(keys):
+            self.insert(key)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and self._rng.random() < 0.5:
+            level += 1
+        return level
+
+    def _path(self, key):
+        """Last node before `key` on every level, with its position (-1 = head)."""
+        update = [self._head] * self.MAX_LEVEL
+        positions = [-1] * self.MAX_LEVEL
+        node, position = self._head, -1
+        for level in range(self._level - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            positions[level] = position
+        return update, positions
+
+    def insert(self, key):
+        update, positions = self._path(key)
+        following = update[0].next[0]
+        if following is not None and following.key == key:
+            raise KeyError(key)
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                positions[i] = -1
+                self._head.width[i] = self._size + 1
+            self._level = level
+
+        node = _Node(key, level)
+        position = positions[0] + 1
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            # Split the old link at the new node
+            before = position - positions[i]
+            node.width[i] = update[i].width[i] - before + 1
+            update[i].width[i] = before
+        for i in range(level, self._level):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        update, _ = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for i in range(self._level):
+            if update[i].next[i] is node:
+                update[i].next[i] = node.next[i]
+                update[i].width[i] += node.width[i] - 1
+            else:
+                update[i].width[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def count_less(self, key) -> int:
+        """Number of keys strictly less than `key`."""
+        _, positions = self._path(key)
+        return positions[0] + 1
+
+    def first(self, k: int):
+        """The k smallest keys in order."""
+        return self.slice(0, k)
+
+    def slice(self, start: int, stop: int):
+        """Keys at positions start..stop-1 in order, like list slicing with non-negative bounds."""
+        start = max(start, 0)
+        if start >= min(stop, self._size):
+            return []
+
+        # Descend to the node at position `start`
+        node, position = self._head, -1
+        for level in range(self._level - 1, -1, -1):
+            while node.next[level] is not None and position + node.width[level] <= start:
+                position += node.width[level]
+                node = node.next[level]
+
+        keys = []
+        while node is not None and position < stop:
+            keys.append(node.key)
+            node = node.next[0]
+            position += 1
+        return keys
@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+
+from .models import DetachedSpendingMonth, Spending
+
+
+class SpendingPartitionService:
+    """
+    Monthly partitions of the Spending table (PostgreSQL range partitioning
+    on `date`, set up by migration 0018).
+
+    Each calendar month lives in its own partition, core_spending_pYYYY_MM,
+    so date-range scans only touch the months they ask for and vacuum and
+    index maintenance work month by month. Rows without a date, or dated in
+    a month that has no partition yet, land in the default partition;
+    creating the month's partition moves them out of it.
+
+    Detached partitions stay in the database as ordinary tables, to be
+    archived or dropped, and are recorded in DetachedSpendingMonth. Their
+    totals stay in MonthlySpending, which all-time and monthly readers and
+    the rollup rebuilds use, so only readers of individual rows lose them.
+    """
+
+    PARTITION_NAME = "{table}_p{month:%Y_%m}"
+    DEFAULT_PARTITION = "{table}_default"
+    # Readers of individual Spending rows (badge day windows, 30-day averages) look back
+    # at most a year; longer and all-time figures come from MonthlySpending
+    MIN_RETAINED_MONTHS = 13
+
+    @staticmethod
+    def table() -> str:
+        return Spending._meta.db_table
+
+    @staticmethod
+    def is_partitioned() -> bool:
+        if connection.vendor != "postgresql":
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+                [SpendingPartitionService.table()],
+            )
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def next_month(month_start) -> date:
+        return (month_start + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def partition_name(month_start) -> str:
+        return SpendingPartitionService.PARTITION_NAME.format(table=SpendingPartitionService.table(), month=month_start)
+
+    @staticmethod
+    def list_partitions() -> dict:
+        """
+        Attached monthly partitions.
+
+        Returns:
+            Dict of first day of the month -> partition table name, oldest first
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(%s)",
+                [SpendingPartitionService.table()],
+            )
+            rows = cursor.fetchall()
+
+        partitions = {}
+        for name, bound in rows:
+            # FOR VALUES FROM ('2025-01-01') TO ('2025-02-01'); the default partition has no range
+            if not bound.startswith("FOR VALUES FROM"):
+                continue
+            partitions[date.fromisoformat(bound.split("'")[1])] = name
+        return dict(sorted(partitions.items()))
+
+    @staticmethod
+    def create_partition(month_start) -> bool:
+        """
+        Create and attach the partition for one month, moving any of its rows
+        out of the default partition first. Safe to run concurrently.
+
+        Returns:
+            Whether the partition was created
+        """
+        table = SpendingPartitionService.table()
+        name = SpendingPartitionService.partition_name(month_start)
+        default = SpendingPartitionService.DEFAULT_PARTITION.format(table=table)
+        month_end = SpendingPartitionService.next_month(month_start)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Serializes partition changes; writes to other partitions carry on
+            cursor.execute(f"LOCK TABLE {default} IN ACCESS EXCLUSIVE MODE")
+            if month_start in SpendingPartitionService.list_partitions():
+                return False
+
+            # Build it standalone and attach it, so the rows moved out of the default
+            # partition already satisfy the new range when the attach validates it
+            cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {default} WHERE date >= %s AND date < %s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved",
+                [month_start, month_end],
+            )
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                [month_start, month_end],
+            )
+        return True
+
+    @staticmethod
+    def ensure_partitions(today, months_ahead=3) -> list:
+        """
+        Create the partitions for this month and the next `months_ahead` months.
+
+        Returns:
+            First day of each month whose partition was created
+        """
+        created = []
+        month_start = today.replace(day=1)
+        for _ in range(months_ahead + 1):
+            if SpendingPartitionService.create_partition(month_start):
+                created.append(month_start)
+            month_start = SpendingPartitionService.next_month(month_start)
+        return created
+
+    @staticmethod
+    def detach_before(month_start) -> list:
+        """
+        Detach every monthly partition older than `month_start`. The tables
+        are kept; their rows no longer appear in Spending, and each month is
+        recorded in DetachedSpendingMonth so rebuilds keep its MonthlySpending rows.
+
+        Returns:
+            Names of the detached tables
+        """
+        table = SpendingPartitionService.table()
+        detached = []
+        for partition_month, name in SpendingPartitionService.list_partitions().items():
+            if partition_month >= month_start:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                DetachedSpendingMonth.objects.create(month=partition_month, table_name=name)
+            detached.append(name)
+        return detached
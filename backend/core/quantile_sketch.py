@@ -0,0 +1,88 @@
+import math
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch-style).
+
+    Values are counted in logarithmically sized buckets, so every quantile it
+    returns is within `relative_accuracy` of the true value. Unlike KLL or
+    t-digest, bucket counts can also be decremented, which lets a user's
+    monthly total move from one bucket to another as new spending arrives.
+
+    Only positive values are tracked; zero and negative values are ignored.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, bins: dict = None):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = dict(bins or {})  # bucket index -> count
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint (in relative terms) of the bucket (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, count: int = 1):
+        value = float(value)
+        if value <= 0:
+            return
+        index = self._index(value)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def remove(self, value, count: int = 1):
+        value = float(value)
+        if value <= 0:
+            return
+        index = self._index(value)
+        remaining = self.bins.get(index, 0) - count
+        if remaining > 0:
+            self.bins[index] = remaining
+        else:
+            self.bins.pop(index, None)
+
+    def merge(self, other: "QuantileSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def rank(self, value) -> int:
+        """Number of tracked values less than or equal to `value` (bucket resolution)."""
+        value = float(value)
+        if value <= 0:
+            return 0
+        index = self._index(value)
+        return sum(count for i, count in self.bins.items() if i <= index)
+
+    def quantile(self, q: float):
+        """Approximate value at quantile q (0..1), or None if the sketch is empty."""
+        total = self.count
+        if total == 0:
+            return None
+        target = q * (total - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > target:
+                return self._value(index)
+        return self._value(max(self.bins))
+
+    def to_json(self) -> dict:
+        return {
+            "alpha": self.relative_accuracy,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "QuantileSketch":
+        data = data or {}
+        bins = {int(index): count for index, count in (data.get("bins") or {}).items()}
+        return cls(relative_accuracy=data.get("alpha", 0.01), bins=bins)
@@ -1,22 +1,404 @@
+from collections import defaultdict
+from datetime import date as date_type
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.utils import timezone
+from django.db import connection, transaction
 from django.db.models import Sum
-from .models import Spending, Budget, Category
+from .models import (
+    Spending, Budget, Category, CategoryInsight, DetachedSpendingMonth, Transaction, TransactionSource,
+)
+from .analytics_service import AnalyticsService
+from .badge_service import BadgeService
+from .cache_service import CacheService
+from .leaderboard_memory import leaderboard_memory
+
+# Once a user's rows exist for a month they only need checking again next month.
+# Marked in the shared cache only (one cache read per call), so forget_user_rows reaches every worker.
+INITIALIZED_KEY = "user-rows:{user_id}:{month}"
+INITIALIZED_TIMEOUT = 60 * 60 * 24 * 32
+SPENDING_YEARS_BACK = 10  # Spending may be dated from January 1st this many years ago
+
 
 def ensure_user_rows(user):
-    for cat, _ in Category.choices:
-        Budget.objects.get_or_create(user=user, category=cat, defaults={"amount": 0})
-
-    today = timezone.now().date()
-    month_start = today.replace(day=1)
-
-    for cat, _ in Category.choices:
-        qs = Spending.objects.filter(user=user, category=cat, date=month_start)
-        if qs.exists():
-            if qs.count() > 1:
-                total = qs.aggregate(total=Sum("amount"))["total"] or 0
-                keep = qs.order_by("id").first()
-                keep.amount = total
-                keep.save(update_fields=["amount"])
-                qs.exclude(id=keep.id).delete()
-        else:
-            Spending.objects.create(user=user, category=cat, date=month_start, amount=0)
\ No newline at end of file
+    """
+    Make sure the user has a Budget row for every category and a Spending
+    row for every category on the 1st of the current month.
+
+    Missing rows are inserted with one INSERT ... ON CONFLICT DO NOTHING per
+    table; the user is then marked initialized for the month, so later calls
+    cost one cache read and no queries. The monthly_rollover command does the same for every
+    user ahead of time.
+    """
+    month_start = timezone.now().date().replace(day=1)
+    if cache.get(_initialized_key(user.id, month_start)):
+        return
+
+    with transaction.atomic():
+        new_budgets = [cat for _, cat in insert_missing_rows(Budget, [user.id], amount=0)]
+        new_spending = [cat for _, cat in insert_missing_rows(Spending, [user.id], date=month_start, amount=0)]
+
+        if new_budgets:
+            CacheService.bump_user(user.id)
+        AnalyticsService.record_empty_rows_created([(user, cat) for cat in new_spending], month_start)
+        if new_spending:
+            _bump_spending_versions(user)
+        if new_budgets or new_spending:
+            BadgeService.record_change(
+                user, spending=[(cat, month_start) for cat in new_spending], budgets=new_budgets
+            )
+        mark_initialized_on_commit([user.id], month_start)
+
+
+def create_month_rows(users, month_start) -> int:
+    """
+    ensure_user_rows for many users at once (see the monthly_rollover command):
+    two inserts for all of them, rollup row counts updated per category and
+    cohort rather than per row, and every user marked initialized for the month.
+    Safe to run concurrently with itself and with ensure_user_rows.
+
+    Returns:
+        Number of rows inserted
+    """
+    users_by_id = {user.id: user for user in users}
+    user_ids = list(users_by_id)
+
+    with transaction.atomic():
+        new_budgets = insert_missing_rows(Budget, user_ids, amount=0)
+        new_spending = insert_missing_rows(Spending, user_ids, date=month_start, amount=0)
+
+        AnalyticsService.record_empty_rows_created(
+            [(users_by_id[user_id], cat) for user_id, cat in new_spending], month_start
+        )
+        changed = {user_id for user_id, _ in new_budgets} | {user_id for user_id, _ in new_spending}
+        for user_id in changed:
+            CacheService.bump_user(user_id)
+        BadgeService.record_changes(
+            changed,
+            spending=[(cat, month_start) for cat in {cat for _, cat in new_spending}],
+            budgets={cat for _, cat in new_budgets},
+        )
+        mark_initialized_on_commit(user_ids, month_start)
+
+    return len(new_budgets) + len(new_spending)
+
+
+def insert_missing_rows(model, user_ids, **values) -> list:
+    """
+    Insert a row per (user, category) with the given column values, skipping
+    the ones that already exist (unique constraint on user + category [+ date]).
+    One statement; rows inserted concurrently by another transaction are
+    skipped rather than duplicated.
+
+    Returns:
+        (user_id, category) pairs that this call inserted
+    """
+    if not user_ids:
+        return []
+    columns = ["user_id", "category", *values]
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    params = []
+    # Sorted like the bulk writers, so concurrent inserts for a user lock rows in one order
+    for user_id in sorted(user_ids):
+        for cat in sorted(Category.values):
+            params += [user_id, cat, *values.values()]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {model._meta.db_table} ({', '.join(columns)}) "
+            f"VALUES {', '.join([row] * (len(user_ids) * len(Category.values)))} "
+            f"ON CONFLICT DO NOTHING RETURNING user_id, category",
+            params,
+        )
+        return cursor.fetchall()
+
+
+def _initialized_key(user_id, month_start):
+    return INITIALIZED_KEY.format(user_id=user_id, month=month_start.isoformat())
+
+
+def mark_initialized_on_commit(user_ids, month_start):
+    """Record that the users' rows for the month exist, once the current transaction commits."""
+    def mark():
+        cache.set_many({_initialized_key(user_id, month_start): True for user_id in user_ids}, timeout=INITIALIZED_TIMEOUT)
+
+    transaction.on_commit(mark)
+
+
+def forget_user_rows(user_id):
+    """Drop the initialized marker, e.g. after deleting a user's rows outside the app."""
+    cache.delete(_initialized_key(user_id, timezone.now().date().replace(day=1)))
+
+
+def spending_date_error(date, today=None):
+    """
+    Why spending cannot be recorded on `date`, or None if it can. Rows may
+    not be dated after today: month totals (MonthlySpending) would otherwise
+    count spending that has not happened yet. Nor more than
+    SPENDING_YEARS_BACK years back, which catches typos like year 1.
+    """
+    today = today or timezone.now().date()
+    if date > today:
+        return "Date cannot be in the future"
+    earliest = date_type(today.year - SPENDING_YEARS_BACK, 1, 1)
+    if date < earliest:
+        return f"Date cannot be before {earliest.isoformat()}"
+    return None
+
+
+def set_spending(user, category, date, amount):
+    """
+    Overwrite the amount of a user's Spending row for (category, date),
+    creating it if needed, and keep the peer rollups in sync.
+    """
+    with transaction.atomic():
+        obj, created = Spending.objects.select_for_update().get_or_create(
+            user=user,
+            category=category,
+            date=date,
+            defaults={"amount": 0},
+        )
+        old_amount = None if created else obj.amount
+        obj.amount = amount
+        # By id and date: Spending is partitioned by date and has no id-only key, so
+        # save() (WHERE id = ...) would probe every partition
+        Spending.objects.filter(id=obj.id, date=date).update(amount=amount)
+        if date is not None and amount != (old_amount or 0):
+            # The ledger records the difference, so the row stays the sum of its transactions
+            Transaction.objects.create(
+                user=user, category=category, date=date, amount=amount - (old_amount or 0),
+                source=TransactionSource.ADJUSTMENT,
+            )
+        AnalyticsService.record_spending_change(user, category, date, old_amount, obj.amount)
+        _bump_spending_versions(user)
+        BadgeService.record_change(user, spending=[(category, date)])
+    return obj
+
+
+def add_spending(user, category, date, amount, source, merchant=""):
+    """
+    Record a transaction in the ledger and add its amount to the user's
+    Spending row for (category, date), creating it if needed, and keep the
+    peer rollups in sync.
+
+    The amount is added in the database (see upsert_add_rows), so concurrent
+    adds to the same row never lose an update.
+    """
+    with transaction.atomic():
+        Transaction.objects.create(
+            user=user, category=category, date=date, amount=amount, merchant=merchant, source=source
+        )
+        (row_id, new_amount, inserted), = upsert_add_rows(user.id, [(category, date, amount)])
+        old_amount = None if inserted else new_amount - amount
+        AnalyticsService.record_spending_change(user, category, date, old_amount, new_amount)
+        _bump_spending_versions(user)
+        BadgeService.record_change(user, spending=[(category, date)])
+    return Spending(id=row_id, user=user, category=category, date=date, amount=new_amount)
+
+
+BULK_BATCH_SIZE = 1000  # Rows per upsert_add_rows call (4 parameters each)
+
+
+def add_spending_bulk(user, items, source=TransactionSource.BULK) -> dict:
+    """
+    Add many transactions to the ledger and to a user's Spending rows in one
+    transaction.
+
+    The ledger rows are bulk inserted; amounts are summed per (category,
+    date), then written with upsert_add_rows per BULK_BATCH_SIZE rows; the rollups
+    and every other side effect of add_spending run once for the whole set.
+
+    Args:
+        items: Validated (category, date, amount, merchant) tuples
+
+    Returns:
+        Dict of (category, date) -> row amount after the write
+    """
+    totals = defaultdict(Decimal)
+    for category, date, amount, _ in items:
+        totals[(category, date)] += amount
+    # Sorted so concurrent bulk writes for the same user lock rows in one order
+    rows = [(category, date, amount) for (category, date), amount in sorted(totals.items())]
+    if not rows:
+        return {}
+
+    changes = []
+    with transaction.atomic():
+        Transaction.objects.bulk_create(
+            [
+                Transaction(user=user, category=category, date=date, amount=amount, merchant=merchant, source=source)
+                for category, date, amount, merchant in items
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        for start in range(0, len(rows), BULK_BATCH_SIZE):
+            batch = rows[start:start + BULK_BATCH_SIZE]
+            for (category, date, amount), (_, new_amount, inserted) in zip(batch, upsert_add_rows(user.id, batch)):
+                changes.append((category, date, None if inserted else new_amount - amount, new_amount))
+
+        AnalyticsService.record_spending_changes(user, changes)
+        _bump_spending_versions(user)
+        BadgeService.record_change(user, spending=[(category, date) for category, date, _, _ in changes])
+    return {(category, date): new_amount for category, date, _, new_amount in changes}
+
+
+def delete_spending(user, **filters) -> int:
+    """
+    Delete a user's Spending rows matching `filters` (e.g. date__in=...)
+    together with their ledger transactions, and keep the peer rollups in
+    sync. For tools that remove data wholesale, such as the seed commands.
+
+    Returns:
+        Number of Spending rows deleted
+    """
+    with transaction.atomic():
+        rows = list(
+            Spending.objects.select_for_update().filter(user=user, **filters).values_list("category", "date", "amount")
+        )
+        if not rows:
+            return 0
+        Transaction.objects.filter(user=user, **filters).delete()
+        Spending.objects.filter(user=user, **filters).delete()
+
+        AnalyticsService.record_spending_changes(user, [(category, date, amount, None) for category, date, amount in rows])
+        _bump_spending_versions(user)
+        BadgeService.record_change(user, spending=[(category, date) for category, date, _ in rows])
+    # The month's empty rows may be gone; let ensure_user_rows recreate them
+    forget_user_rows(user.id)
+    return len(rows)
+
+
+def ledger_mismatches() -> list:
+    """
+    Spending rows whose amount differs from the sum of their ledger
+    transactions, including ledger sums with no Spending row. Undated rows
+    (which have no transactions) and detached months (whose rows are no
+    longer in Spending) are left out.
+
+    Returns:
+        (user_id, category, date, Spending amount or None, ledger total) tuples
+    """
+    detached = list(DetachedSpendingMonth.objects.values_list("month", flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COALESCE(s.user_id, t.user_id), COALESCE(s.category, t.category), COALESCE(s.date, t.date), "
+            f"s.amount, COALESCE(t.total, 0) "
+            f"FROM (SELECT user_id, category, date, amount FROM {Spending._meta.db_table} WHERE date IS NOT NULL) s "
+            f"FULL OUTER JOIN (SELECT user_id, category, date, SUM(amount) AS total "
+            f"FROM {Transaction._meta.db_table} GROUP BY user_id, category, date) t "
+            f"ON s.user_id = t.user_id AND s.category = t.category AND s.date = t.date "
+            f"WHERE COALESCE(s.amount, 0) <> COALESCE(t.total, 0) "
+            f"AND NOT (DATE_TRUNC('month', COALESCE(s.date, t.date))::date = ANY(%s::date[])) "
+            f"ORDER BY 1, 2, 3",
+            [detached],
+        )
+        return cursor.fetchall()
+
+
+def rebuild_spending_from_ledger(user, keys) -> list:
+    """
+    Set a user's Spending rows for the given (category, date) keys to the sum
+    of their ledger transactions, creating missing rows, and keep the peer
+    rollups in sync. See the reconcile_ledger command.
+
+    Returns:
+        (category, date, old amount, new amount) per row changed
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return []
+    categories = {category for category, _ in keys}
+    dates = {date for _, date in keys}
+
+    with transaction.atomic():
+        existing = {
+            (category, date): amount
+            for category, date, amount in Spending.objects.select_for_update()
+            .filter(user=user, category__in=categories, date__in=dates)
+            .values_list("category", "date", "amount")
+        }
+        ledger = {
+            (row["category"], row["date"]): row["total"]
+            for row in Transaction.objects.filter(user=user, category__in=categories, date__in=dates)
+            .values("category", "date").annotate(total=Sum("amount")).order_by()
+        }
+
+        changes = []
+        for key in keys:
+            old_amount = existing.get(key)
+            new_amount = ledger.get(key, Decimal("0"))
+            if old_amount == new_amount or (old_amount is None and not new_amount):
+                continue
+            category, date = key
+            if old_amount is None:
+                Spending.objects.create(user=user, category=category, date=date, amount=new_amount)
+            else:
+                Spending.objects.filter(user=user, category=category, date=date).update(amount=new_amount)
+            changes.append((category, date, old_amount, new_amount))
+
+        if changes:
+            AnalyticsService.record_spending_changes(user, changes)
+            _bump_spending_versions(user)
+            BadgeService.record_change(user, spending=[(category, date) for category, date, _, _ in changes])
+    return changes
+
+
+def upsert_add_rows(user_id, rows) -> list:
+    """
+    Add amounts to a user's Spending rows in the database, creating missing
+    rows: one INSERT ... ON CONFLICT DO NOTHING, then one UPDATE SET amount =
+    amount + v.amount for the rows that already existed. (A single ON CONFLICT
+    DO UPDATE cannot report which rows it inserted on the partitioned table.)
+
+    A row deleted by a concurrent transaction between the two statements is
+    neither inserted nor updated; both are repeated for those rows until
+    every row is written.
+
+    Args:
+        rows: (category, date, amount) with no (category, date) repeated
+
+    Returns:
+        (id, amount after the write, whether the row was inserted) per row, in order
+    """
+    table = Spending._meta.db_table
+    written = {}
+    with connection.cursor() as cursor:
+        pending = rows
+        while pending:
+            params = []
+            for category, date, amount in pending:
+                params += [user_id, category, date, amount]
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, category, date, amount) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(pending))} "
+                f"ON CONFLICT (user_id, category, date) DO NOTHING "
+                f"RETURNING id, category, date, amount",
+                params,
+            )
+            for row_id, category, date, amount in cursor.fetchall():
+                written[(category, date)] = (row_id, amount, True)
+
+            # The rest conflicted with an existing (or concurrently committed) row
+            existing = [row for row in pending if (row[0], row[1]) not in written]
+            if existing:
+                cursor.execute(
+                    f"UPDATE {table} s SET amount = s.amount + v.amount "
+                    f"FROM (VALUES {', '.join(['(%s, %s, %s)'] * len(existing))}) AS v (category, date, amount) "
+                    f"WHERE s.user_id = %s AND s.category = v.category AND s.date = v.date "
+                    f"RETURNING s.id, s.category, s.date, s.amount",
+                    [*[value for row in existing for value in row], user_id],
+                )
+                for row_id, category, date, amount in cursor.fetchall():
+                    written[(category, date)] = (row_id, amount, False)
+            pending = [row for row in existing if (row[0], row[1]) not in written]
+    return [written[(category, date)] for category, date, _ in rows]
+
+
+def _bump_spending_versions(user):
+    # A spending write changes the user's own numbers; other users' peer
+    # comparisons are invalidated with the rollups it changes (see CacheService).
+    # The user's batch insights are dropped so reads fall back to live numbers.
+    CategoryInsight.objects.filter(user=user).delete()
+    CacheService.bump_user(user.id)
+    leaderboard_memory.refresh_user_on_commit(user)
@@ -0,0 +1,152 @@
+import itertools
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics_service import AnalyticsService
+from core.badge_rules import BadgeRule
+from core.badge_service import BadgeService
+from core.models import (
+    Badge, BadgeRuleComparison, BadgeRulePeriod, BadgeRuleWindow, Budget, Category, User, UserBadge,
+)
+from core.services import add_spending, set_spending
+
+
+class BadgeRuleCompilerTests(TestCase):
+    """The compiled SQL must agree with the in-memory evaluator for every kind of rule."""
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        cls.today = today
+        cls.user_ids = []
+        for i in range(6):
+            user = User.objects.create(username=f"rules{i}")
+            cls.user_ids.append(user.id)
+            if i != 5:  # One user without budgets
+                for category in Category.values:
+                    Budget.objects.create(user=user, category=category, amount=Decimal(300 + 40 * i))
+            for days_ago in range(0, 120, 3 + i):
+                amount = Decimal(5 + (days_ago * 7 + i * 13) % 40)
+                add_spending(user, "groceries", today - timedelta(days=days_ago), amount, "receipt")
+                if days_ago % 2:
+                    add_spending(user, "rent", today - timedelta(days=days_ago), amount * 10, "receipt")
+            if i == 2:
+                # A negative correction, and an undated row (counted in all-time peer averages)
+                add_spending(user, "groceries", today, Decimal("-30"), "receipt")
+                set_spending(user, "other", None, Decimal("75"))
+
+    def rules(self):
+        for period, window, comparison, consecutive, category, tolerance in itertools.product(
+            BadgeRulePeriod.values,
+            BadgeRuleWindow.values,
+            BadgeRuleComparison.values,
+            (False, True),
+            (None, "groceries"),
+            (Decimal("1"), Decimal("0.5")),
+        ):
+            yield Badge(
+                badge_type="budget_master",
+                target_value=1000,
+                category=category,
+                rule_period=period,
+                rule_window=window,
+                rule_window_length=10 if window == BadgeRuleWindow.DAYS else 3,
+                rule_comparison=comparison,
+                rule_tolerance=tolerance,
+                rule_consecutive=consecutive,
+            )
+
+    def test_sql_matches_memory(self):
+        badges = list(self.rules())
+        peer_stats = AnalyticsService.get_peer_category_totals()
+        for today in (self.today, self.today.replace(day=1), self.today - timedelta(days=45)):
+            data = BadgeService.load_many(self.user_ids, today, peer_stats, badges)
+            for badge in badges:
+                rule = BadgeRule(badge)
+                with CaptureQueriesContext(connection) as queries:
+                    many = rule.evaluate_many(self.user_ids, today)
+                self.assertEqual(len(queries), 1)
+                for user_id in self.user_ids:
+                    self.assertEqual(
+                        many[user_id], rule.evaluate(data[user_id]),
+                        f"{today} user {user_id}: {badge.rule_period}/{badge.rule_window}/{badge.rule_comparison} "
+                        f"consecutive={badge.rule_consecutive} category={badge.category} x{badge.rule_tolerance}",
+                    )
+
+    def test_rules_are_not_trivial(self):
+        # Guard against the comparison above passing because everything is 0
+        progress = {
+            BadgeRule(badge).evaluate_many(self.user_ids, self.today)[self.user_ids[0]][0] for badge in self.rules()
+        }
+        self.assertGreater(len(progress), 3)
+
+    def test_target_caps_progress(self):
+        badge = Badge(
+            badge_type="budget_master", target_value=2, rule_period=BadgeRulePeriod.DAY,
+            rule_window=BadgeRuleWindow.DAYS, rule_window_length=30,
+            rule_comparison=BadgeRuleComparison.BUDGET, rule_tolerance=Decimal("10"),
+        )
+        results = BadgeRule(badge).evaluate_many(self.user_ids, self.today)
+        self.assertEqual(results[self.user_ids[0]], (2, True))
+        # No budget: nothing to compare against
+        self.assertEqual(results[self.user_ids[5]], (0, False))
+
+    def test_no_users(self):
+        badge = next(self.rules())
+        self.assertEqual(BadgeRule(badge).evaluate_many([], self.today), {})
+
+
+class BadgeProgressTests(TestCase):
+    """Writes re-evaluate affected badges when they commit; reading badges writes nothing."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().date()
+        cls.user = User.objects.create(username="progress")
+        Budget.objects.create(user=cls.user, category="groceries", amount=Decimal("300"))
+        common = dict(
+            title="t", description="d", icon="i", gradient_start="#000", gradient_end="#fff", target_value=30,
+            rule_period=BadgeRulePeriod.DAY, rule_window=BadgeRuleWindow.DAYS, rule_window_length=30,
+            rule_comparison=BadgeRuleComparison.BUDGET,
+        )
+        cls.groceries = Badge.objects.create(badge_type="budget_master", category="groceries", **common)
+        cls.rent = Badge.objects.create(badge_type="saving_streak", category="rent", **common)
+
+    def progress(self, badge):
+        return UserBadge.objects.filter(user=self.user, badge=badge).values_list("progress", flat=True).first()
+
+    def test_write_reevaluates_affected_badges_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            add_spending(self.user, "groceries", self.today, Decimal("5"), "receipt")
+        expected, _ = BadgeService.evaluate(self.groceries, BadgeService.load(self.user))
+        self.assertEqual(self.progress(self.groceries), expected)
+        # Rent spending was not touched
+        self.assertIsNone(self.progress(self.rent))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_spending(self.user, "groceries", self.today, Decimal("500"), "receipt")
+        self.assertEqual(self.progress(self.groceries), expected - 1)
+
+    def test_nothing_runs_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            add_spending(self.user, "groceries", self.today, Decimal("5"), "receipt")
+        self.assertTrue(callbacks)
+        self.assertIsNone(self.progress(self.groceries))
+
+    def test_badges_list_is_read_only(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/api/badges/")
+        self.assertEqual(response.status_code, 200)
+        writes = [query["sql"] for query in queries if not query["sql"].startswith(("SELECT", "SAVEPOINT", "RELEASE"))]
+        self.assertEqual(writes, [])
+        # Not evaluated yet: shown without progress
+        self.assertEqual({badge["progress"] for badge in response.data["badges"]}, {0})
+        self.assertEqual(response.data["earned_count"], 0)
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics_service import AnalyticsService
+from core.batch_analytics_service import BatchAnalyticsService
+from core.cache_service import CacheService
+from core.models import Budget, User
+from core.services import add_spending
+
+
+class CategoryInsightParityTests(TestCase):
+    """The nightly batch and the live fallback must report the same numbers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        last_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        cls.users = []
+        for i in range(8):
+            user = User.objects.create(username=f"insights{i}")
+            Budget.objects.create(user=user, category="groceries", amount=Decimal(100 + 10 * i))
+            # Several rows a month, so per-row and per-month averages differ
+            for day in range(1 + i % 3):
+                add_spending(user, "groceries", today - timedelta(days=day), Decimal(20 + 7 * i), "receipt")
+            add_spending(user, "groceries", last_month, Decimal(500), "receipt")
+            if i % 2:
+                add_spending(user, "rent", today, Decimal(400 + i), "receipt")
+            cls.users.append(user)
+
+    def test_batch_matches_live(self):
+        BatchAnalyticsService.compute_category_insights(chunk_size=3)
+        for user in self.users:
+            batch = AnalyticsService.get_precomputed_category_insights(user)
+            live = AnalyticsService.get_category_insights(user)
+            self.assertEqual([row["category"] for row in batch], [row["category"] for row in live])
+            for batch_row, live_row in zip(batch, live):
+                self.assertAlmostEqual(batch_row["spending"], live_row["spending"], places=2)
+                self.assertAlmostEqual(batch_row["budget"], live_row["budget"], places=2)
+                self.assertAlmostEqual(batch_row["peer_average"], live_row["peer_average"], places=2)
+
+    def test_rows_older_than_the_data_are_ignored(self):
+        BatchAnalyticsService.compute_category_insights()
+        user = self.users[0]
+        self.assertIsNotNone(AnalyticsService.get_precomputed_category_insights(user))
+        # A write that commits after the batch loaded the user's data but before it wrote the rows
+        with self.captureOnCommitCallbacks(execute=True):
+            CacheService.bump_user(user.id)
+        self.assertIsNone(AnalyticsService.get_precomputed_category_insights(user))
+        self.assertIsNotNone(AnalyticsService.get_precomputed_category_insights(self.users[1]))
+
+    def test_spending_is_the_month_total(self):
+        user = self.users[2]  # Three groceries rows of 34 in the last three days
+        today = timezone.now().date()
+        rows_this_month = sum((today - timedelta(days=day)).month == today.month for day in range(3))
+        groceries = next(row for row in AnalyticsService.get_category_insights(user) if row["category"] == "groceries")
+        self.assertEqual(groceries["spending"], rows_this_month * 34.0)
+
+
+class CachedInsightsTests(TestCase):
+    """Cached insights must never outlive a change to the peer numbers they compare with."""
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        cls.user = User.objects.create(username="cached")
+        cls.other = User.objects.create(username="cached-other")
+        for user in (cls.user, cls.other):
+            Budget.objects.create(user=user, category="groceries", amount=Decimal(200))
+            add_spending(user, "groceries", today, Decimal(50), "receipt")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def groceries(self):
+        response = self.client.get("/api/insights/categories/")
+        return next(row for row in response.data["insights"] if row["category"] == "groceries")
+
+    def test_peer_write_invalidates(self):
+        before = self.groceries()
+        with self.captureOnCommitCallbacks(execute=True):
+            add_spending(self.other, "groceries", timezone.now().date(), Decimal(1000), "receipt")
+        after = self.groceries()
+        self.assertGreater(after["peer_average"], before["peer_average"])
+        self.assertEqual(after["spending"], before["spending"])
+
+    def test_only_changed_categories_are_bumped(self):
+        groceries, rent = CacheService.peer_versions(["groceries", "rent"])
+        with self.captureOnCommitCallbacks(execute=True):
+            add_spending(self.other, "groceries", timezone.now().date(), Decimal(10), "receipt")
+        self.assertEqual(CacheService.peer_versions(["groceries", "rent"]), [groceries + 1, rent])
@@ -0,0 +1,179 @@
+import base64
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.leaderboard_memory import LeaderboardMemory
+from core.leaderboard_service import LeaderboardService, LiveBoard
+from core.models import User
+from core.services import add_spending
+from core.views import _decode_cursor, _encode_cursor
+
+
+class LeaderboardTestCase(TestCase):
+    # Monthly totals, with ties
+    AMOUNTS = [Decimal(value) for value in ("30", "10", "20", "10", "50", "20", "20", "40", "5", "60")]
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        cls.users = []
+        for i, amount in enumerate(cls.AMOUNTS):
+            user = User.objects.create(username=f"board{i}")
+            add_spending(user, "groceries", today, amount, "receipt")
+            cls.users.append(user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+
+class LeaderboardValidationTests(LeaderboardTestCase):
+    def test_unknown_category_is_rejected(self):
+        response = self.client.get("/api/leaderboard/", {"category": "transport"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("category", response.data["error"])
+
+    def test_unknown_period_is_rejected(self):
+        for params in ({"period": "week"}, {"period": "week", "limit": 5}, {"period": "week", "around": "me"}):
+            response = self.client.get("/api/leaderboard/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_known_boards_are_served(self):
+        for category in LeaderboardService.BOARDS:
+            response = self.client.get("/api/leaderboard/", {"category": category, "period": "year"})
+            self.assertEqual(response.status_code, 200, category)
+
+    @override_settings(LEADERBOARD_IN_MEMORY=True)
+    def test_memory_does_not_load_for_unknown_boards(self):
+        memory = LeaderboardMemory()
+        with mock.patch.object(memory, "warm_in_background") as warm:
+            self.assertIsNone(memory.get_board("transport", "month"))
+            self.assertIsNone(memory.get_board("groceries", "week"))
+            warm.assert_not_called()
+            self.assertIsNone(memory.get_board("groceries", "month"))
+            warm.assert_called_once()
+
+
+@override_settings(LEADERBOARD_IN_MEMORY=True)
+class LeaderboardMemoryTests(LeaderboardTestCase):
+    def setUp(self):
+        super().setUp()
+        self.memory = LeaderboardMemory()
+        self.memory.warm()
+
+    def assertSameAsSql(self, user, category=None):
+        live = LeaderboardService.get_leaderboard(user, category=category, limit=5)
+        memory = self.memory.get_leaderboard(user, category=category, limit=5)
+        self.assertEqual(memory["top"], live["top"])
+        self.assertEqual(memory["current_user"], live["current_user"])
+        self.assertEqual(memory["total_users"], live["total_users"])
+
+    def test_ranks_match_sql(self):
+        for user in self.users:
+            self.assertSameAsSql(user)
+            self.assertSameAsSql(user, category="groceries")
+        # A user without spending ranks after everyone
+        outsider = User.objects.create(username="outsider")
+        self.assertSameAsSql(outsider)
+        self.assertEqual(self.memory.get_leaderboard(outsider)["current_user"]["rank"], len(self.users) + 1)
+
+    def test_ties_share_a_rank(self):
+        ranks = [row["rank"] for row in self.memory.get_leaderboard(self.users[0], limit=10)["top"]]
+        self.assertEqual(ranks, [1, 2, 2, 4, 4, 4, 7, 8, 9, 10])
+
+    def test_refresh_user_moves_them(self):
+        add_spending(self.users[9], "groceries", timezone.now().date(), Decimal("-58"), "receipt")
+        self.memory.refresh_user(self.users[9])
+        self.assertEqual(self.memory.get_leaderboard(self.users[9])["current_user"], {"rank": 1, "amount": 2.0})
+        self.assertSameAsSql(self.users[9])
+        self.assertSameAsSql(self.users[8])
+
+
+class LeaderboardCursorTests(LeaderboardTestCase):
+    def test_round_trip(self):
+        for key in ((Decimal("10.50"), 7), (Decimal("-3"), 1), (Decimal("0"), 123456)):
+            self.assertEqual(_decode_cursor(_encode_cursor(key)), key)
+        self.assertIsNone(_encode_cursor(None))
+
+    def test_invalid_cursors_are_rejected(self):
+        payloads = [b"NaN:1", b"sNaN:1", b"Infinity:1", b"-Infinity:1", b"10:x", b"10", b"10:1:2", b"", b"\xff:1"]
+        cursors = [base64.urlsafe_b64encode(payload).decode() for payload in payloads]
+        cursors += ["%%%", "not base64"]
+        for cursor in cursors:
+            with self.assertRaises(ValueError, msg=cursor):
+                _decode_cursor(cursor)
+
+    def test_invalid_cursor_is_a_400(self):
+        for param in ("after", "before"):
+            response = self.client.get("/api/leaderboard/", {param: _encode_cursor(("NaN", 1))})
+            self.assertEqual(response.status_code, 400, param)
+            self.assertEqual(response.data["error"], "Invalid cursor")
+
+
+class LeaderboardPagingTests(LeaderboardTestCase):
+    def expected_order(self):
+        return [user.id for _, user in sorted(zip(self.AMOUNTS, self.users), key=lambda pair: (pair[0], pair[1].id))]
+
+    def walk(self, board, limit):
+        """Every page forwards, then backwards from the last page."""
+        pages = [LeaderboardService.get_page(board, limit=limit)]
+        while pages[-1]["next"]:
+            pages.append(LeaderboardService.get_page(board, after=pages[-1]["next"], limit=limit))
+        backwards = [pages[-1]]
+        while backwards[-1]["previous"]:
+            backwards.append(LeaderboardService.get_page(board, before=backwards[-1]["previous"], limit=limit))
+        return pages, backwards
+
+    def assertPagesCoverBoard(self, board):
+        ranks = {row["user_id"]: row["rank"] for row in LeaderboardService.get_page(board, limit=100)["results"]}
+        for limit in (1, 3, 4, 10, 11):
+            pages, backwards = self.walk(board, limit)
+            rows = [row for page in pages for row in page["results"]]
+            self.assertEqual([row["user_id"] for row in rows], self.expected_order(), limit)
+            self.assertEqual({row["user_id"]: row["rank"] for row in rows}, ranks)
+            self.assertIsNone(pages[0]["previous"])
+            self.assertEqual(
+                [row["user_id"] for page in reversed(backwards) for row in page["results"]],
+                [row["user_id"] for row in rows][-sum(len(page["results"]) for page in backwards):],
+            )
+        self.assertEqual(list(ranks.values()), [1, 2, 2, 4, 4, 4, 7, 8, 9, 10])
+
+    def test_live_board(self):
+        self.assertPagesCoverBoard(LiveBoard())
+
+    def test_snapshot_board(self):
+        LeaderboardService.refresh_snapshots(periods=["month"])
+        board = LeaderboardService.get_board()
+        self.assertIsNotNone(board.computed_at)
+        self.assertPagesCoverBoard(board)
+
+    @override_settings(LEADERBOARD_IN_MEMORY=True)
+    def test_memory_board(self):
+        memory = LeaderboardMemory()
+        memory.warm()
+        self.assertPagesCoverBoard(memory.get_board())
+
+    def test_pages_over_the_api(self):
+        seen = []
+        params = {"limit": 4}
+        while True:
+            response = self.client.get("/api/leaderboard/", params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["total_users"], len(self.users))
+            seen += [row["user_id"] for row in response.data["results"]]
+            if not response.data["next"]:
+                break
+            params = {"limit": 4, "after": response.data["next"]}
+        self.assertEqual(seen, self.expected_order())
+
+    def test_around_me(self):
+        order = self.expected_order()
+        for user in self.users:
+            page = LeaderboardService.get_around(LiveBoard(), user, window=2)
+            position = order.index(user.id)
+            self.assertEqual([row["user_id"] for row in page["results"]], order[max(position - 2, 0):position + 3])
+            self.assertEqual(page["current_user"]["amount"], float(self.AMOUNTS[self.users.index(user)]))
@@ -0,0 +1,74 @@
+import bisect
+import random
+
+from django.test import SimpleTestCase
+
+from core.order_statistics import OrderStatisticList
+
+
+class OrderStatisticListTests(SimpleTestCase):
+    def assertMatches(self, skip_list, reference):
+        self.assertEqual(len(skip_list), len(reference))
+        self.assertEqual(skip_list.slice(0, len(reference)), reference)
+
+    def test_random_operations_match_a_sorted_list(self):
+        rng = random.Random(10)
+        skip_list, reference = OrderStatisticList(), []
+        for _ in range(3000):
+            key = (rng.randint(0, 200), rng.randint(1, 50))
+            position = bisect.bisect_left(reference, key)
+            present = position < len(reference) and reference[position] == key
+            if present and rng.random() < 0.6:
+                skip_list.remove(key)
+                reference.pop(position)
+            elif not present:
+                skip_list.insert(key)
+                reference.insert(position, key)
+            self.assertEqual(skip_list.count_less(key), bisect.bisect_left(reference, key))
+        self.assertMatches(skip_list, reference)
+
+        for _ in range(200):
+            start = rng.randint(0, len(reference) + 5)
+            stop = start + rng.randint(0, 30)
+            self.assertEqual(skip_list.slice(start, stop), reference[start:stop])
+
+    def test_initial_keys_are_sorted(self):
+        keys = [(5, 1), (1, 2), (3, 3), (1, 1)]
+        skip_list = OrderStatisticList(keys)
+        self.assertMatches(skip_list, sorted(keys))
+        self.assertEqual(skip_list.first(2), [(1, 1), (1, 2)])
+
+    def test_count_less_of_absent_keys(self):
+        skip_list = OrderStatisticList([(10, 1), (20, 2), (20, 5), (30, 3)])
+        self.assertEqual(skip_list.count_less((0, 0)), 0)
+        # (total, 0) sorts before every user with that total: the RANK() of the total, minus one
+        self.assertEqual(skip_list.count_less((20, 0)), 1)
+        self.assertEqual(skip_list.count_less((20, 3)), 2)
+        self.assertEqual(skip_list.count_less((99, 0)), 4)
+
+    def test_duplicate_insert_and_missing_remove_raise(self):
+        skip_list = OrderStatisticList([(1, 1)])
+        with self.assertRaises(KeyError):
+            skip_list.insert((1, 1))
+        with self.assertRaises(KeyError):
+            skip_list.remove((2, 2))
+        self.assertMatches(skip_list, [(1, 1)])
+
+    def test_slice_bounds(self):
+        skip_list = OrderStatisticList([(i, i) for i in range(5)])
+        self.assertEqual(skip_list.slice(-3, 2), [(0, 0), (1, 1)])
+        self.assertEqual(skip_list.slice(3, 100), [(3, 3), (4, 4)])
+        self.assertEqual(skip_list.slice(4, 4), [])
+        self.assertEqual(skip_list.slice(7, 9), [])
+        self.assertEqual(OrderStatisticList().first(3), [])
+
+    def test_removing_everything_empties_the_list(self):
+        keys = [(i % 7, i) for i in range(100)]
+        skip_list = OrderStatisticList(keys)
+        random.Random(1).shuffle(keys)
+        for key in keys:
+            skip_list.remove(key)
+        self.assertEqual(len(skip_list), 0)
+        self.assertEqual(skip_list.first(5), [])
+        skip_list.insert((1, 1))
+        self.assertMatches(skip_list, [(1, 1)])
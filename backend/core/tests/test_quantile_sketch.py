@@ -0,0 +1,121 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core.analytics_service import AnalyticsService
+from core.models import SpendingSketch, User
+from core.quantile_sketch import QuantileSketch
+from core.services import add_spending, set_spending
+
+
+class QuantileSketchTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(4)
+        self.values = [round(rng.lognormvariate(4, 1), 2) for _ in range(2000)]
+
+    def sketch_of(self, values, **kwargs):
+        sketch = QuantileSketch(**kwargs)
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def test_quantiles_within_relative_accuracy(self):
+        sketch = self.sketch_of(self.values, relative_accuracy=0.01)
+        ordered = sorted(self.values)
+        for q in (0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), 0.01 * exact, q)
+
+    def test_rank_counts_values_at_or_below_up_to_bucket(self):
+        sketch = self.sketch_of(self.values)
+        for value in (10, 50, 100, 500):
+            exact_low = sum(v <= value * (1 - 0.02) for v in self.values)
+            exact_high = sum(v <= value * (1 + 0.02) for v in self.values)
+            self.assertGreaterEqual(sketch.rank(value), exact_low)
+            self.assertLessEqual(sketch.rank(value), exact_high)
+        self.assertEqual(sketch.rank(max(self.values)), len(self.values))
+
+    def test_non_positive_values_are_ignored(self):
+        sketch = self.sketch_of([0, -5, 12.5])
+        sketch.remove(-5)
+        self.assertEqual(sketch.count, 1)
+        self.assertEqual(sketch.rank(0), 0)
+        self.assertEqual(sketch.rank(-1), 0)
+
+    def test_empty_sketch(self):
+        sketch = QuantileSketch()
+        self.assertEqual(sketch.count, 0)
+        self.assertIsNone(sketch.quantile(0.5))
+
+    def test_remove_undoes_add(self):
+        sketch = self.sketch_of(self.values)
+        for value in self.values[:500]:
+            sketch.remove(value)
+        self.assertEqual(sketch.bins, self.sketch_of(self.values[500:]).bins)
+
+    def test_moving_a_total_between_buckets(self):
+        # How a user's monthly total moves as spending arrives
+        sketch = self.sketch_of([10, 20, 30])
+        sketch.remove(10)
+        sketch.add(25)
+        self.assertEqual(sketch.bins, self.sketch_of([20, 25, 30]).bins)
+
+    def test_merge_equals_sketch_of_union(self):
+        shards = [self.sketch_of(self.values[i::4]) for i in range(4)]
+        merged = QuantileSketch()
+        for shard in shards:
+            merged.merge(shard)
+        self.assertEqual(merged.bins, self.sketch_of(self.values).bins)
+
+    def test_merge_rejects_different_accuracy(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(relative_accuracy=0.01).merge(QuantileSketch(relative_accuracy=0.05))
+
+    def test_json_round_trip(self):
+        sketch = self.sketch_of(self.values, relative_accuracy=0.02)
+        restored = QuantileSketch.from_json(sketch.to_json())
+        self.assertEqual(restored.relative_accuracy, 0.02)
+        self.assertEqual(restored.bins, sketch.bins)
+        self.assertEqual(QuantileSketch.from_json(None).count, 0)
+
+
+class SpendingSketchRollupTests(TestCase):
+    def sketches(self):
+        merged = {}
+        for row in SpendingSketch.objects.all():
+            merged.setdefault((row.category, row.month), QuantileSketch()).merge(QuantileSketch.from_json(row.sketch))
+        return {key: sketch.bins for key, sketch in merged.items() if sketch.count}
+
+    def test_incremental_sketches_match_rebuild(self):
+        today = timezone.now().date()
+        last_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        users = [User.objects.create(username=f"sketch{i}") for i in range(20)]
+        for i, user in enumerate(users):
+            add_spending(user, "groceries", today, Decimal(10 + i), "receipt")
+            add_spending(user, "groceries", last_month, Decimal(5 * i + 1), "receipt")
+            if i % 3 == 0:
+                # Moves the user's monthly total to another bucket
+                add_spending(user, "groceries", today, Decimal(40), "receipt")
+                set_spending(user, "rent", today, Decimal(300 + i))
+
+        incremental = self.sketches()
+        self.assertEqual(
+            sum(QuantileSketch(bins=bins).count for (category, month), bins in incremental.items()
+                if category == "groceries" and month == today.replace(day=1)),
+            len(users),
+        )
+        AnalyticsService.rebuild_spending_sketches()
+        self.assertEqual(incremental, self.sketches())
+
+    def test_percentiles_from_sketch(self):
+        today = timezone.now().date()
+        users = [User.objects.create(username=f"pct{i}") for i in range(11)]
+        for i, user in enumerate(users):
+            add_spending(user, "groceries", today, Decimal(100 * (i + 1)), "receipt")
+        # Ten other users, the user spent more than five of them
+        self.assertEqual(AnalyticsService.get_spending_percentiles(users[5])["groceries"], 50)
+        self.assertEqual(AnalyticsService.get_spending_percentiles(users[0])["groceries"], 0)
+        self.assertEqual(AnalyticsService.get_spending_percentiles(users[10])["groceries"], 100)
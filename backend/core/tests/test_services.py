@@ -0,0 +1,259 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics_service import AnalyticsService
+from core.models import Budget, Category, MonthlySpending, PeerCategoryStats, Spending, Transaction, User
+from core.services import (
+    add_spending, add_spending_bulk, create_month_rows, ensure_user_rows, forget_user_rows, insert_missing_rows,
+    ledger_mismatches, upsert_add_rows,
+)
+
+
+def rollups():
+    """Summed peer rollups and monthly totals, to compare with a rebuild."""
+    peer = {
+        (row["category"], row["month"]): (row["total"], row["rows"])
+        for row in PeerCategoryStats.objects.values("category", "month")
+        .annotate(total=Sum("total"), rows=Sum("row_count")).order_by()
+        if row["rows"]
+    }
+    monthly = set(
+        MonthlySpending.objects.filter(row_count__gt=0).values_list("user_id", "category", "month", "amount")
+    )
+    return peer, monthly
+
+
+class UpsertAddRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="upsert")
+        cls.other = User.objects.create(username="upsert-other")
+        cls.today = timezone.now().date()
+
+    def amounts(self, user):
+        return {(row.category, row.date): row.amount for row in Spending.objects.filter(user=user)}
+
+    def test_inserts_then_adds(self):
+        yesterday = self.today - timedelta(days=1)
+        first = upsert_add_rows(
+            self.user.id, [("groceries", self.today, Decimal("10.50")), ("rent", yesterday, Decimal("400"))]
+        )
+        self.assertEqual(
+            [(amount, inserted) for _, amount, inserted in first], [(Decimal("10.50"), True), (Decimal("400"), True)]
+        )
+
+        # Results come back in input order, mixing existing and new rows
+        second = upsert_add_rows(
+            self.user.id,
+            [
+                ("rent", yesterday, Decimal("-50")),
+                ("other", self.today, Decimal("3")),
+                ("groceries", self.today, Decimal("2")),
+            ],
+        )
+        self.assertEqual(
+            [(amount, inserted) for _, amount, inserted in second],
+            [(Decimal("350"), False), (Decimal("3"), True), (Decimal("12.50"), False)],
+        )
+        # Ids identify the rows written
+        self.assertEqual(first[0][0], second[2][0])
+        self.assertEqual(
+            self.amounts(self.user),
+            {
+                ("groceries", self.today): Decimal("12.50"),
+                ("rent", yesterday): Decimal("350"),
+                ("other", self.today): Decimal("3"),
+            },
+        )
+
+    def test_other_users_rows_are_untouched(self):
+        upsert_add_rows(self.other.id, [("groceries", self.today, Decimal("7"))])
+        upsert_add_rows(self.user.id, [("groceries", self.today, Decimal("1"))])
+        upsert_add_rows(self.user.id, [("groceries", self.today, Decimal("1"))])
+        self.assertEqual(self.amounts(self.other), {("groceries", self.today): Decimal("7")})
+        self.assertEqual(self.amounts(self.user), {("groceries", self.today): Decimal("2")})
+
+    def test_row_deleted_between_insert_and_update(self):
+        upsert_add_rows(self.user.id, [("groceries", self.today, Decimal("4"))])
+        real_cursor = connection.cursor
+
+        @contextmanager
+        def cursor():
+            # Delete the row right after the INSERT found it, as a concurrent delete_spending could
+            with real_cursor() as wrapped:
+                execute = wrapped.execute
+
+                def execute_then_delete(sql, params=None):
+                    execute(sql, params)
+                    if sql.startswith("INSERT") and not deleted:
+                        deleted.append(Spending.objects.filter(user=self.user).delete())
+
+                wrapped.execute = execute_then_delete
+                yield wrapped
+
+        deleted = []
+        with mock.patch("core.services.connection", mock.Mock(cursor=cursor)):
+            (_, amount, inserted), = upsert_add_rows(self.user.id, [("groceries", self.today, Decimal("1"))])
+        self.assertTrue(deleted)
+        self.assertEqual((amount, inserted), (Decimal("1"), True))
+        self.assertEqual(self.amounts(self.user), {("groceries", self.today): Decimal("1")})
+
+    def test_add_spending_bulk_keeps_ledger_and_rollups(self):
+        last_month = (self.today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        add_spending(self.user, "groceries", self.today, Decimal("5"), "receipt")
+        items = [
+            ("groceries", self.today, Decimal("1.25"), "A"),
+            ("groceries", self.today, Decimal("2.75"), "B"),
+            ("rent", last_month, Decimal("500"), ""),
+            ("other", self.today, Decimal("-3"), ""),
+        ]
+        written = add_spending_bulk(self.user, items)
+        self.assertEqual(
+            written,
+            {
+                ("groceries", self.today): Decimal("9"),
+                ("rent", last_month): Decimal("500"),
+                ("other", self.today): Decimal("-3"),
+            },
+        )
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(ledger_mismatches(), [])
+
+        incremental = rollups()
+        AnalyticsService.rebuild_peer_stats()
+        self.assertEqual(incremental, rollups())
+
+    def test_add_spending_bulk_with_nothing_to_add(self):
+        self.assertEqual(add_spending_bulk(self.user, []), {})
+        self.assertFalse(Transaction.objects.exists())
+
+
+class ReceiptSpendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="receipt")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, **data):
+        return self.client.post("/api/spending/add-receipt/", data, format="json")
+
+    def test_adds_to_the_day(self):
+        response = self.post(category="groceries", amount="12.3", merchant="Lidl")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Spending.objects.get(user=self.user).amount, Decimal("12.30"))
+        self.assertEqual(Transaction.objects.get(user=self.user).merchant, "Lidl")
+
+    def test_rejects_what_the_bulk_endpoint_rejects(self):
+        add_spending(self.user, "groceries", timezone.now().date(), Decimal("9999999999"), "receipt")
+        for data in (
+            {"category": "not-a-category", "amount": "5"},
+            {"category": "rent", "amount": "NaN"},
+            {"category": "rent", "amount": "Infinity"},
+            {"category": "rent", "amount": "abc"},
+            {"category": "rent", "amount": "1e12"},
+            {"category": "groceries", "amount": "1"},  # The day's total would overflow
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(**data).status_code, 400)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+
+
+class ConcurrentAddTests(TransactionTestCase):
+    def test_concurrent_adds_are_not_lost(self):
+        user = User.objects.create(username="concurrent")
+        today = timezone.now().date()
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(10):
+                    add_spending(user, "groceries", today, Decimal("1"), "receipt")
+            except Exception as e:  # Reported below; a thread's exception is otherwise lost
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Spending.objects.get(user=user, category="groceries", date=today).amount, Decimal("40"))
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 40)
+        self.assertEqual(AnalyticsService.get_month_spending(user)["groceries"], 40.0)
+
+
+class InsertMissingRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f"rows{i}") for i in range(3)]
+        cls.month = timezone.now().date().replace(day=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_inserts_only_missing_rows(self):
+        Budget.objects.create(user=self.users[0], category="rent", amount=Decimal("450"))
+        user_ids = [user.id for user in self.users[:2]]
+
+        inserted = insert_missing_rows(Budget, user_ids, amount=0)
+        expected = {(user_id, category) for user_id in user_ids for category in Category.values}
+        self.assertEqual(set(inserted), expected - {(self.users[0].id, "rent")})
+        self.assertEqual(len(inserted), len(expected) - 1)
+        self.assertEqual(Budget.objects.get(user=self.users[0], category="rent").amount, Decimal("450"))
+
+        self.assertEqual(insert_missing_rows(Budget, user_ids, amount=0), [])
+        self.assertEqual(insert_missing_rows(Budget, []), [])
+
+    def test_month_rows_for_many_users(self):
+        add_spending(self.users[1], "groceries", self.month, Decimal("20"), "receipt")
+        with self.captureOnCommitCallbacks(execute=True):
+            created = create_month_rows(self.users, self.month)
+        # One Budget and one Spending row per user and category, except the one that existed
+        self.assertEqual(created, 2 * len(self.users) * len(Category.values) - 1)
+        self.assertEqual(Spending.objects.get(user=self.users[1], category="groceries", date=self.month).amount, 20)
+        self.assertEqual(create_month_rows(self.users, self.month), 0)
+
+        # Only row counts move; they must match a rebuild
+        incremental = rollups()
+        AnalyticsService.rebuild_peer_stats()
+        self.assertEqual(incremental, rollups())
+
+        # Marked initialized, so ensure_user_rows has nothing to do
+        with CaptureQueriesContext(connection) as queries:
+            ensure_user_rows(self.users[0])
+        self.assertEqual(len(queries), 0)
+
+    def test_ensure_user_rows(self):
+        user = self.users[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            ensure_user_rows(user)
+        self.assertEqual(Budget.objects.filter(user=user).count(), len(Category.values))
+        self.assertEqual(Spending.objects.filter(user=user, date=self.month, amount=0).count(), len(Category.values))
+
+        with CaptureQueriesContext(connection) as queries:
+            ensure_user_rows(user)
+        self.assertEqual(len(queries), 0)
+
+        # After rows are removed outside the app, forgetting the marker brings them back
+        Budget.objects.filter(user=user, category="rent").delete()
+        forget_user_rows(user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            ensure_user_rows(user)
+        self.assertTrue(Budget.objects.filter(user=user, category="rent").exists())
@@ -19,6 +19,7 @@ urlpatterns = [
     path("spending/", views.spending_list),
     path("spending/update/", views.spending_update),
     path('spending/add-receipt/', views.add_receipt_spending, name='add-receipt'),
+    path("spending/bulk/", views.spending_bulk),
     path('analyze-receipt/', views.analyze_receipt, name='analyze-receipt'),
     path('generate-backfill/', views.generate_backfill, name='generate-backfill'),
     
@@ -2,6 +2,7 @@ import base64
 import json
 import os
 import random
+import time
 import logging
 from openai import OpenAI
 from django.conf import settings
@@ -10,15 +11,18 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from decimal import Decimal
-from django.db.models import Sum
+from django.db import DataError
 from .llm_service import LLMService
 from .analytics_service import AnalyticsService
+from .cache_service import CacheService
+from .leaderboard_service import LeaderboardService
+from .leaderboard_memory import leaderboard_memory
 from .models import ChatThread, ChatMessage
 from .places_service import PlacesService
 from django.utils import timezone
 from datetime import datetime
 
-from .models import Budget, Spending, User
+from .models import Budget, Category, MonthlySpending, Spending, CohortType, CategoryInsight, TransactionSource
 from .serializers import (
     RegisterSerializer,
     UserSerializer,
@@ -27,7 +31,8 @@ from .serializers import (
     BudgetUpdateSerializer,
     SpendingUpdateSerializer,
 )
-from .services import ensure_user_rows
+from .services import ensure_user_rows, set_spending, add_spending, add_spending_bulk, spending_date_error
+from .badge_service import BadgeService
 
 logger = logging.getLogger(__name__)
 
@@ -88,13 +93,15 @@ def budget_update(request):
     obj, _ = Budget.objects.get_or_create(user=request.user, category=cat)
     obj.amount = amount
     obj.save()
+    CategoryInsight.objects.filter(user=request.user).delete()
+    CacheService.bump_user(request.user.id)
+    BadgeService.record_change(request.user, budgets=[cat])
     return Response(BudgetSerializer(obj).data)
 
 
 from django.utils import timezone
 
 from django.utils import timezone
-from django.db.models import Sum
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -104,12 +111,11 @@ def spending_list(request):
     today = timezone.now().date()
     month_start = today.replace(day=1)
 
-    # Sum all daily rows in the current month, grouped by category
+    # The current month's per-category totals, from the monthly rollup (at most one row per category)
     monthly = (
-        Spending.objects
-        .filter(user=request.user, date__gte=month_start, date__lte=today)
-        .values("category")
-        .annotate(amount=Sum("amount"))
+        MonthlySpending.objects
+        .filter(user=request.user, month=month_start)
+        .values("category", "amount")
         .order_by("category")
     )
 
@@ -154,14 +160,7 @@ def spending_update(request):
     today = timezone.now().date()
     month_start = today.replace(day=1)
 
-    obj, _ = Spending.objects.get_or_create(
-        user=request.user,
-        category=cat,
-        date=month_start,
-        defaults={"amount": 0},
-    )
-    obj.amount = amount
-    obj.save()
+    obj = set_spending(request.user, cat, month_start, amount)
     return Response(SpendingSerializer(obj).data)
 
 from django.utils import timezone
@@ -176,11 +175,6 @@ def add_receipt_spending(request):
     if not cat or amount_str is None:
         return Response({"error": "Category and amount required"}, status=400)
 
-    try:
-        amount_to_add = Decimal(str(amount_str))
-    except:
-        return Response({"error": "Invalid amount format"}, status=400)
-
     # ✅ NEW: Parse the specific date, or fallback to today
     if date_str:
         try:
@@ -195,19 +189,207 @@ def add_receipt_spending(request):
     # we should probably update that SPECIFIC day's row.
     
     # Logic: Find the row for that specific Date + Category and add to it.
-    obj, created = Spending.objects.get_or_create(
-        user=request.user,
-        category=cat,
-        date=target_date, # Use the receipt date
-        defaults={"amount": 0},
-    )
-    
-    obj.amount += amount_to_add
-    obj.save()
+    merchant = str(request.data.get("merchant") or "")[:255]  # As returned by analyze-receipt
+    # The same checks as a one-item bulk request: known category, finite amount, date range, row overflow
+    item = {"category": cat, "amount": amount_str, "date": target_date.isoformat(), "merchant": merchant}
+    valid, errors = _validate_bulk_items([item])
+    valid = _reject_overflowing_rows(request.user, valid, errors)
+    if errors:
+        return Response({"error": errors[0]}, status=400)
+    (_, cat, target_date, amount_to_add, merchant), = valid
+
+    try:
+        obj = add_spending(request.user, cat, target_date, amount_to_add, TransactionSource.RECEIPT, merchant)
+    except DataError:
+        # A concurrent write pushed the row past the limit after the check above
+        return Response({"error": BULK_ROW_OVERFLOW}, status=400)
 
     return Response(SpendingSerializer(obj).data)
 
 
+BULK_MAX_ITEMS = 5000
+BULK_MAX_AMOUNT = Decimal("1e10")  # Spending.amount is NUMERIC(12, 2)
+BULK_ROW_OVERFLOW = "The day's category total would exceed the maximum amount"
+
+
+def _validate_bulk_items(items):
+    """
+    Check every bulk item in one pass.
+
+    Returns:
+        (valid, errors): valid is a list of (index, category, date, amount, merchant),
+        errors a dict of index -> message
+    """
+    categories = set(Category.values)
+    today = timezone.now().date()
+    valid, errors = [], {}
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = "Item must be an object"
+            continue
+
+        category = item.get("category")
+        if category not in categories:
+            errors[index] = f"Invalid category: {category!r}"
+            continue
+
+        try:
+            amount = Decimal(str(item.get("amount"))).quantize(Decimal("0.01"))
+        except ArithmeticError:
+            errors[index] = "Invalid amount"
+            continue
+        if not amount.is_finite() or abs(amount) >= BULK_MAX_AMOUNT:
+            errors[index] = "Invalid amount"
+            continue
+
+        date_str = item.get("date")
+        if date_str:
+            try:
+                date = datetime.strptime(str(date_str), "%Y-%m-%d").date()
+            except ValueError:
+                errors[index] = "Invalid date, expected YYYY-MM-DD"
+                continue
+            date_error = spending_date_error(date, today)
+            if date_error:
+                errors[index] = date_error
+                continue
+        else:
+            date = today
+
+        merchant = item.get("merchant") or ""
+        if not isinstance(merchant, str) or len(merchant) > 255:
+            errors[index] = "Invalid merchant, expected a string of at most 255 characters"
+            continue
+
+        valid.append((index, category, date, amount, merchant))
+    return valid, errors
+
+
+def _reject_overflowing_rows(user, valid, errors):
+    """
+    Move the items whose Spending row would overflow, once every item for
+    its (category, date) and the stored amount are added up, from `valid`
+    to `errors`.
+
+    Returns:
+        The remaining valid items
+    """
+    sums = {}
+    for _, category, date, amount, _ in valid:
+        sums[(category, date)] = sums.get((category, date), Decimal("0")) + amount
+    stored = {
+        (category, date): amount
+        for category, date, amount in Spending.objects.filter(
+            user=user,
+            category__in={category for category, _ in sums},
+            date__in={date for _, date in sums},
+        ).values_list("category", "date", "amount")
+    }
+    overflowing = {
+        key for key, total in sums.items()
+        if abs(stored.get(key, Decimal("0")) + total) >= BULK_MAX_AMOUNT
+    }
+
+    remaining = []
+    for item in valid:
+        if (item[1], item[2]) in overflowing:
+            errors[item[0]] = BULK_ROW_OVERFLOW
+        else:
+            remaining.append(item)
+    return remaining
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def spending_bulk(request):
+    """
+    Add many (category, amount, date) items at once, e.g. when syncing a bank account.
+
+    Body: {"items": [{"category": "groceries", "amount": "12.50", "date": "2025-01-31", "merchant": "Lidl"}, ...]}
+    (date defaults to today and may not be later, merchant is optional). Valid items are applied together in one
+    transaction; invalid ones are reported and skipped.
+
+    Returns:
+        Per-item results (ok with the row's new total, or error) plus timings in ms
+    """
+    started = time.perf_counter()
+    items = request.data.get("items") if isinstance(request.data, dict) else None
+    if not isinstance(items, list):
+        return Response({"error": "items must be a list"}, status=400)
+    if len(items) > BULK_MAX_ITEMS:
+        return Response({"error": f"At most {BULK_MAX_ITEMS} items per request"}, status=400)
+
+    valid, errors = _validate_bulk_items(items)
+    valid = _reject_overflowing_rows(request.user, valid, errors)
+    validated = time.perf_counter()
+
+    try:
+        totals = add_spending_bulk(request.user, [item[1:] for item in valid])
+    except DataError:
+        # A concurrent write pushed a row past the limit after the check above
+        return Response({"error": BULK_ROW_OVERFLOW}, status=400)
+    written = time.perf_counter()
+
+    results = [None] * len(items)
+    for index, message in errors.items():
+        results[index] = {"index": index, "status": "error", "error": message}
+    for index, category, date, amount, _ in valid:
+        results[index] = {
+            "index": index,
+            "status": "ok",
+            "category": category,
+            "date": date.isoformat(),
+            "amount": str(amount),
+            "total": str(totals[(category, date)]),  # The day's category total after the whole request
+        }
+
+    return Response({
+        "accepted": len(valid),
+        "rejected": len(errors),
+        "rows_written": len(totals),
+        "results": results,
+        "timing_ms": {
+            "validate": round((validated - started) * 1000, 2),
+            "write": round((written - validated) * 1000, 2),
+            "total": round((time.perf_counter() - started) * 1000, 2),
+        },
+    })
+
+
+def _encode_cursor(key):
+    if key is None:
+        return None
+    total, user_id = key
+    return base64.urlsafe_b64encode(f"{total}:{user_id}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Returns the (total, user_id) key of a cursor, or raises ValueError."""
+    try:
+        total, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        total = Decimal(total)
+        if not total.is_finite():  # NaN or Infinity cannot be compared against totals
+            raise ValueError
+        return total, int(user_id)
+    except (ValueError, TypeError, ArithmeticError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _int_param(request, name, default, low, high):
+    """Integer query param checked against [low, high]; returns (value, error Response)."""
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        value = None
+    if value is None or not low <= value <= high:
+        return None, Response(
+            {"error": f"{name} must be an integer between {low} and {high}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return value, None
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def leaderboard(request):
@@ -216,90 +398,197 @@ def leaderboard(request):
     Optional query params: 
       - ?category=groceries (filter by category)
       - ?period=month or ?period=year (filter by time period)
+      - ?cohort=university|city|country (rank only users sharing the current user's value)
+      - ?around=me&window=N (N users above and below the current user)
+      - ?limit=N&after=<cursor> or &before=<cursor> (page through the whole ranking)
+    Paged responses return 'results' with 'next' / 'previous' cursors (keyset on total, user_id).
+    Served from the leaderboard snapshot when fresh; snapshot_age_seconds reports its age.
     """
-    from django.utils import timezone
-    from datetime import timedelta
-    
     category = request.GET.get("category", None)
     period = request.GET.get("period", "month")  # default to month
-    
-    # Calculate date range based on period
-    now = timezone.now().date()
-    if period == "year":
-        # Last 12 months (approximately 365 days)
-        start_date = now - timedelta(days=365)
-    else:  # month (default)
-        start_date = now.replace(day=1)
-    
-    # Build aggregation query with date filtering
-    base_qs = Spending.objects.filter(date__gte=start_date)
-    
-    if category and category != "total":
-        # Filter by specific category
-        user_totals = (
-            base_qs.filter(category=category)
-            .values("user_id")
-            .annotate(total=Sum("amount"))
-            .order_by("total")
+    if category and category not in LeaderboardService.BOARDS:
+        return Response(
+            {"error": f"category must be one of: {', '.join(LeaderboardService.BOARDS)}"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    else:
-        # Total across all categories
-        user_totals = (
-            base_qs.values("user_id")
-            .annotate(total=Sum("amount"))
-            .order_by("total")
+    if period not in LeaderboardService.PERIODS:
+        return Response(
+            {"error": f"period must be one of: {', '.join(LeaderboardService.PERIODS)}"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
     
-    # Convert to list for ranking
-    ranked_list = list(user_totals)
-    
-    # Get top 10
-    top_10_data = ranked_list[:10]
-    
-    # Build top 10 response with user details
-    top_10 = []
-    for idx, entry in enumerate(top_10_data):
-        user = User.objects.get(id=entry["user_id"])
-        top_10.append({
-            "rank": idx + 1,
-            "user_id": user.id,
-            "username": user.username,
-            "full_name": user.full_name or user.username,
-            "amount": float(entry["total"] or 0),
-        })
-    
-    # Find current user's rank and amount
-    current_user_rank = None
-    current_user_amount = 0
-    for idx, entry in enumerate(ranked_list):
-        if entry["user_id"] == request.user.id:
-            current_user_rank = idx + 1
-            current_user_amount = float(entry["total"] or 0)
-            break
+    cohort = None
+    cohort_type = request.GET.get("cohort")
+    if cohort_type:
+        if cohort_type not in LeaderboardService.COHORTS:
+            return Response(
+                {"error": f"cohort must be one of: {', '.join(LeaderboardService.COHORTS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        key = LeaderboardService.get_cohort_key(request.user, cohort_type)
+        if not key:
+            return Response(
+                {"error": f"Set your {cohort_type} in your profile to use this leaderboard"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        cohort = (cohort_type, key)
     
-    # If user has no spending yet
-    if current_user_rank is None:
-        current_user_rank = len(ranked_list) + 1
-        current_user_amount = 0
+    around = request.GET.get("around")
+    if around is not None or any(param in request.GET for param in ("after", "before", "limit")):
+        if around not in (None, "me"):
+            return Response({"error": "around must be 'me'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The in-memory boards are global only
+        board = (
+            (None if cohort else leaderboard_memory.get_board(category, period))
+            or LeaderboardService.get_board(category, period, cohort=cohort)
+        )
+        if around == "me":
+            window, error = _int_param(request, "window", 5, 1, 50)
+            if error:
+                return error
+            page = LeaderboardService.get_around(board, request.user, window=window)
+        else:
+            limit, error = _int_param(
+                request, "limit", LeaderboardService.PAGE_SIZE, 1, LeaderboardService.MAX_PAGE_SIZE
+            )
+            if error:
+                return error
+            try:
+                after = _decode_cursor(request.GET["after"]) if request.GET.get("after") else None
+                before = _decode_cursor(request.GET["before"]) if request.GET.get("before") else None
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            page = LeaderboardService.get_page(board, after=after, before=before, limit=limit)
+
+        computed_at = board.computed_at
+        response = {
+            "results": page["results"],
+            "next": _encode_cursor(page["next"]),
+            "previous": _encode_cursor(page["previous"]),
+            "total_users": board.total_users(),
+            "computed_at": computed_at,
+            "snapshot_age_seconds": int((timezone.now() - computed_at).total_seconds()) if computed_at else None,
+        }
+        if "current_user" in page:
+            response["current_user"] = {
+                "rank": page["current_user"]["rank"],
+                "user_id": request.user.id,
+                "username": request.user.username,
+                "full_name": request.user.full_name or request.user.username,
+                "amount": page["current_user"]["amount"],
+            }
+        return Response(response)
+
+    # Serve from process memory when warm, then the materialized snapshot when fresh, otherwise rank live
+    board = (
+        (None if cohort else leaderboard_memory.get_leaderboard(request.user, category=category, period=period))
+        or LeaderboardService.get_snapshot_leaderboard(request.user, category=category, period=period, cohort=cohort)
+        or LeaderboardService.get_leaderboard(request.user, category=category, period=period, cohort=cohort)
+    )
     
     return Response({
-        "top_10": top_10,
+        "top_10": board["top"],
         "current_user": {
-            "rank": current_user_rank,
+            "rank": board["current_user"]["rank"],
             "user_id": request.user.id,
             "username": request.user.username,
             "full_name": request.user.full_name or request.user.username,
-            "amount": current_user_amount,
+            "amount": board["current_user"]["amount"],
         },
-        "total_users": len(ranked_list) if ranked_list else 1,
+        "total_users": board["total_users"] or 1,
+        "computed_at": board.get("computed_at"),
+        "snapshot_age_seconds": board.get("snapshot_age_seconds"),  # None when ranked live
     })
+
+
+def _peer_params(request):
+    """
+    Validate the optional ?cohort=university|city|age_band or
+    ?window=month|months|30d (&months=N) query params.
+    Returns ((cohort, window, months), error_response).
+    """
+    cohort = request.GET.get("cohort") or None
+    window = request.GET.get("window") or None
+    months = None
+
+    if window:
+        if cohort:
+            return None, Response(
+                {"error": "cohort and window cannot be combined"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if window not in AnalyticsService.WINDOWS:
+            return None, Response(
+                {"error": f"Invalid window. Use one of: {', '.join(AnalyticsService.WINDOWS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            months = int(request.GET.get("months", 3))
+        except ValueError:
+            return None, Response({"error": "months must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= months <= 24:
+            return None, Response({"error": "months must be between 1 and 24"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if cohort:
+        if cohort not in CohortType.values:
+            return None, Response(
+                {"error": f"Invalid cohort. Use one of: {', '.join(CohortType.values)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if cohort not in AnalyticsService.get_cohort_keys(request.user):
+            return None, Response(
+                {"error": f"Your profile has no {cohort.replace('_', ' ')} set"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    return (cohort, window, months), None
+
+
+def _peer_averages_for(user, cohort=None, window=None, months=None):
+    """Peer averages for a user, using params already checked by _peer_params."""
+    if window:
+        return AnalyticsService.get_windowed_peer_averages(
+            window=window, months=months, exclude_user_id=user.id
+        )
+    if cohort:
+        return AnalyticsService.get_cohort_peer_averages(user, cohort)
+    return AnalyticsService.get_peer_averages(exclude_user_id=user.id)
+
+
+def _resolve_peer_averages(request):
+    """
+    Peer averages for the requesting user, scoped by the optional cohort/window params.
+    Returns (averages, error_response).
+    """
+    params, error = _peer_params(request)
+    if error:
+        return None, error
+    return _peer_averages_for(request.user, *params), None
+
+
+def _user_financial_data(user):
+    """AnalyticsService.get_user_financial_data, cached per user data version."""
+    return CacheService.get_or_compute(
+        "financial-data",
+        user,
+        lambda: AnalyticsService.get_user_financial_data(user),
+        peers=False,
+    )
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def peer_averages(request):
     """
     Get average spending across all users by category.
+    Optional query params:
+      - ?cohort=university|city|age_band (compare against a cohort)
+      - ?window=month|months|30d (&months=N) (average per-user totals over a time window)
     """
-    averages = AnalyticsService.get_peer_averages(exclude_user_id=request.user.id)
+    averages, error = _resolve_peer_averages(request)
+    if error:
+        return error
     return Response(averages)
 
 
@@ -309,10 +598,27 @@ def category_insights(request):
     """
     Get insights for each spending category.
     Returns detailed comparison with budget and peers.
+    Optional query param: ?cohort=university|city|age_band
     """
-    ensure_user_rows(request.user)
+    params, error = _peer_params(request)
+    if error:
+        return error
     
-    insights = AnalyticsService.get_category_insights(request.user)
+    def compute():
+        # Default comparison: use the nightly batch results while they are current
+        if not any(params):
+            precomputed = AnalyticsService.get_precomputed_category_insights(request.user)
+            if precomputed is not None:
+                return precomputed
+        ensure_user_rows(request.user)
+        # Without params get_category_insights compares with the same peers as the batch
+        peer_averages = _peer_averages_for(request.user, *params) if any(params) else None
+        return AnalyticsService.get_category_insights(request.user, peer_averages=peer_averages)
+    
+    # Cached per data version; the date keeps month-based fields exact across midnight
+    insights = CacheService.get_or_compute(
+        "insights", request.user, compute, *params, timezone.now().date()
+    )
     
     return Response({"insights": insights})
 
@@ -322,7 +628,7 @@ def category_insights(request):
 def category_insight_ai(request):
     """
     Get AI-generated insight for a specific category.
-    Query params: ?category=groceries
+    Query params: ?category=groceries (optional: &cohort=university|city|age_band)
     """
     ensure_user_rows(request.user)
     
@@ -330,15 +636,21 @@ def category_insight_ai(request):
     if not category:
         return Response({"error": "Category parameter required"}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get user data
-    user_spending = Spending.objects.filter(user=request.user, category=category).first()
+    params, error = _peer_params(request)
+    if error:
+        return error
+    
+    # Get user data: this month's total, as in insights/categories/
     user_budget = Budget.objects.filter(user=request.user, category=category).first()
     
-    spending_amount = float(user_spending.amount) if user_spending else 0
+    spending_amount = AnalyticsService.get_month_spending(request.user).get(category, 0)
     budget_amount = float(user_budget.amount) if user_budget else 0
     
     # Get peer average for this category
-    peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=request.user.id)
+    if any(params):
+        peer_averages = _peer_averages_for(request.user, *params)
+    else:
+        peer_averages = AnalyticsService.get_insight_peer_averages(exclude_user_id=request.user.id)
     peer_avg = peer_averages.get(category, 0)
     
     # Get user profile
@@ -376,7 +688,7 @@ def daily_insight(request):
     """
     ensure_user_rows(request.user)
     
-    user_data = AnalyticsService.get_user_financial_data(request.user)
+    user_data = _user_financial_data(request.user)
     peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=request.user.id)
     
     insight = LLMService.generate_one_line_insight(user_data, peer_averages)
@@ -388,9 +700,8 @@ def daily_insight(request):
 # BADGE ENDPOINTS
 # ─────────────────────────────────────────────────────────────────────────────
 
-from .models import Badge, UserBadge, Category
+from .models import Badge, BadgeRulePeriod, UserBadge, Category
 from django.utils import timezone
-from datetime import timedelta
 from django.db.models import Count
 
 
@@ -398,226 +709,9 @@ def calculate_badge_progress(user, badge):
     """
     Calculate the current progress for a user towards a specific badge.
     Returns (current_progress, is_earned).
+    To evaluate several badges, load the data once with BadgeService.evaluate_all.
     """
-    now = timezone.now().date()
-    badge_type = badge.badge_type
-    target = badge.target_value
-    
-    if badge_type == "budget_master":
-        # Stayed within grocery budget for a month (30 days)
-        # Count days where daily grocery spending <= daily budget allocation
-        budget = Budget.objects.filter(user=user, category="groceries").first()
-        if not budget or budget.amount == 0:
-            return 0, False
-        
-        # Count days in current month with groceries spending
-        start_of_month = now.replace(day=1)
-        days_in_budget = 0
-        
-        # Get all grocery spending this month grouped by day
-        daily_spending = (
-            Spending.objects.filter(user=user, category="groceries", date__gte=start_of_month)
-            .values('date')
-            .annotate(daily_total=Sum('amount'))
-        )
-        
-        daily_budget = float(budget.amount) / 30  # Approximate daily budget
-        
-        for day_data in daily_spending:
-            if day_data['daily_total'] <= Decimal(str(daily_budget * 1.1)):  # 10% tolerance
-                days_in_budget += 1
-        
-        # Also count days with no spending as "within budget"
-        days_with_spending = daily_spending.count()
-        days_elapsed = (now - start_of_month).days + 1
-        days_no_spending = days_elapsed - days_with_spending
-        days_in_budget += days_no_spending
-        
-        progress = min(days_in_budget, target)
-        return progress, progress >= target
-    
-    elif badge_type == "savings_champion":
-        # Spent less than peers for 12 months
-        peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=user.id)
-        total_peer_avg = sum(peer_averages.values())
-        
-        months_beating_peers = 0
-        
-        for i in range(12):
-            # Calculate spending for each of the last 12 months
-            month_start = (now.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-            if i == 0:
-                month_end = now
-            else:
-                month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            
-            user_spending = Spending.objects.filter(
-                user=user, 
-                date__gte=month_start, 
-                date__lte=month_end
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            if float(user_spending) < total_peer_avg:
-                months_beating_peers += 1
-        
-        return months_beating_peers, months_beating_peers >= target
-    
-    elif badge_type == "thrifty_shopper":
-        # Stayed within entertainment budget for a month
-        budget = Budget.objects.filter(user=user, category="entertainment").first()
-        if not budget or budget.amount == 0:
-            return 0, False
-        
-        start_of_month = now.replace(day=1)
-        daily_budget = float(budget.amount) / 30
-        
-        daily_spending = (
-            Spending.objects.filter(user=user, category="entertainment", date__gte=start_of_month)
-            .values('date')
-            .annotate(daily_total=Sum('amount'))
-        )
-        
-        days_in_budget = 0
-        for day_data in daily_spending:
-            if day_data['daily_total'] <= Decimal(str(daily_budget * 1.1)):
-                days_in_budget += 1
-        
-        days_with_spending = daily_spending.count()
-        days_elapsed = (now - start_of_month).days + 1
-        days_in_budget += (days_elapsed - days_with_spending)
-        
-        progress = min(days_in_budget, target)
-        return progress, progress >= target
-    
-    elif badge_type == "goal_crusher":
-        # Met monthly savings goal (based on savings category)
-        budget = Budget.objects.filter(user=user, category="savings").first()
-        if not budget or budget.amount == 0:
-            return 0, False
-        
-        start_of_month = now.replace(day=1)
-        
-        # Calculate total spending this month
-        total_spending = Spending.objects.filter(
-            user=user, date__gte=start_of_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Get total budget
-        total_budget = Budget.objects.filter(user=user).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Savings = budget - spending
-        actual_savings = float(total_budget) - float(total_spending)
-        savings_goal = float(budget.amount)
-        
-        progress = int((actual_savings / savings_goal) * target) if savings_goal > 0 else 0
-        progress = max(0, min(progress, target))
-        
-        return progress, actual_savings >= savings_goal
-    
-    elif badge_type == "spending_slayer":
-        # Reduced spending by 20% compared to last month
-        start_of_month = now.replace(day=1)
-        last_month_start = (start_of_month - timedelta(days=1)).replace(day=1)
-        last_month_end = start_of_month - timedelta(days=1)
-        
-        this_month_spending = Spending.objects.filter(
-            user=user, date__gte=start_of_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        last_month_spending = Spending.objects.filter(
-            user=user, date__gte=last_month_start, date__lte=last_month_end
-        ).aggregate(total=Sum('amount'))['total'] or 1  # Avoid division by zero
-        
-        if float(last_month_spending) == 0:
-            return 0, False
-        
-        reduction_pct = (1 - float(this_month_spending) / float(last_month_spending)) * 100
-        progress = int(reduction_pct / 20 * target)  # Scale to target
-        progress = max(0, min(progress, target))
-        
-        return progress, reduction_pct >= 20
-    
-    elif badge_type == "elite_saver":
-        # Beat peer average 6 months in a row
-        peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=user.id)
-        total_peer_avg = sum(peer_averages.values())
-        
-        consecutive_months = 0
-        
-        for i in range(6):
-            month_start = (now.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-            if i == 0:
-                month_end = now
-            else:
-                month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            
-            user_spending = Spending.objects.filter(
-                user=user, date__gte=month_start, date__lte=month_end
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            if float(user_spending) < total_peer_avg:
-                consecutive_months += 1
-            else:
-                break  # Must be consecutive
-        
-        return consecutive_months, consecutive_months >= target
-    
-    elif badge_type == "social_saver":
-        # Stayed within entertainment budget for a month
-        budget = Budget.objects.filter(user=user, category="entertainment").first()
-        if not budget or budget.amount == 0:
-            return 0, False
-        
-        start_of_month = now.replace(day=1)
-        
-        total_entertainment = Spending.objects.filter(
-            user=user, category="entertainment", date__gte=start_of_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        days_elapsed = (now - start_of_month).days + 1
-        
-        if float(total_entertainment) <= float(budget.amount):
-            progress = days_elapsed
-        else:
-            # Calculate what percentage of budget used
-            pct_used = float(total_entertainment) / float(budget.amount)
-            progress = int(days_elapsed / pct_used)
-        
-        progress = min(progress, target)
-        return progress, progress >= target and float(total_entertainment) <= float(budget.amount)
-    
-    elif badge_type == "year_legend":
-        # Stayed within total budget for 365 days
-        start_date = now - timedelta(days=365)
-        
-        days_in_budget = 0
-        total_budget = Budget.objects.filter(user=user).aggregate(total=Sum('amount'))['total'] or 0
-        
-        if total_budget == 0:
-            return 0, False
-        
-        daily_budget = float(total_budget) / 30  # Monthly budget / 30 for daily
-        
-        # Group spending by date
-        daily_totals = (
-            Spending.objects.filter(user=user, date__gte=start_date)
-            .values('date')
-            .annotate(daily_total=Sum('amount'))
-        )
-        
-        for day_data in daily_totals:
-            if day_data['daily_total'] <= Decimal(str(daily_budget * 1.2)):  # 20% tolerance
-                days_in_budget += 1
-        
-        # Days with no spending count as in budget
-        days_with_spending = daily_totals.count()
-        days_elapsed = min(365, (now - start_date).days + 1)
-        days_in_budget += (days_elapsed - days_with_spending)
-        
-        progress = min(days_in_budget, target)
-        return progress, progress >= target
-    
-    return 0, False
+    return BadgeService.evaluate(badge, BadgeService.load(user))
 
 
 @api_view(["GET"])
@@ -625,30 +719,20 @@ def calculate_badge_progress(user, badge):
 def badges_list(request):
     """
     Get all badges with user's progress for each.
+    Read-only: spending and budget writes re-evaluate the badges they can affect
+    when they commit (BadgeService.record_change), and the nightly recompute_badges
+    run moves day counts and peer comparisons along with the calendar.
     """
-    badges = Badge.objects.all()
+    badges = list(Badge.objects.all())
+    user_badges = {user_badge.badge_id: user_badge for user_badge in UserBadge.objects.filter(user=request.user)}
     
     result = []
     earned_count = 0
     
     for badge in badges:
-        # Get or create user badge record
-        user_badge, created = UserBadge.objects.get_or_create(
-            user=request.user,
-            badge=badge,
-            defaults={'progress': 0, 'earned': False}
-        )
-        
-        # Calculate current progress
-        progress, is_earned = calculate_badge_progress(request.user, badge)
-        
-        # Update if progress changed or newly earned
-        if user_badge.progress != progress or (is_earned and not user_badge.earned):
-            user_badge.progress = progress
-            if is_earned and not user_badge.earned:
-                user_badge.earned = True
-                user_badge.earned_at = timezone.now()
-            user_badge.save()
+        # Not evaluated yet (a badge added since the last recompute_badges run)
+        user_badge = user_badges.get(badge.id) or UserBadge(badge=badge, progress=0)
+        progress = user_badge.progress
         
         if user_badge.earned:
             earned_count += 1
@@ -659,7 +743,7 @@ def badges_list(request):
         # Format requirement string
         if badge.badge_type in ["goal_crusher"]:
             requirement = f"${progress}/${badge.target_value}"
-        elif badge.badge_type in ["savings_champion", "elite_saver"]:
+        elif badge.rule_period == BadgeRulePeriod.MONTH:
             requirement = f"{progress}/{badge.target_value} months"
         else:
             requirement = f"{progress}/{badge.target_value} days"
@@ -727,7 +811,7 @@ def chat_message(request, thread_id: int):
     history_qs = t.messages.all().order_by("-created_at")[:10]
     conversation_history = [{"role": m.role, "content": m.content} for m in reversed(history_qs)]
 
-    user_data = AnalyticsService.get_user_financial_data(request.user)
+    user_data = _user_financial_data(request.user)
     peer_averages = AnalyticsService.get_peer_averages(exclude_user_id=request.user.id)
 
     # -------- NEW: Real places context (restaurants/shops) --------
@@ -799,7 +883,7 @@ def recommend_places(request):
     ensure_user_rows(request.user)
     category = request.GET.get("category", "restaurants")  # restaurants | groceries | etc
 
-    user_data = AnalyticsService.get_user_financial_data(request.user)
+    user_data = _user_financial_data(request.user)
 
     # TODO: call Google Places / Foursquare here using user city (or lat/lng if you have it)
     places = []  # list of dicts from the API
@@ -961,7 +1045,7 @@ def generate_backfill(request):
                 cat_raw = t.get('category', 'unknown')
                 amt_raw = t.get('amount', 0)
                 date_raw = t.get('date', today)
-                merchant_raw = t.get('merchant', 'Unknown') # Not saved to DB, but good for logs
+                merchant_raw = t.get('merchant', 'Unknown')
                 
                 log(f"   [{i}] Processing: {merchant_raw} | {cat_raw} | {amt_raw}")
 
@@ -980,18 +1064,12 @@ def generate_backfill(request):
                 except ValueError:
                     log(f"      ⚠️ Date format error for '{date_raw}'. Using today.")
                     date_obj = timezone.now().date()
+                date_error = spending_date_error(date_obj)
+                if date_error:
+                    raise ValueError(f"{date_error}: {date_obj}")
 
                 # DB Operation: Update existing day or create new
-                obj, created = Spending.objects.get_or_create(
-                    user=request.user,
-                    category=cat,
-                    date=date_obj,
-                    defaults={'amount': 0}
-                )
-                
-                old_amount = obj.amount
-                obj.amount += amount
-                obj.save()
+                obj = add_spending(request.user, cat, date_obj, amount, TransactionSource.BACKFILL, str(merchant_raw)[:255])
                 
                 log(f"      ✅ Saved! New Total: {obj.amount}")
                 saved_count += 1